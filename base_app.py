@@ -47,6 +47,7 @@ except Exception as err:
 #from matplotlib.figure import Figure
 
 from .logged_quantity import LoggedQuantity, LQCollection
+from .polling import PollingScheduler
 
 from .helper_funcs import confirm_on_close, ignore_on_close, load_qt_ui_file, \
     OrderedAttrDict, sibling_path, get_logger_from_class, str2bool
@@ -212,6 +213,10 @@ class BaseMicroscopeApp(BaseApp):
         
         self.hardware = OrderedAttrDict()
         self.measurements = OrderedAttrDict()
+        
+        # periodic reads of hardware settings, 
+        # register with self.polling.register(hw, lq_name, interval)
+        self.polling = PollingScheduler()
 
         self.quickbar = None
                    
@@ -344,6 +349,7 @@ class BaseMicroscopeApp(BaseApp):
         
     def on_close(self):
         self.log.info("on_close")
+        self.polling.stop()
         # disconnect all hardware objects
         for hw in self.hardware.values():
             self.log.info("disconnecting {}".format( hw.name))
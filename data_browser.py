@@ -1,13 +1,18 @@
 from __future__ import division, print_function, absolute_import
 from ScopeFoundry import BaseApp
-from ScopeFoundry.helper_funcs import load_qt_ui_file, sibling_path
+from ScopeFoundry.helper_funcs import load_qt_ui_file, sibling_path, get_logger_from_class
 from collections import OrderedDict
 import os
-from qtpy import QtCore, QtWidgets
+import threading
+from qtpy import QtCore, QtWidgets, QtGui
 import pyqtgraph as pg
 import pyqtgraph.dockarea as dockarea
 import numpy as np
 from ScopeFoundry.logged_quantity import LQCollection
+from ScopeFoundry.h5_io import H5LazyArray
+from ScopeFoundry.data_index import DirectoryMetadataIndex, H5SummaryIndex
+from ScopeFoundry import profiling
+import zlib
 
 
 
@@ -15,6 +20,11 @@ class DataBrowser(BaseApp):
     
     name = "DataBrowser"
     
+    # search_finished(paths, err) is emitted in the GUI thread when
+    # a search_files search finishes
+    search_finished = QtCore.Signal(object, object)
+    _search_done = QtCore.Signal(object, object, object)
+    
     def __init__(self, argv):
         BaseApp.__init__(self, argv)
         self.setup()
@@ -35,9 +45,38 @@ class DataBrowser(BaseApp):
         self.settings.data_filename.add_listener(self.on_change_data_filename)
 
         self.settings.New('auto_select_view',dtype=bool, initial=True)
+        
+        # sniffed file metadata (type, measurements, dataset shapes) 
+        # of browsed directories, used by auto_select_view
+        self.settings.New('use_file_index', dtype=bool, initial=True)
+        self.file_index = DirectoryMetadataIndex()
+        
+        # sqlite sidecar with settings and previews of the h5 files 
+        # in browse_dir, see search_files
+        self.settings.New('summary_index', dtype=bool, initial=False)
+        self.summary_index = None
+        self._search_done.connect(self.on_search_done)
+        self.file_index.directory_indexed.connect(self.on_directory_indexed)
 
         self.settings.New('view_name', dtype=str, initial='0', choices=('0',))
         
+        # load files in a worker thread (for views that support it)
+        # and read neighbouring files ahead of time
+        self.settings.New('background_load', dtype=bool, initial=True)
+        self.settings.New('prefetch_neighbors', dtype=bool, initial=True)
+        self.settings.New('prefetch_max_MB', dtype=float, initial=256., vmin=0)
+        self.loader = DataLoader()
+        self.loader.load_finished.connect(self.on_load_finished)
+        
+        # cache of loaded data, shared by views with data_attrs
+        self.settings.New('cache_budget_MB', dtype=float, initial=1024., vmin=0)
+        self.settings.New('cache_MB', dtype=float, ro=True)
+        self.settings.New('cache_hits', dtype=int, ro=True)
+        self.settings.New('cache_misses', dtype=int, ro=True)
+        self.data_cache = DataCache(in_use=self.data_in_use)
+        self.settings.cache_budget_MB.add_listener(self.on_change_cache_budget)
+        self.on_change_cache_budget()
+        
         
         # UI Connections
         self.settings.data_filename.connect_to_browse_widgets(self.ui.data_filename_lineEdit, 
@@ -62,11 +101,14 @@ class DataBrowser(BaseApp):
 
         self.settings.browse_dir.add_listener(self.on_change_browse_dir)
         self.settings['browse_dir'] = os.getcwd()
+        self.settings.summary_index.add_listener(self.update_summary_index)
 
         # set views
         
         self.load_view(FileInfoView(self))
         self.load_view(NPZView(self))
+        self.load_view(ProfileView(self))
+        self.load_view(SummarySearchView(self))
 
         self.settings.view_name.add_listener(self.on_change_view_name)
         self.settings['view_name'] = "file_info"
@@ -86,6 +128,8 @@ class DataBrowser(BaseApp):
         self.log.debug('load_view called {}'.format(new_view))
         # add to views dict
         self.views[new_view.name] = new_view
+        # view selection may change with the new view
+        self.file_index.clear_key('view_name')
         
         self.ui.dataview_groupBox.layout().addWidget(new_view.ui)
         new_view.ui.hide()
@@ -98,7 +142,7 @@ class DataBrowser(BaseApp):
     def on_change_data_filename(self):
         fname = self.settings.data_filename.val 
         if not self.settings['auto_select_view']:
-            self.current_view.on_change_data_filename(fname)
+            self.load_in_current_view(fname)
         else:
             view_name = self.auto_select_view(fname)
             if self.current_view is None or view_name != self.current_view.name:
@@ -107,12 +151,175 @@ class DataBrowser(BaseApp):
             else:
                 # force update
                 if  os.path.isfile(fname):
-                    self.current_view.on_change_data_filename(fname)
+                    self.load_in_current_view(fname)
+
+    def load_in_current_view(self, fname):
+        """
+        Load fname in the current view. Views with background_load
+        load in the DataLoader worker thread, a newer request cancels 
+        the running load. Others load synchronously.
+        """
+        view = self.current_view
+        if self.load_from_cache(view, fname):
+            return
+        if view.background_load and self.settings['background_load']:
+            view.is_loading = True
+            self.ui.statusbar.showMessage("loading {}".format(fname))
+            self.loader.request(view, fname)
+        else:
+            # discard results of any running background load
+            self.loader.cancel()
+            try:
+                view.on_change_data_filename(fname)
+                self.add_to_cache(view, fname)
+            finally:
+                self.prefetch_neighbors()
+    
+    def on_load_finished(self, generation, view, fname, err):
+        if not self.loader.is_current(generation):
+            # a newer load has been requested
+            return
+        view.is_loading = False
+        if err is None:
+            self.add_to_cache(view, fname)
+        try:
+            view.on_load_finished(fname, err)
+        finally:
+            self.prefetch_neighbors()
+        if err is not None:
+            self.log.error("failed to load {}: {!r}".format(fname, err))
+    
+    def cache_key(self, view, fname):
+        try:
+            return (os.path.abspath(fname), os.path.getmtime(fname), view.name)
+        except OSError:
+            return None
+    
+    def load_from_cache(self, view, fname):
+        """
+        If the data of fname for view is in the cache, restore it 
+        in the view, display it and return True
+        """
+        if not view.data_attrs or not self.data_cache.max_bytes:
+            return False
+        state = self.data_cache.get(self.cache_key(view, fname))
+        self.update_cache_settings()
+        if state is None:
+            return False
+        if view.background_load and self.settings['background_load']:
+            # restore in the loader thread, after any running load of this view
+            view.is_loading = True
+            self.loader.request(view, fname, state=state)
+        else:
+            self.loader.cancel()
+            view.set_data_state(state)
+            view.on_load_finished(fname, None)
+            self.prefetch_neighbors()
+        return True
+    
+    def add_to_cache(self, view, fname):
+        key = self.cache_key(view, fname)
+        if not view.data_attrs or not self.data_cache.max_bytes or key is None:
+            return
+        self.data_cache.put(key, view.get_data_state())
+        self.update_cache_settings()
+    
+    def data_in_use(self, obj):
+        "True if obj is part of the current data of any view"
+        for view in self.views.values():
+            for attr in view.data_attrs:
+                if getattr(view, attr, None) is obj:
+                    return True
+        return False
+    
+    def on_change_cache_budget(self):
+        self.data_cache.resize(int(self.settings['cache_budget_MB']*1e6))
+        self.update_cache_settings()
+    
+    def update_cache_settings(self):
+        c = self.data_cache
+        self.settings['cache_MB'] = c.total_bytes/1e6
+        self.settings['cache_hits'] = c.hits
+        self.settings['cache_misses'] = c.misses
+    
+    def prefetch_neighbors(self):
+        """
+        Read the files before and after the selected file in the
+        tree view, so that browsing with arrow keys hits the OS file cache
+        """
+        if not self.settings['prefetch_neighbors']:
+            return
+        index = self.tree_selectionModel.currentIndex()
+        if not index.isValid():
+            return
+        fnames = []
+        for row in (index.row()+1, index.row()-1):
+            neighbor = index.sibling(row, 0)
+            if neighbor.isValid():
+                path = self.fs_model.filePath(neighbor)
+                if os.path.isfile(path):
+                    fnames.append(path)
+        self.loader.prefetch(fnames, max_bytes=int(self.settings['prefetch_max_MB']*1e6))
 
     @QtCore.Slot()
     def on_change_browse_dir(self):
         self.log.debug("on_change_browse_dir")
         self.ui.treeView.setRootIndex(self.fs_model.index(self.settings['browse_dir']))
+        if self.settings['use_file_index']:
+            self.file_index.index_directory(self.settings['browse_dir'])
+        self.update_summary_index()
+    
+    def update_summary_index(self):
+        "(re)index browse_dir in the summary index in the background"
+        if not self.settings['summary_index']:
+            return
+        browse_dir = os.path.abspath(self.settings['browse_dir'])
+        try:
+            if self.summary_index is None or self.summary_index.directory != browse_dir:
+                self.summary_index = H5SummaryIndex(browse_dir)
+            self.summary_index.update_in_background()
+        except Exception as err:
+            # e.g. read-only directory
+            self.log.warning("summary index of {} failed: {}".format(browse_dir, err))
+    
+    def on_directory_indexed(self, path):
+        if os.path.abspath(path) == os.path.abspath(self.settings['browse_dir']):
+            self.update_summary_index()
+    
+    def search_files(self, callback=None, **kwargs):
+        """
+        search the h5 files in browse_dir by sample, measurement, date or 
+        setting values, see H5SummaryIndex.search. Requires the 
+        summary_index setting (which keeps a sqlite file in browse_dir).
+        
+        The search runs in a worker thread, after any running (re)index 
+        of browse_dir. The matching paths are passed to *callback* (if 
+        given) and search_finished(paths, err) is emitted, both in the 
+        GUI thread.
+        """
+        if not self.settings['summary_index'] or self.summary_index is None:
+            raise RuntimeError("search_files requires the summary_index setting")
+        index = self.summary_index
+        def run():
+            paths, err = None, None
+            try:
+                thread = index.thread
+                if thread is not None:
+                    thread.join()
+                paths = index.search(**kwargs)
+            except Exception as e:
+                err = e
+            self._search_done.emit(paths, err, callback)
+        thread = threading.Thread(target=run, name='search_files')
+        thread.daemon = True
+        thread.start()
+    
+    def on_search_done(self, paths, err, callback):
+        if err is not None:
+            self.log.warning("search_files failed: {}".format(err))
+        elif callback is not None:
+            callback(paths)
+        self.search_finished.emit(paths, err)
     
     def on_change_file_filter(self):
         self.log.debug("on_change_file_filter")
@@ -143,7 +350,7 @@ class DataBrowser(BaseApp):
         # set datafile for new (current) view
         fname = self.settings['data_filename']
         if  os.path.isfile(fname):
-            self.current_view.on_change_data_filename(self.settings['data_filename'])
+            self.load_in_current_view(fname)
 
     def on_treeview_selection_change(self, sel, desel):
         fname = self.fs_model.filePath(self.tree_selectionModel.currentIndex())
@@ -151,20 +358,248 @@ class DataBrowser(BaseApp):
 #        print( 'on_treeview_selection_change' , fname, sel, desel)
 
     def auto_select_view(self, fname):
-        "return the name of the last supported view for the given fname"
+        """
+        return the name of the last supported view for the given fname.
+        With use_file_index, views decide from the file's indexed metadata
+        where they can, and the selection is stored in the index
+        """
+        meta = None
+        if self.settings['use_file_index']:
+            meta = self.file_index.get(fname)
+        if meta is not None and meta.get('view_name') in self.views:
+            return meta['view_name']
+        selected = 'file_info' # default if no others work
         for view_name, view in list(self.views.items())[::-1]:
-            if view.is_file_supported(fname):
-                return view_name
-        # return default file_info view if no others work
-        return 'file_info'
+            supported = None
+            if meta is not None:
+                supported = view.is_file_metadata_supported(meta)
+            if supported is None:
+                supported = view.is_file_supported(fname)
+            if supported:
+                selected = view_name
+                break
+        if meta is not None:
+            meta['view_name'] = selected
+        return selected
         
 
+def data_nbytes(obj):
+    "in-memory size of a cached data object, 0 for file-backed data"
+    if isinstance(obj, np.memmap):
+        return 0
+    if isinstance(obj, np.ndarray):
+        return obj.nbytes
+    if isinstance(obj, (list, tuple)):
+        return sum(data_nbytes(x) for x in obj)
+    if isinstance(obj, dict):
+        return sum(data_nbytes(x) for x in obj.values())
+    return getattr(obj, 'nbytes', 0)
+
+
+class DataCache(object):
+    """
+    Least-recently-used cache of loaded view data, at most *max_bytes* 
+    (see :func:`data_nbytes`). Entries are dicts of attributes,
+    see DataBrowserView.data_attrs.
+    
+    Evicted entries are released: their objects with a close method 
+    (e.g. h5py files) are closed, unless in_use(obj) is True.
+    
+    All methods are thread safe (the GUI thread and the DataLoader 
+    thread use the cache), the lock is reentrant so in_use may call 
+    back into the cache.
+    """
+    
+    def __init__(self, max_bytes=0, in_use=None):
+        self.max_bytes = max_bytes
+        self.in_use = in_use
+        self.lock = threading.RLock()
+        self.entries = OrderedDict()
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+    
+    def get(self, key):
+        with self.lock:
+            if key in self.entries:
+                self.hits += 1
+                state, nbytes = self.entries.pop(key)
+                self.entries[key] = (state, nbytes) # most recently used
+                return state
+            self.misses += 1
+            return None
+    
+    def put(self, key, state):
+        nbytes = data_nbytes(state)
+        with self.lock:
+            if key in self.entries:
+                self._remove(key, release=False)
+            if nbytes > self.max_bytes:
+                return
+            self.entries[key] = (state, nbytes)
+            self.total_bytes += nbytes
+            self.resize(self.max_bytes)
+    
+    def holds(self, obj):
+        "True if obj is part of a cached entry"
+        with self.lock:
+            return any(obj is x for state, n in self.entries.values() for x in state.values())
+    
+    def resize(self, max_bytes):
+        "set max_bytes, evict least recently used entries to fit"
+        with self.lock:
+            self.max_bytes = max_bytes
+            while self.entries and self.total_bytes > self.max_bytes:
+                self._remove(next(iter(self.entries)))
+    
+    def clear(self):
+        with self.lock:
+            for key in list(self.entries.keys()):
+                self._remove(key)
+    
+    def _remove(self, key, release=True):
+        with self.lock:
+            state, nbytes = self.entries.pop(key)
+            self.total_bytes -= nbytes
+            if release:
+                for obj in state.values():
+                    if hasattr(obj, 'close') and not (self.in_use and self.in_use(obj)):
+                        obj.close()
+                state.clear()
+
+
+class LoadCancelled(Exception):
+    "Raised by DataBrowserView.check_load_cancelled in a stale background load"
+    pass
+
+
+class DataLoader(QtCore.QObject):
+    """
+    Worker thread for DataBrowser file loading.
+    
+    :meth:`request` queues view.load_file(fname), replacing any queued 
+    request. A running load is cancelled at its next 
+    DataBrowserView.check_load_cancelled call, otherwise its result is 
+    ignored. load_finished(generation, view, fname, error) is emitted 
+    after each load that was not cancelled, and is received in 
+    the GUI thread.
+    
+    When idle, the worker reads files queued with :meth:`prefetch`.
+    """
+    
+    load_finished = QtCore.Signal(int, object, object, object)
+    
+    prefetch_block_bytes = 1024**2
+    
+    def __init__(self):
+        QtCore.QObject.__init__(self)
+        self.log = get_logger_from_class(self)
+        self.cond = threading.Condition()
+        self.generation = 0
+        self.pending = None
+        self.prefetch_queue = []
+        self.prefetch_max_bytes = 0
+        self._current_generation = None
+        self.thread = threading.Thread(target=self._run, name='DataLoader')
+        self.thread.daemon = True
+        self.thread.start()
+    
+    def request(self, view, fname, state=None):
+        """
+        queue view.load_file(fname), or view.set_data_state(state) if 
+        state is given, returns its generation number
+        """
+        with self.cond:
+            self.generation += 1
+            self.pending = (self.generation, view, fname, state)
+            self.prefetch_queue = []
+            self.cond.notify()
+            return self.generation
+    
+    def cancel(self):
+        "cancel queued and running loads"
+        with self.cond:
+            self.generation += 1
+            self.pending = None
+    
+    def prefetch(self, fnames, max_bytes):
+        "read up to max_bytes of each of fnames when idle"
+        with self.cond:
+            self.prefetch_queue = list(fnames)
+            self.prefetch_max_bytes = max_bytes
+            self.cond.notify()
+    
+    def is_current(self, generation):
+        return generation == self.generation
+    
+    def check_cancelled(self):
+        "raises LoadCancelled if called from a stale load in the worker thread"
+        if (threading.current_thread() is self.thread 
+                and self._current_generation != self.generation):
+            raise LoadCancelled()
+    
+    def _run(self):
+        while True:
+            with self.cond:
+                while self.pending is None and not self.prefetch_queue:
+                    self.cond.wait()
+                job = self.pending
+                self.pending = None
+                if job is None:
+                    prefetch_fname = self.prefetch_queue.pop(0)
+            if job is None:
+                self._prefetch_file(prefetch_fname)
+                continue
+            generation, view, fname, state = job
+            self._current_generation = generation
+            err = None
+            try:
+                if state is not None:
+                    view.set_data_state(state)
+                else:
+                    view.load_file(fname)
+            except LoadCancelled:
+                self.log.debug("load cancelled {}".format(fname))
+                continue
+            except Exception as e:
+                err = e
+            self.load_finished.emit(generation, view, fname, err)
+    
+    def _prefetch_file(self, fname):
+        # read the file once, so that it is in the OS file cache
+        n_bytes = 0
+        try:
+            with open(fname, 'rb') as f:
+                while n_bytes < self.prefetch_max_bytes and self.pending is None:
+                    block = f.read(self.prefetch_block_bytes)
+                    if not block:
+                        break
+                    n_bytes += len(block)
+        except (IOError, OSError) as err:
+            self.log.debug("prefetch {} failed: {}".format(fname, err))
+
+
 class DataBrowserView(QtCore.QObject):
     """ Abstract class for DataBrowser Views"""
     
+    # set True in views that implement load_file and on_load_finished,
+    # to load files in a background thread
+    background_load = False
+    
+    # names of attributes that hold the data of a loaded file,
+    # views that define them (and on_load_finished) share 
+    # the DataBrowser's data cache
+    data_attrs = ()
+    
+    # names of the measurements (h5 groups measurement/<name>) in the
+    # ScopeFoundry h5 files the view supports. Views that set them are
+    # selected from the file index without opening the file
+    supported_measurements = ()
+    
     def __init__(self, databrowser):
         QtCore.QObject.__init__(self)
         self.databrowser =  databrowser
+        self.is_loading = False
         self.settings = LQCollection()
         self.setup()
         
@@ -181,7 +616,56 @@ class DataBrowserView(QtCore.QObject):
     def is_file_supported(self, fname):
         # returns whether view can handle file, should return False early to avoid
         # too much computation when selecting a file
-        return False
+        if not self.supported_measurements or os.path.splitext(fname)[1].lower() != '.h5':
+            return False
+        import h5py
+        try:
+            with h5py.File(fname, 'r') as h5:
+                return any('measurement/' + m in h5 for m in self.supported_measurements)
+        except (IOError, OSError):
+            return False
+    
+    def is_file_metadata_supported(self, meta):
+        """
+        Like is_file_supported, from the file's metadata dict in the 
+        DataBrowser's file index (see data_index.sniff_file_metadata), 
+        e.g. meta['measurements'] or meta['datasets']. 
+        Return None to fall back to is_file_supported.
+        By default, decides from supported_measurements if set.
+        """
+        if not self.supported_measurements or 'error' in meta:
+            return None
+        return meta['type'] == 'h5' and any(m in meta['measurements'] 
+                                            for m in self.supported_measurements)
+    
+    def load_file(self, fname):
+        """
+        Load fname without touching the GUI. Used instead of 
+        on_change_data_filename if background_load is True, runs in 
+        the DataBrowser's loader thread. While it runs self.is_loading 
+        is True, the GUI must not use data set by load_file.
+        Long loads should call :meth:`check_load_cancelled` regularly.
+        """
+        raise NotImplementedError()
+    
+    def on_load_finished(self, fname, err=None):
+        """
+        Called in the GUI thread after load_file finished, 
+        *err* is the exception raised by load_file or None. 
+        Update the display here.
+        """
+        pass
+    
+    def check_load_cancelled(self):
+        "raise LoadCancelled if a newer file has been selected"
+        self.databrowser.loader.check_cancelled()
+    
+    def get_data_state(self):
+        return dict((attr, getattr(self, attr, None)) for attr in self.data_attrs)
+    
+    def set_data_state(self, state):
+        for attr, val in state.items():
+            setattr(self, attr, val)
         
 class FileInfoView(DataBrowserView):
     
@@ -204,12 +688,19 @@ class FileInfoView(DataBrowserView):
         
     def is_file_supported(self, fname):
         return True
+    
+    def is_file_metadata_supported(self, meta):
+        return True
 
 
 class NPZView(DataBrowserView):
     
     name = 'npz_view'
     
+    background_load = True
+    
+    data_attrs = ('dat', 'display_txt')
+    
     def setup(self):
         
         #self.ui = QtGui.QScrollArea()
@@ -221,36 +712,353 @@ class NPZView(DataBrowserView):
         #self.ui.setWidget(self.display_label)
         
     def on_change_data_filename(self, fname=None):
+        try:
+            self.load_file(fname)
+        except Exception as err:
+            self.on_load_finished(fname, err)
+            raise(err)
+        self.on_load_finished(fname)
+    
+    def load_file(self, fname):
         import numpy as np
         
-        try:
-            self.dat = np.load(fname)
-            
-            self.display_txt = "File: {}\n".format(fname)
-            
-            sorted_keys = sorted(self.dat.keys())
-            
-            for key in sorted_keys:
-                val = self.dat[key]
-                if val.shape == ():
-                    self.display_txt += "    --> {}: {}\n".format(key, val)                    
-                else:
-                    self.display_txt += "    --D {}: Array of {} {}\n".format(key, val.dtype, val.shape)
-            
+        self.dat = dict(np.load(fname))
+        
+        self.display_txt = "File: {}\n".format(fname)
+        
+        sorted_keys = sorted(self.dat.keys())
+        
+        for key in sorted_keys:
+            val = self.dat[key]
+            if val.shape == ():
+                self.display_txt += "    --> {}: {}\n".format(key, val)                    
+            else:
+                self.display_txt += "    --D {}: Array of {} {}\n".format(key, val.dtype, val.shape)
+    
+    def on_load_finished(self, fname, err=None):
+        if err is None:
             #self.display_label.setText(self.display_txt)
             self.display_textEdit.setText(self.display_txt)
-        except Exception as err:
+        else:
             self.display_textEdit.setText("failed to load %s:\n%s" %(fname, err))
-            raise(err)
         
     def is_file_supported(self, fname):
         return os.path.splitext(fname)[1] == ".npz"
+    
+    def is_file_metadata_supported(self, meta):
+        return meta['ext'] == ".npz"
+
+
+class ProfileView(DataBrowserView):
+    """
+    Profiles saved by Measurement's profile and profile_sampling settings 
+    (.pstats and collapsed stack files, see ScopeFoundry.profiling): 
+    icicle graph of the call stacks and table of functions by self time.
+    
+    "Set Reference" keeps the current profile, the table of other 
+    profiles then shows the change of each function's share of the 
+    total time relative to the reference.
+    """
+    
+    name = 'profile_view'
+    
+    background_load = True
+    
+    data_attrs = ('stacks', 'func_times', 'rects', 'total')
+    
+    profile_exts = ('.pstats', '.prof', '.collapsed')
+    
+    def setup(self):
+        self.settings.New('max_rows', dtype=int, initial=100, vmin=1)
+        self.settings.New('min_width', dtype=float, initial=0.1, vmin=0, unit='%')
+        
+        self.ui = QtWidgets.QWidget()
+        layout = QtWidgets.QVBoxLayout(self.ui)
+        buttons = QtWidgets.QHBoxLayout()
+        layout.addLayout(buttons)
+        self.info_label = QtWidgets.QLabel()
+        buttons.addWidget(self.info_label, stretch=1)
+        self.set_ref_pushButton = QtWidgets.QPushButton("Set Reference")
+        self.set_ref_pushButton.clicked.connect(self.set_reference)
+        buttons.addWidget(self.set_ref_pushButton)
+        self.clear_ref_pushButton = QtWidgets.QPushButton("Clear Reference")
+        self.clear_ref_pushButton.clicked.connect(self.clear_reference)
+        buttons.addWidget(self.clear_ref_pushButton)
+        
+        splitter = QtWidgets.QSplitter(QtCore.Qt.Vertical)
+        layout.addWidget(splitter)
+        self.plot = pg.PlotWidget()
+        self.plot.invertY(True)
+        self.plot.hideAxis('left')
+        self.plot.setLabel('bottom', 'fraction of total time')
+        splitter.addWidget(self.plot)
+        self.table = QtWidgets.QTableWidget()
+        self.table.setSortingEnabled(True)
+        splitter.addWidget(self.table)
+        self.hover_label = QtWidgets.QLabel()
+        layout.addWidget(self.hover_label)
+        self.plot.scene().sigMouseMoved.connect(self.on_mouse_moved)
+        
+        self.ref_fname = None
+        self.ref_func_times = None
+        self.ref_total = 0
+        self.fname = None
+        self.stacks = None
+        self.func_times = None
+        self.rects = []
+        self.total = 0
+        # data of the last load (or cache restore), which may run in the
+        # loader thread, displayed by on_load_finished in the GUI thread
+        self.loaded_state = None
+    
+    def is_file_supported(self, fname):
+        return os.path.splitext(fname)[1] in self.profile_exts
+    
+    def is_file_metadata_supported(self, meta):
+        return meta['ext'] in self.profile_exts
+    
+    def on_change_data_filename(self, fname):
+        err = None
+        try:
+            self.load_file(fname)
+        except Exception as e:
+            err = e
+            raise
+        finally:
+            self.on_load_finished(fname, err)
+    
+    def load_file(self, fname):
+        stacks = profiling.load_profile(fname)
+        self.loaded_state = dict(
+            stacks=stacks,
+            total=sum(stacks.values()),
+            func_times=profiling.function_times(stacks),
+            rects=profiling.icicle_rects(stacks, 
+                                         min_fraction=self.settings['min_width']/100.))
+    
+    def get_data_state(self):
+        if self.loaded_state is not None:
+            return self.loaded_state
+        return DataBrowserView.get_data_state(self)
+    
+    def set_data_state(self, state):
+        self.loaded_state = state
+    
+    def on_load_finished(self, fname, err=None):
+        self.fname = fname
+        state, self.loaded_state = self.loaded_state, None
+        if err is not None:
+            self.stacks, self.func_times, self.rects, self.total = None, None, [], 0
+            self.info_label.setText("failed to load %s:\n%s" %(fname, err))
+        elif state is not None:
+            DataBrowserView.set_data_state(self, state)
+        self.update_display()
+    
+    def set_reference(self):
+        if self.func_times is not None:
+            self.ref_fname = self.fname
+            self.ref_func_times = self.func_times
+            self.ref_total = self.total
+            self.update_display()
+    
+    def clear_reference(self):
+        self.ref_fname = None
+        self.ref_func_times = None
+        self.update_display()
+    
+    def update_display(self):
+        self.plot.clear()
+        self.table.clear()
+        self.table.setRowCount(0)
+        if self.func_times is None:
+            return
+        total = self.total or 1.0
+        info = "{}: {:.3g} s".format(os.path.basename(self.fname), 1e-6*self.total)
+        if self.ref_func_times is not None:
+            info += ", reference {}: {:.3g} s".format(os.path.basename(self.ref_fname), 
+                                                       1e-6*self.ref_total)
+        self.info_label.setText(info)
+        
+        # icicle graph
+        if self.rects:
+            x0, depth, width, labels = zip(*self.rects)
+            self.rect_arrays = (np.array(x0)/total, np.array(depth), np.array(width)/total)
+            self.rect_labels = labels
+            brushes = [pg.intColor(zlib.crc32(label.encode()) % 64, hues=64, values=1, 
+                                   minValue=200, alpha=200) for label in labels]
+            self.plot.addItem(pg.BarGraphItem(x0=self.rect_arrays[0], y0=self.rect_arrays[1],
+                                              width=self.rect_arrays[2], height=0.9,
+                                              brushes=brushes, pen=None))
+            for x, d, w, label in zip(self.rect_arrays[0], depth, self.rect_arrays[2], labels):
+                if w > 0.05:
+                    text = pg.TextItem(label.split(' (')[0], color='k', anchor=(0, 0))
+                    text.setPos(x, d)
+                    self.plot.addItem(text)
+            self.plot.setXRange(0, 1)
+            self.plot.setYRange(0, min(max(depth) + 1, 30))
+        
+        # functions by self time
+        columns = ['function', 'self (s)', 'self %', 'total (s)', 'total %']
+        ref = self.ref_func_times
+        if ref is not None:
+            columns.append('self % - ref')
+        rows = list(self.func_times.items())[:self.settings['max_rows']]
+        self.table.setSortingEnabled(False)
+        self.table.setColumnCount(len(columns))
+        self.table.setHorizontalHeaderLabels(columns)
+        self.table.setRowCount(len(rows))
+        for row, (label, (self_t, total_t)) in enumerate(rows):
+            vals = [1e-6*self_t, 100.*self_t/total, 1e-6*total_t, 100.*total_t/total]
+            if ref is not None:
+                ref_self = ref.get(label, (0, 0))[0]
+                vals.append(100.*self_t/total - 100.*ref_self/(self.ref_total or 1.0))
+            self.table.setItem(row, 0, QtWidgets.QTableWidgetItem(label))
+            for col, val in enumerate(vals):
+                item = QtWidgets.QTableWidgetItem()
+                item.setData(QtCore.Qt.DisplayRole, float('{:.4g}'.format(val)))
+                self.table.setItem(row, col+1, item)
+        self.table.setSortingEnabled(True)
+        self.table.resizeColumnsToContents()
+    
+    def on_mouse_moved(self, pos):
+        if not self.rects or self.func_times is None:
+            return
+        p = self.plot.getPlotItem().vb.mapSceneToView(pos)
+        x0, depth, width = self.rect_arrays
+        hit = np.flatnonzero((depth == int(np.floor(p.y()))) & (x0 <= p.x()) & (p.x() < x0 + width))
+        if len(hit):
+            label = self.rect_labels[hit[0]]
+            self_t, total_t = self.func_times.get(label, (0, 0))
+            self.hover_label.setText("{}: self {:.3g} s, total {:.3g} s".format(
+                label, 1e-6*self_t, 1e-6*total_t))
+
+
+class SummarySearchView(DataBrowserView):
+    """
+    Search the h5 files of browse_dir by sample and measurement name 
+    (SQL LIKE patterns, e.g. 'ZnO%') and setting values, see 
+    DataBrowser.search_files. The matching files are shown as a grid of 
+    the preview images of the summary index, double click one to open it.
+    
+    Searching enables the DataBrowser's summary_index setting.
+    """
+    
+    name = 'summary_search'
+    
+    def setup(self):
+        self.settings.New('sample', dtype=str, initial='')
+        self.settings.New('measurement', dtype=str, initial='')
+        # comma separated name=value or name=min:max, 
+        # name may be 'group/name', e.g. 'hyperspec_scan/exposure=0.1:1'
+        self.settings.New('setting_filter', dtype=str, initial='')
+        self.settings.New('thumbnail_size', dtype=int, initial=96, vmin=16)
+        
+        self.ui = QtWidgets.QWidget()
+        layout = QtWidgets.QVBoxLayout(self.ui)
+        layout.addWidget(self.settings.New_UI())
+        buttons = QtWidgets.QHBoxLayout()
+        layout.addLayout(buttons)
+        self.search_pushButton = QtWidgets.QPushButton("Search")
+        self.search_pushButton.clicked.connect(self.search)
+        buttons.addWidget(self.search_pushButton)
+        self.status_label = QtWidgets.QLabel()
+        buttons.addWidget(self.status_label, stretch=1)
+        self.results_listWidget = QtWidgets.QListWidget()
+        self.results_listWidget.setViewMode(QtWidgets.QListView.IconMode)
+        self.results_listWidget.setResizeMode(QtWidgets.QListView.Adjust)
+        self.results_listWidget.setMovement(QtWidgets.QListView.Static)
+        self.results_listWidget.itemActivated.connect(self.on_item_activated)
+        layout.addWidget(self.results_listWidget, stretch=1)
+        
+        self.databrowser.search_finished.connect(self.on_search_finished)
+    
+    def parse_setting_filter(self):
+        "setting_filter as keyword arguments of H5SummaryIndex.search"
+        kwargs = {}
+        for term in self.settings['setting_filter'].split(','):
+            if not term.strip():
+                continue
+            name, _, val = term.partition('=')
+            val = val.strip()
+            lo, sep, hi = val.partition(':')
+            try:
+                val = (float(lo), float(hi)) if sep else float(val)
+            except ValueError:
+                pass # compared as string
+            kwargs[name.strip()] = val
+        return kwargs
+    
+    def search(self):
+        S = self.settings
+        db = self.databrowser
+        kwargs = self.parse_setting_filter()
+        for key in ('sample', 'measurement'):
+            if S[key]:
+                kwargs[key] = S[key]
+        db.settings['summary_index'] = True
+        try:
+            db.search_files(**kwargs)
+        except RuntimeError as err:
+            # summary index could not be created
+            self.status_label.setText(str(err))
+            return
+        self.status_label.setText("searching...")
+    
+    def on_search_finished(self, paths, err):
+        self.results_listWidget.clear()
+        if err is not None:
+            self.status_label.setText("search failed: {}".format(err))
+            return
+        index = self.databrowser.summary_index
+        size = self.settings['thumbnail_size']
+        self.results_listWidget.setIconSize(QtCore.QSize(size, size))
+        for path in paths:
+            item = QtWidgets.QListWidgetItem(os.path.basename(path))
+            item.setData(QtCore.Qt.UserRole, path)
+            preview = index.preview(path)
+            if preview is not None:
+                item.setIcon(QtGui.QIcon(preview_pixmap(preview)))
+            info = index.info(path)
+            if info is not None:
+                item.setToolTip("{}\nsample: {}\nmeasurement: {}".format(
+                    path, info['sample'], info['measurement']))
+            self.results_listWidget.addItem(item)
+        self.status_label.setText("{} files".format(len(paths)))
+    
+    def on_item_activated(self, item):
+        self.databrowser.settings['data_filename'] = item.data(QtCore.Qt.UserRole)
+
+
+def preview_pixmap(img):
+    "QPixmap of a uint8 preview image (y, x), lower left origin"
+    img = np.ascontiguousarray(img[::-1])
+    ny, nx = img.shape
+    qimg = QtGui.QImage(img.tobytes(), nx, ny, nx, QtGui.QImage.Format_Grayscale8)
+    return QtGui.QPixmap.fromImage(qimg.copy())
 
 
 class HyperSpectralBaseView(DataBrowserView):
+    """
+    Base class of hyperspectral image views, subclasses implement
+    load_data and set supported_measurements (which lets the DataBrowser
+    select the view from its file index) or implement is_file_supported.
+    
+    load_file is safe to run in the DataBrowser's loader thread if
+    load_data is: subclasses whose load_data only reads the file and
+    sets the data attributes (e.g. with open_h5_hyperspec_data),
+    without touching Qt widgets, should set background_load = True so
+    that selecting a large file does not freeze the GUI. 
+    It is False by default because load_data of existing subclasses
+    may update the GUI.
+    """
     
     name = 'HyperSpectralBaseView'
     
+    background_load = False
+    
+    data_attrs = ('hyperspec_data', 'display_image', 'spec_x_array', 
+                  'h5_file', 'roi_sum_table')
+    
     def setup(self):
         
         #self.ui = self.splitter = QtWidgets.QSplitter()
@@ -290,6 +1098,15 @@ class HyperSpectralBaseView(DataBrowserView):
         self.hyperspec_data = None
         self.display_image = None
         self.spec_x_array = None
+        self.h5_file = None
+        
+        # summed-area table for fast rectangle ROI means, see roi_mean_spectrum
+        self.settings.New('roi_sum_table', dtype=str, initial='float64',
+                          choices=('off', 'float64', 'float32'))
+        self.settings.New('roi_sum_table_max_MB', dtype=float, initial=2048., vmin=0)
+        self.settings.roi_sum_table.add_listener(self.invalidate_roi_sum_table)
+        self.settings.roi_sum_table_max_MB.add_listener(self.invalidate_roi_sum_table)
+        self.roi_sum_table = None
         
         self.scan_specific_setup()
         
@@ -297,22 +1114,36 @@ class HyperSpectralBaseView(DataBrowserView):
         #override this!
         pass
         
-    def is_file_supported(self, fname):
-        # override this!
-        return False
-    
     def on_change_data_filename(self, fname):
+        err = None
         try:
+            self.load_file(fname)
+        except Exception as e:
+            err = e
+            raise
+        finally:
+            self.on_load_finished(fname, err)
+    
+    def load_file(self, fname):
+        try:
+            self.close_h5_file()
+            self.invalidate_roi_sum_table()
             self.load_data(fname)
+            # build here, not on the first ROI update in the GUI thread
+            self.get_roi_sum_table()
+        except LoadCancelled:
+            raise
+        except Exception:
+            HyperSpectralBaseView.load_data(self, fname) # load default dummy data
+            raise
+    
+    def on_load_finished(self, fname, err=None):
+        if err is None:
             self.databrowser.ui.statusbar.clearMessage()
-            
-        except Exception as err:
+        else:
             #self.imview.setImage(np.zeros((10,10)))
-            HyperSpectralBaseView.load_data(self, fname) # load default dummy data
             self.databrowser.ui.statusbar.showMessage("failed to load %s:\n%s" %(fname, err))
-            raise(err)
-        finally:        
-            self.update_display()
+        self.update_display()
             
     def update_display(self):
         # pyqtgraph axes are x,y, but data is stored in (frame, y,x, time), so we need to transpose        
@@ -332,17 +1163,78 @@ class HyperSpectralBaseView(DataBrowserView):
         self.display_image =np.zeros((10,10,34))# np.random.rand(10,10)
         self.spec_x_array = 3*np.arange(34)
     
+    def open_h5_hyperspec_data(self, fname, dataset_path, index=()):
+        """
+        For use in load_data: lazily open the (Ny, Nx, Nspec) HDF5 dataset
+        at *dataset_path* (or dataset[index], e.g. index=(0,) for the first
+        frame) as self.hyperspec_data, without loading it into memory.
+        self.display_image is set to the spectrally integrated image, 
+        computed slab by slab. ROI spectra only read the region selected.
+        The file stays open until the next file is loaded.
+        """
+        import h5py
+        self.close_h5_file()
+        self.h5_file = h5py.File(fname, 'r')
+        self.hyperspec_data = H5LazyArray(self.h5_file[dataset_path], index=index)
+        self.display_image = self.hyperspec_data.reduce_last_axis(
+            callback=self.check_load_cancelled)
+        return self.hyperspec_data
+    
+    def close_h5_file(self):
+        if self.h5_file is not None:
+            self.hyperspec_data = None
+            # files of cached data are closed by the cache
+            if not self.databrowser.data_cache.holds(self.h5_file):
+                self.h5_file.close()
+            self.h5_file = None
+    
+    def roi_mean_spectrum(self, roi_slice):
+        """
+        mean spectrum of self.hyperspec_data[roi_slice]
+        
+        uses a summed-area table, built on first use after a file is 
+        loaded, unless roi_sum_table is 'off' or the table would be
+        larger than roi_sum_table_max_MB
+        """
+        sat = self.get_roi_sum_table()
+        if sat is not None:
+            return sat.mean(roi_slice[0], roi_slice[1])
+        if isinstance(self.hyperspec_data, H5LazyArray):
+            return self.hyperspec_data.roi_mean(roi_slice)
+        return self.hyperspec_data[roi_slice].mean(axis=(0,1))
+    
+    def get_roi_sum_table(self):
+        "returns the SummedAreaTable of self.hyperspec_data, or None if disabled"
+        dtype = self.settings['roi_sum_table']
+        if dtype == 'off' or self.hyperspec_data is None:
+            return None
+        if self.roi_sum_table is None or self.roi_sum_table.table.dtype != dtype:
+            Ny, Nx, Nspec = self.hyperspec_data.shape
+            table_MB = (Ny+1)*(Nx+1)*Nspec*np.dtype(dtype).itemsize/1e6
+            if table_MB > self.settings['roi_sum_table_max_MB']:
+                return None
+            self.roi_sum_table = SummedAreaTable(self.hyperspec_data, dtype=dtype,
+                                                 callback=self.check_load_cancelled)
+        return self.roi_sum_table
+    
+    def invalidate_roi_sum_table(self):
+        self.roi_sum_table = None
+    
     @QtCore.Slot(object)
     def on_change_rect_roi(self, roi=None):
+        if self.is_loading:
+            return
         # pyqtgraph axes are x,y, but data is stored in (frame, y,x, time)
         # NOTE: If data is indeed stored as (frame, y, x, time) in self.hyperspec_data, then axis argument should be axes = (2,1)
         roi_slice, roi_tr = self.rect_roi.getArraySlice(self.hyperspec_data, self.imview.getImageItem(), axes=(1,0)) 
         
         #print("roi_slice", roi_slice)
-        self.rect_plotdata.setData(self.spec_x_array, self.hyperspec_data[roi_slice].mean(axis=(0,1))+1)
+        self.rect_plotdata.setData(self.spec_x_array, self.roi_mean_spectrum(roi_slice)+1)
         
     @QtCore.Slot(object)        
     def on_update_circ_roi(self, roi=None):
+        if self.is_loading:
+            return
         if roi is None:
             roi = self.circ_roi
 
@@ -369,6 +1261,70 @@ class HyperSpectralBaseView(DataBrowserView):
         self.point_plotdata.setData(self.spec_x_array, self.hyperspec_data[j,i,:])
 
 
+class SummedAreaTable(object):
+    """
+    Summed-area table (integral image) of a (Ny, Nx, Nspec) array: 
+    table[j,i] is the sum of data[:j,:i] for each spectral channel.
+    The sum or mean over any rectangle then takes four lookups per channel.
+    
+    *data* may be an ndarray or an H5LazyArray, it is processed in slabs
+    along the first axis (of about slab_bytes for ndarrays), calling 
+    *callback* after each slab. Sums are accumulated in the table itself,
+    in float64 per slab for other table dtypes, so the extra memory is
+    bounded by the slab size.
+    A float32 table halves the memory, at the cost of precision 
+    for large cubes.
+    """
+    
+    slab_bytes = 64*1024**2
+    
+    def __init__(self, data, dtype=float, callback=None):
+        Ny, Nx, Nspec = data.shape
+        self.table = table = np.zeros((Ny+1, Nx+1, Nspec), dtype=dtype)
+        if isinstance(data, H5LazyArray):
+            slabs = data.iter_slabs()
+        else:
+            n = max(1, int(self.slab_bytes // (8*max(1, Nx*Nspec))))
+            slabs = ((a, data[a:a+n]) for a in range(0, Ny, n))
+        in_place = table.dtype == np.float64
+        for a, slab in slabs:
+            b = a + slab.shape[0]
+            out = table[a+1:b+1, 1:]
+            c = out if in_place else None
+            c = np.cumsum(slab, axis=0, dtype=float, out=c)
+            np.cumsum(c, axis=1, out=c)
+            # add sums of all rows before this slab
+            c += table[a, 1:]
+            if not in_place:
+                out[:] = c
+            if callback is not None:
+                callback()
+    
+    @property
+    def nbytes(self):
+        return self.table.nbytes
+    
+    def _bounds(self, j_slice, i_slice):
+        Ny1, Nx1 = self.table.shape[:2]
+        j0, j1, _ = j_slice.indices(Ny1-1)
+        i0, i1, _ = i_slice.indices(Nx1-1)
+        return j0, max(j0, j1), i0, max(i0, i1)
+    
+    def sum(self, j_slice, i_slice):
+        "sum over data[j_slice, i_slice], slices with step 1"
+        j0, j1, i0, i1 = self._bounds(j_slice, i_slice)
+        t = self.table
+        return t[j1,i1].astype(float) - t[j0,i1] - t[j1,i0] + t[j0,i0]
+    
+    def mean(self, j_slice, i_slice):
+        "mean over data[j_slice, i_slice], slices with step 1"
+        j0, j1, i0, i1 = self._bounds(j_slice, i_slice)
+        n = (j1-j0)*(i1-i0)
+        if n == 0:
+            return np.full(self.table.shape[2], np.nan)
+        return self.sum(j_slice, i_slice)/n
+
+
 if __name__ == '__main__':
     import sys
     
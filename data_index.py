@@ -0,0 +1,447 @@
+from __future__ import division, print_function, absolute_import
+from ScopeFoundry.helper_funcs import get_logger_from_class
+from qtpy import QtCore
+from collections import OrderedDict
+import os
+import threading
+import zipfile
+
+try:
+    import queue
+except ImportError: # python 2
+    import Queue as queue
+
+
+HDF5_SIGNATURE = b'\x89HDF\r\n\x1a\n'
+
+def sniff_file_metadata(fname, max_datasets=256):
+    """
+    Returns a dict describing file *fname*, without reading its data:
+
+    ============  =============================================================
+    path          absolute path
+    mtime, size   from os.stat, used to detect changes
+    ext           lower case extension, e.g. '.h5'
+    type          'h5', 'npz' or 'other', h5 is detected by file signature
+    measurements  list of measurement group names in a ScopeFoundry h5 file
+    datasets      OrderedDict {path: shape} of h5 datasets (at most
+                  *max_datasets*) or of npz array names (shape None)
+    error         str, if the file could not be read
+    ============  =============================================================
+    """
+    st = os.stat(fname)
+    meta = dict(path=os.path.abspath(fname), mtime=st.st_mtime, size=st.st_size,
+                ext=os.path.splitext(fname)[1].lower(), type='other',
+                measurements=[], datasets=OrderedDict())
+    try:
+        with open(fname, 'rb') as f:
+            signature = f.read(len(HDF5_SIGNATURE))
+        if signature == HDF5_SIGNATURE:
+            meta['type'] = 'h5'
+            _sniff_h5(fname, meta, max_datasets)
+        elif meta['ext'] == '.npz' and zipfile.is_zipfile(fname):
+            meta['type'] = 'npz'
+            with zipfile.ZipFile(fname) as z:
+                for name in z.namelist():
+                    meta['datasets'][os.path.splitext(name)[0]] = None
+    except Exception as err:
+        meta['error'] = repr(err)
+    return meta
+
+def _sniff_h5(fname, meta, max_datasets):
+    import h5py
+    with h5py.File(fname, 'r') as h5:
+        if 'measurement' in h5:
+            meta['measurements'] = list(h5['measurement'].keys())
+        datasets = meta['datasets']
+        def visit(name, obj):
+            if isinstance(obj, h5py.Dataset):
+                datasets[name] = obj.shape
+                if len(datasets) >= max_datasets:
+                    return True # stop visiting
+        h5.visititems(visit)
+
+
+class DirectoryMetadataIndex(QtCore.QObject):
+    """
+    Index of :func:`sniff_file_metadata` dicts of the files in directories.
+
+    :meth:`index_directory` indexes a directory in a background thread
+    and watches it with a QFileSystemWatcher: when files are added,
+    removed or changed, only those are re-sniffed.
+    :meth:`get` returns the metadata of a file, re-sniffing it if its
+    mtime or size changed. Users may store their own keys in the dicts
+    (e.g. a selected view name), they are dropped when the file changes.
+
+    directory_indexed(path) is emitted (in the GUI thread) after
+    a directory has been (re)indexed
+    """
+
+    directory_indexed = QtCore.Signal(str)
+
+    def __init__(self):
+        QtCore.QObject.__init__(self)
+        self.log = get_logger_from_class(self)
+        self.lock = threading.Lock()
+        self.files = dict() # abs path -> metadata
+        self.directories = set()
+        self.watcher = QtCore.QFileSystemWatcher()
+        self.watcher.directoryChanged.connect(self.on_directory_changed)
+        self._queue = queue.Queue()
+        self.thread = threading.Thread(target=self._run, name='DirectoryMetadataIndex')
+        self.thread.daemon = True
+        self.thread.start()
+
+    def index_directory(self, path):
+        "index and watch directory *path*, in the background"
+        path = os.path.abspath(path)
+        if not os.path.isdir(path):
+            return
+        with self.lock:
+            if path in self.directories:
+                return
+            self.directories.add(path)
+        self.watcher.addPath(path)
+        self._queue.put(path)
+
+    def on_directory_changed(self, path):
+        self._queue.put(os.path.abspath(path))
+
+    def get(self, fname):
+        """
+        Returns metadata dict of fname. Indexes the directory of fname
+        if needed, sniffs fname now if it is not (yet) indexed or changed
+        """
+        path = os.path.abspath(fname)
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        self.index_directory(os.path.dirname(path))
+        with self.lock:
+            meta = self.files.get(path)
+        if meta is None or meta['mtime'] != st.st_mtime or meta['size'] != st.st_size:
+            meta = sniff_file_metadata(path)
+            with self.lock:
+                self.files[path] = meta
+        return meta
+
+    def __contains__(self, fname):
+        with self.lock:
+            return os.path.abspath(fname) in self.files
+
+    def clear_key(self, key):
+        "remove user key from all metadata dicts"
+        with self.lock:
+            for meta in self.files.values():
+                meta.pop(key, None)
+
+    def _run(self):
+        while True:
+            path = self._queue.get()
+            try:
+                self._index(path)
+            except Exception as err:
+                self.log.warning("indexing {} failed: {}".format(path, err))
+            self.directory_indexed.emit(path)
+
+    def _index(self, path):
+        try:
+            names = os.listdir(path)
+        except OSError:
+            names = []
+        present = set()
+        for name in names:
+            fname = os.path.join(path, name)
+            try:
+                st = os.stat(fname)
+            except OSError:
+                continue
+            if not os.path.isfile(fname):
+                continue
+            present.add(fname)
+            with self.lock:
+                meta = self.files.get(fname)
+            if meta is None or meta['mtime'] != st.st_mtime or meta['size'] != st.st_size:
+                meta = sniff_file_metadata(fname)
+                with self.lock:
+                    self.files[fname] = meta
+        # forget removed files
+        with self.lock:
+            for fname in [f for f in self.files if os.path.dirname(f) == path]:
+                if fname not in present:
+                    del self.files[fname]
+
+
+def h5_file_summary(fname, preview_size=64):
+    """
+    Returns dict summarizing ScopeFoundry h5 file *fname*:
+
+    ============  =============================================================
+    time_id       root attr time_id (file creation time)
+    sample        app/settings/sample
+    measurement   name of the (first) measurement group
+    settings      list of (group, name, value) of app/settings and
+                  measurement/*/settings attrs, group is 'app' or the
+                  measurement name
+    preview       uint8 image, at most *preview_size* pixels per side, or None
+    ============  =============================================================
+
+    The preview is a strided read of the largest dataset with at least two
+    non-trivial axes: leading axes are indexed at 0, the image axes are
+    (y, x) = the first two of the last three non-trivial axes, further
+    axes (channels, spectrum) are averaged.
+    """
+    import h5py
+    import numpy as np
+    summary = dict(time_id=None, sample='', measurement='', settings=[], preview=None)
+    with h5py.File(fname, 'r') as h5:
+        summary['time_id'] = h5.attrs.get('time_id', None)
+        if 'app/settings' in h5:
+            for name, val in h5['app/settings'].attrs.items():
+                summary['settings'].append(('app', name, val))
+            summary['sample'] = _attr_str(h5['app/settings'].attrs.get('sample', ''))
+        candidates = []
+        if 'measurement' in h5:
+            for m_name, m_group in h5['measurement'].items():
+                if not isinstance(m_group, h5py.Group):
+                    continue
+                if not summary['measurement']:
+                    summary['measurement'] = m_name
+                if 'settings' in m_group:
+                    for name, val in m_group['settings'].attrs.items():
+                        summary['settings'].append((m_name, name, val))
+                def visit(name, obj):
+                    if isinstance(obj, h5py.Dataset) and obj.dtype.kind in 'biuf' \
+                            and sum(n > 1 for n in obj.shape) >= 2:
+                        candidates.append(obj)
+                m_group.visititems(visit)
+        if candidates:
+            ds = max(candidates, key=lambda d: d.size)
+            summary['preview'] = _h5_preview(ds, preview_size)
+    return summary
+
+def _attr_str(val):
+    if isinstance(val, bytes):
+        return val.decode('utf8', 'replace')
+    return str(val)
+
+def _h5_preview(ds, preview_size):
+    import numpy as np
+    axes = [i for i, n in enumerate(ds.shape) if n > 1]
+    image_axes = axes[-3:][:2]
+    key = []
+    for i, n in enumerate(ds.shape):
+        if i in image_axes:
+            key.append(slice(None, None, max(1, int(np.ceil(n/preview_size)))))
+        elif i > image_axes[1]:
+            key.append(slice(None))
+        else:
+            key.append(0)
+    img = np.asarray(ds[tuple(key)], dtype=float)
+    img = img.reshape(img.shape[:2] + (-1,)).mean(axis=2)
+    finite = np.isfinite(img)
+    if not finite.any():
+        return np.zeros(img.shape, dtype=np.uint8)
+    lo, hi = np.percentile(img[finite], (1, 99))
+    if hi <= lo:
+        hi = lo + 1
+    img = np.clip((np.where(finite, img, lo) - lo)/(hi - lo), 0, 1)
+    return (img*255).astype(np.uint8)
+
+
+class H5SummaryIndex(object):
+    """
+    SQLite sidecar database summarizing the ScopeFoundry h5 files of a
+    directory (see :func:`h5_file_summary`): app and measurement settings
+    and a small preview image per file, to search and browse large data
+    directories without opening every file.
+
+    :meth:`update` (re)indexes files whose mtime or size changed and drops
+    removed files, :meth:`update_in_background` does so in a worker
+    thread. Each thread uses its own sqlite connection.
+
+    The database is *db_fname*, by default a hidden file in *directory*.
+    """
+
+    default_db_name = '.scopefoundry_index.sqlite'
+
+    schema = """
+        CREATE TABLE IF NOT EXISTS files (
+            path TEXT PRIMARY KEY, mtime REAL, size INTEGER,
+            time_id REAL, sample TEXT, measurement TEXT, error TEXT,
+            preview BLOB, preview_ny INTEGER, preview_nx INTEGER);
+        CREATE TABLE IF NOT EXISTS settings (
+            path TEXT, grp TEXT, name TEXT, value TEXT, num REAL);
+        CREATE INDEX IF NOT EXISTS settings_path ON settings (path);
+        CREATE INDEX IF NOT EXISTS settings_value ON settings (name, value);
+        CREATE INDEX IF NOT EXISTS settings_num ON settings (name, num);
+        CREATE INDEX IF NOT EXISTS files_sample ON files (sample);
+        CREATE INDEX IF NOT EXISTS files_time ON files (time_id);
+    """
+
+    def __init__(self, directory, db_fname=None, extensions=('.h5',), preview_size=64):
+        self.directory = os.path.abspath(directory)
+        if db_fname is None:
+            db_fname = os.path.join(self.directory, self.default_db_name)
+        self.db_fname = db_fname
+        self.extensions = extensions
+        self.preview_size = preview_size
+        self.log = get_logger_from_class(self)
+        self._local = threading.local()
+        self._update_lock = threading.Lock()
+        self.thread = None
+        self.connection().executescript(self.schema)
+
+    def connection(self):
+        "sqlite connection of the calling thread"
+        import sqlite3
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_fname, timeout=30)
+            conn.execute('PRAGMA journal_mode=WAL')
+            self._local.conn = conn
+        return conn
+
+    def update_in_background(self):
+        "run :meth:`update` in a worker thread, if not already running"
+        if self.thread is not None and self.thread.is_alive():
+            return
+        self.thread = threading.Thread(target=self.update, name='H5SummaryIndex')
+        self.thread.daemon = True
+        self.thread.start()
+
+    def update(self):
+        "index new and changed files, returns number of files indexed"
+        with self._update_lock:
+            conn = self.connection()
+            known = dict((path, (mtime, size)) for path, mtime, size
+                         in conn.execute('SELECT path, mtime, size FROM files'))
+            n = 0
+            present = set()
+            for name in sorted(os.listdir(self.directory)):
+                if os.path.splitext(name)[1].lower() not in self.extensions:
+                    continue
+                fname = os.path.join(self.directory, name)
+                try:
+                    st = os.stat(fname)
+                except OSError:
+                    continue
+                present.add(fname)
+                if known.get(fname) == (st.st_mtime, st.st_size):
+                    continue
+                self.index_file(fname, st)
+                n += 1
+            removed = [(path,) for path in known if path not in present]
+            with conn:
+                conn.executemany('DELETE FROM files WHERE path=?', removed)
+                conn.executemany('DELETE FROM settings WHERE path=?', removed)
+            if n or removed:
+                self.log.info("indexed {} files, removed {}, in {}".format(
+                    n, len(removed), self.directory))
+            return n
+
+    def index_file(self, fname, st=None):
+        if st is None:
+            st = os.stat(fname)
+        error = None
+        try:
+            summary = h5_file_summary(fname, self.preview_size)
+        except Exception as err:
+            # e.g. file still being written
+            error = repr(err)
+            summary = dict(time_id=None, sample='', measurement='', settings=[], preview=None)
+        preview = summary['preview']
+        settings = []
+        for grp, name, val in summary['settings']:
+            settings.append((fname, grp, name, _attr_str(val), _attr_num(val)))
+        conn = self.connection()
+        with conn:
+            conn.execute('DELETE FROM settings WHERE path=?', (fname,))
+            conn.execute('INSERT OR REPLACE INTO files VALUES (?,?,?,?,?,?,?,?,?,?)', (
+                fname, st.st_mtime, st.st_size,
+                None if summary['time_id'] is None else float(summary['time_id']),
+                summary['sample'], summary['measurement'], error,
+                None if preview is None else preview.tobytes(),
+                None if preview is None else preview.shape[0],
+                None if preview is None else preview.shape[1]))
+            conn.executemany('INSERT INTO settings VALUES (?,?,?,?,?)', settings)
+
+    def search(self, sample=None, measurement=None, t_start=None, t_stop=None, **settings):
+        """
+        Returns paths of indexed files, sorted by time, matching all given
+        criteria. *sample* and *measurement* are SQL LIKE patterns
+        (e.g. 'ZnO%'), *t_start*, *t_stop* limit time_id (unix time).
+        Keyword arguments match setting values, by name or 'group/name'
+        (group is 'app' or a measurement name), the value is compared as
+        string, or as number if it is a number or a (min, max) tuple.
+
+        e.g. index.search(sample='ZnO%', t_start=time.time()-86400, 
+                          **{'hyperspec_scan/exposure': (0.1, 1.0)})
+        """
+        sql = 'SELECT path FROM files WHERE 1'
+        args = []
+        for column, pattern in (('sample', sample), ('measurement', measurement)):
+            if pattern is not None:
+                sql += ' AND {} LIKE ?'.format(column)
+                args.append(pattern)
+        if t_start is not None:
+            sql += ' AND time_id >= ?'
+            args.append(t_start)
+        if t_stop is not None:
+            sql += ' AND time_id < ?'
+            args.append(t_stop)
+        for key, val in settings.items():
+            sub = 'SELECT path FROM settings WHERE name=?'
+            grp, _, name = key.rpartition('/')
+            args.append(name)
+            if grp:
+                sub += ' AND grp=?'
+                args.append(grp)
+            if isinstance(val, tuple):
+                sub += ' AND num >= ? AND num <= ?'
+                args.extend(val)
+            elif _attr_num(val) is not None and not isinstance(val, bool):
+                sub += ' AND num = ?'
+                args.append(float(val))
+            else:
+                sub += ' AND value = ?'
+                args.append(_attr_str(val))
+            sql += ' AND path IN ({})'.format(sub)
+        sql += ' ORDER BY time_id'
+        return [row[0] for row in self.connection().execute(sql, args)]
+
+    def info(self, fname):
+        "dict of indexed columns of fname (without preview), or None"
+        cur = self.connection().execute(
+            'SELECT path, mtime, size, time_id, sample, measurement, error '
+            'FROM files WHERE path=?', (os.path.abspath(fname),))
+        row = cur.fetchone()
+        if row is None:
+            return None
+        return dict(zip([c[0] for c in cur.description], row))
+
+    def settings(self, fname):
+        "list of (group, name, value string) of the settings of fname"
+        return list(self.connection().execute(
+            'SELECT grp, name, value FROM settings WHERE path=?', (os.path.abspath(fname),)))
+
+    def preview(self, fname):
+        "preview image of fname as uint8 array, or None"
+        import numpy as np
+        row = self.connection().execute(
+            'SELECT preview, preview_ny, preview_nx FROM files WHERE path=?',
+            (os.path.abspath(fname),)).fetchone()
+        if row is None or row[0] is None:
+            return None
+        return np.frombuffer(row[0], dtype=np.uint8).reshape(row[1], row[2])
+
+def _attr_num(val):
+    "numerical value of a scalar attr, or None"
+    try:
+        if isinstance(val, (bytes, str)):
+            return None
+        num = float(val)
+    except (TypeError, ValueError):
+        return None
+    return num
@@ -0,0 +1,111 @@
+from __future__ import division, print_function, absolute_import
+from ScopeFoundry import HardwareComponent
+from collections import deque
+import numpy as np
+import time
+
+
+class DummyBufferedDAQDevice(object):
+    """
+    Simulated hardware-timed DAQ: analog outputs are written in blocks
+    (e.g. scan mirror positions h, v) and clocked out at sample_rate,
+    analog inputs are sampled at the same clock and read back in blocks.
+
+    The simulated signal of each input channel is a smooth function of
+    the output position plus noise. With *realtime*, read_block waits
+    until the samples would have been acquired.
+    """
+
+    def __init__(self, n_channels=1, noise=0.01, realtime=True):
+        self.n_channels = n_channels
+        self.noise = noise
+        self.realtime = realtime
+        self.running = False
+
+    def start(self, sample_rate):
+        self.sample_rate = sample_rate
+        self.queue = deque()
+        self.n_written = 0
+        self.n_read = 0
+        self.t0 = time.time()
+        self.running = True
+
+    def stop(self):
+        self.running = False
+        self.queue = deque()
+
+    def signal(self, h, v):
+        "simulated signal for output positions h, v, shape (len(h), n_channels)"
+        sig = [np.sin(0.2*h)*np.cos(0.3*v)*(c+1) for c in range(self.n_channels)]
+        return np.stack(sig, axis=1)
+
+    def write_block(self, h, v):
+        "queue output waveforms h, v (equal length arrays)"
+        assert self.running
+        self.queue.append((np.asarray(h, dtype=float), np.asarray(v, dtype=float)))
+        self.n_written += len(h)
+
+    def read_block(self, n):
+        """
+        returns next *n* input samples, array of shape (n, n_channels).
+        n must match the length of the next written block
+        """
+        assert self.running
+        h, v = self.queue.popleft()
+        assert len(h) == n
+        self.n_read += n
+        if self.realtime:
+            delay = self.t0 + self.n_read/self.sample_rate - time.time()
+            if delay > 0:
+                time.sleep(delay)
+        data = self.signal(h, v)
+        if self.noise:
+            data += self.noise*np.random.standard_normal(data.shape)
+        return data
+
+    def close(self):
+        self.stop()
+
+
+class DummyBufferedDAQHW(HardwareComponent):
+    """
+    Simulated hardware-timed DAQ, for BaseRaster2DBufferedScan.
+    Provides start_buffered, write_block, read_block and stop_buffered.
+    """
+
+    name = "dummy_daq"
+
+    def setup(self):
+        self.settings.New('n_channels', dtype=int, initial=1, vmin=1)
+        self.settings.New('noise', dtype=float, initial=0.01, vmin=0)
+        self.settings.New('realtime', dtype=bool, initial=True)
+        self.settings.New('max_sample_rate', dtype=float, initial=2e6, unit='Hz', si=True)
+        self.settings.New('samples_acquired', dtype=int, ro=True)
+
+    def connect(self):
+        S = self.settings
+        self.daq_device = DummyBufferedDAQDevice(n_channels=S['n_channels'],
+                                                 noise=S['noise'],
+                                                 realtime=S['realtime'])
+
+    def disconnect(self):
+        if hasattr(self, 'daq_device'):
+            self.daq_device.close()
+            del self.daq_device
+
+    def start_buffered(self, sample_rate):
+        sample_rate = min(sample_rate, self.settings['max_sample_rate'])
+        self.daq_device.start(sample_rate)
+        return sample_rate
+
+    def write_block(self, h, v):
+        self.daq_device.write_block(h, v)
+
+    def read_block(self, n):
+        data = self.daq_device.read_block(n)
+        self.settings.samples_acquired.update_value_fast(self.daq_device.n_read)
+        return data
+
+    def stop_buffered(self):
+        if hasattr(self, 'daq_device'):
+            self.daq_device.stop()
@@ -71,6 +71,15 @@ class DummyXYStageHW(HardwareComponent):
         self.x_position.hardware_set_func  = self.stage_device.write_x
         self.y_position.hardware_set_func  = self.stage_device.write_y
 
+    def wait_on_target(self, timeout=1.0):
+        """
+        settle hook used by slow scans with settle_mode 'on_target': 
+        wait until the stage reached its target position, up to *timeout* 
+        seconds, return whether it is on target. The dummy stage moves 
+        instantly.
+        """
+        return True
+
     def disconnect(self):
         #if self.debug_mode.val: print "disconnecting to dummy_xy_stage"
         
@@ -1,8 +1,15 @@
 from __future__ import absolute_import, print_function
 import h5py
+import numpy as np
 import time
 from datetime import datetime
 import os
+import threading
+from ScopeFoundry.helper_funcs import get_logger_from_class
+try:
+    import queue
+except ImportError: # python 2
+    import Queue as queue
 
 """
 recommended HDF5 file format for ScopeFoundry
@@ -223,4 +230,443 @@ def h5_create_emd_dataset(name, h5parent, shape=None, data = None, maxshape = No
             dim_dset.attrs['unit'] = dim_unit
             
     return emd_grp
+
+
+H5_CHUNK_POLICIES = ('auto', 'row', 'frame')
+H5_COMPRESSIONS = ('none', 'lzf', 'gzip')
+
+def h5_chunk_shape(shape, itemsize, block_ndim, value_ndim=0, max_chunk_bytes=256*1024):
+    """
+    Returns a chunk shape for a dataset of *shape* that is written in blocks
+    spanning the last *block_ndim* pixel axes (1: one row, 2: one image).
+    
+    The last *value_ndim* axes hold per-pixel values (e.g. spectra) and are 
+    always kept whole. All other leading axes have chunk size 1.
+    Block axes are trimmed, outermost first, until a chunk fits into 
+    *max_chunk_bytes*. The default keeps several chunks inside HDF5's
+    default 1 MB chunk cache, so row writes to interleaved sub-frames 
+    (e.g. trace/retrace) do not re-compress chunks.
+    """
+    ndim = len(shape)
+    n_pixel_axes = ndim - value_ndim
+    block_axes = range(max(0, n_pixel_axes - block_ndim), n_pixel_axes)
+    chunk = [1]*ndim
+    for ax in list(block_axes) + list(range(n_pixel_axes, ndim)):
+        chunk[ax] = max(1, shape[ax])
+    for ax in block_axes:
+        chunk_bytes = itemsize*int(np.prod(chunk))
+        if chunk_bytes <= max_chunk_bytes:
+            break
+        rest_bytes = chunk_bytes // chunk[ax]
+        chunk[ax] = max(1, max_chunk_bytes // rest_bytes)
+    return tuple(chunk)
+
+def h5_storage_kwargs(shape, dtype, chunk_policy='auto', compression='gzip', 
+                      gzip_level=4, shuffle=False, value_ndim=0, 
+                      max_chunk_bytes=256*1024):
+    """
+    Returns chunking and compression keyword arguments for create_dataset
+    
+    ==============  ==============================================================
+    **Arguments:**
+    chunk_policy    'auto': h5py chooses the chunk shape
+                    'row': one chunk per row (last pixel axis), matches 
+                    row-buffered writes
+                    'frame': one chunk per image (last two pixel axes), fast
+                    single frame reads. see :func:`h5_chunk_shape`
+    compression     'none', 'lzf' or 'gzip'
+    gzip_level      0-9, only used for gzip
+    shuffle         apply byte shuffle filter before compression
+    value_ndim      number of trailing per-pixel value axes
+    ==============  ==============================================================
+    """
+    assert chunk_policy in H5_CHUNK_POLICIES
+    assert compression in H5_COMPRESSIONS
+    if chunk_policy == 'auto':
+        chunks = True
+    else:
+        block_ndim = dict(row=1, frame=2)[chunk_policy]
+        chunks = h5_chunk_shape(shape, np.dtype(dtype).itemsize, block_ndim,
+                                value_ndim=value_ndim, max_chunk_bytes=max_chunk_bytes)
+    kwargs = dict(chunks=chunks, shuffle=bool(shuffle))
+    if compression == 'gzip':
+        kwargs['compression'] = 'gzip'
+        kwargs['compression_opts'] = int(gzip_level)
+    elif compression == 'lzf':
+        kwargs['compression'] = 'lzf'
+    return kwargs
+
+
+def h5_write_block(dataset, index, block, mask=None):
+    """
+    Write block to dataset[index]. If a boolean *mask* (same shape as block,
+    excluding per-pixel value axes) is given, only masked elements are replaced.
+    """
+    if mask is None:
+        dataset[index] = block
+    else:
+        region = dataset[index]
+        region[mask] = block[mask]
+        dataset[index] = region
+
+
+class H5AsyncWriter(object):
+    """
+    Writes to an HDF5 file from a background thread so that the 
+    acquisition thread never blocks on disk.
+    
+    The acquisition thread enqueues (dataset, index, array) records with 
+    :meth:`write` and file flushes with :meth:`flush`, which the writer 
+    thread performs in order. Other threads may still use h5_file while
+    the writer is running (h5py serializes calls to the HDF5 library),
+    e.g. to create datasets, but operations that must not overlap with 
+    queued writes, like resizing a dataset with pending writes or 
+    closing the file, must follow :meth:`drain` or :meth:`close`.
+    When the bounded queue is full, :meth:`write` blocks (backpressure), 
+    this is recorded in :attr:`stats`.
+    
+    Errors in the writer thread are re-raised as RuntimeError in the 
+    acquisition thread on the next call to :meth:`write`, :meth:`flush`,
+    :meth:`drain` or :meth:`close`. 
+    """
+    
+    def __init__(self, h5_file, maxsize=1024):
+        self.log = get_logger_from_class(self)
+        self.h5_file = h5_file
+        self.queue = queue.Queue(maxsize=maxsize)
+        self.error = None
+        self.stats = dict(
+            records = 0,         # write records enqueued
+            bytes = 0,           # array bytes enqueued
+            max_queue_depth = 0, 
+            blocked_puts = 0,    # enqueues that had to wait for a full queue
+            blocked_time = 0.0,  # seconds acquisition thread waited on full queue
+            write_time = 0.0,    # seconds writer thread spent writing and flushing
+            )
+        self.thread = threading.Thread(target=self._run, name="H5AsyncWriter")
+        self.thread.daemon = True
+        self.thread.start()
+    
+    def write(self, dataset, index, array, mask=None):
+        """
+        enqueue dataset[index] = array, see :func:`h5_write_block` for *mask*.
+        array must not be modified after it is enqueued.
+        """
+        self._put(('write', dataset, index, array, mask))
+        self.stats['records'] += 1
+        self.stats['bytes'] += array.nbytes
+    
+    def flush(self):
+        """enqueue a flush of the h5 file"""
+        self._put(('flush',))
+    
+    def drain(self):
+        """wait until all enqueued records have been written"""
+        self.check_error()
+        self.queue.join()
+        self.check_error()
+    
+    def close(self):
+        """drain queue and stop writer thread, h5_file is left open"""
+        if self.thread.is_alive():
+            self.queue.put(None)
+            self.thread.join()
+        self.log.debug("stats {}".format(self.stats))
+        self.check_error()
+    
+    def check_error(self):
+        if self.error is not None:
+            raise RuntimeError("H5AsyncWriter failed to write to {}: {}".format(
+                self.h5_file, self.error))
+    
+    def _put(self, record):
+        self.check_error()
+        depth = self.queue.qsize()
+        if depth > self.stats['max_queue_depth']:
+            self.stats['max_queue_depth'] = depth
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            t0 = time.time()
+            self.queue.put(record)
+            self.stats['blocked_puts'] += 1
+            self.stats['blocked_time'] += time.time() - t0
+    
+    def _run(self):
+        while True:
+            record = self.queue.get()
+            try:
+                if record is None:
+                    return
+                if self.error is not None:
+                    # discard remaining records after a failure
+                    continue
+                t0 = time.time()
+                if record[0] == 'write':
+                    h5_write_block(*record[1:])
+                elif record[0] == 'flush':
+                    self.h5_file.flush()
+                self.stats['write_time'] += time.time() - t0
+            except Exception as err:
+                self.log.error("failed to write {}: {}".format(record[:3], err))
+                self.error = err
+            finally:
+                self.queue.task_done()
+
+
+class H5DatasetBuffer(object):
+    """
+    Buffers per-pixel writes to an HDF5 dataset in memory and writes 
+    them to the dataset as whole blocks.
+    
+    A pixel is addressed by the first *pixel_ndim* indices of the dataset,
+    any remaining axes hold the per-pixel value (e.g. a spectrum).
+    The buffer holds one block spanning the last *block_ndim* pixel axes 
+    (block_ndim=1 buffers a row). The block is written to the dataset when 
+    a pixel outside of the current block is written, or on :meth:`flush`.
+    Only the bounding box of the pixels written since the last flush 
+    is written back.
+    
+    If *async_writer* (:class:`H5AsyncWriter`) is given, blocks are 
+    written by its writer thread.
+    
+    Use like an h5py dataset:  buf[k,j,i] = value
+    """
+    
+    def __init__(self, dataset, block_ndim=1, pixel_ndim=None, async_writer=None):
+        self.dataset = dataset
+        self.async_writer = async_writer
+        if pixel_ndim is None:
+            pixel_ndim = len(dataset.shape)
+        self.pixel_ndim = pixel_ndim
+        self.block_ndim = min(block_ndim, pixel_ndim)
+        self.n_outer = pixel_ndim - self.block_ndim
+        self.outer_index = None
+        self._alloc_block()
+    
+    def _alloc_block(self):
+        shape = self.dataset.shape
+        self.block = np.zeros(shape[self.n_outer:], dtype=self.dataset.dtype)
+        self.mask = np.zeros(shape[self.n_outer:self.pixel_ndim], dtype=bool)
+        self.bbox_min = None
+        self.bbox_max = None
+    
+    @property
+    def shape(self):
+        return self.dataset.shape
+    
+    @property
+    def dtype(self):
+        return self.dataset.dtype
+    
+    @property
+    def name(self):
+        return self.dataset.name
+    
+    def __setitem__(self, key, value):
+        if not isinstance(key, tuple):
+            key = (key,)
+        # trailing slices over per-pixel value axes are ignored
+        index = tuple(int(x) for x in key[:self.pixel_ndim])
+        outer = index[:self.n_outer]
+        inner = index[self.n_outer:]
+        if outer != self.outer_index:
+            self.flush()
+            self.outer_index = outer
+        self.block[inner] = value
+        self.mask[inner] = True
+        if self.bbox_min is None:
+            self.bbox_min = list(inner)
+            self.bbox_max = list(inner)
+        else:
+            for ax, x in enumerate(inner):
+                if x < self.bbox_min[ax]: self.bbox_min[ax] = x
+                if x > self.bbox_max[ax]: self.bbox_max[ax] = x
+    
+    def flush(self):
+        """Write buffered pixels to the dataset"""
+        if self.bbox_min is None:
+            return
+        sl = tuple(slice(a, b+1) for a, b in zip(self.bbox_min, self.bbox_max))
+        target = self.outer_index + sl
+        mask = self.mask[sl]
+        if mask.all():
+            mask = None
+        # if block not fully written, only replace written pixels (mask)
+        if self.async_writer is None:
+            h5_write_block(self.dataset, target, self.block[sl], mask)
+        else:
+            if mask is not None:
+                mask = mask.copy()
+            self.async_writer.write(self.dataset, target, self.block[sl].copy(), mask)
+        self.mask[sl] = False
+        self.bbox_min = None
+        self.bbox_max = None
+    
+    def resize(self, *args, **kwargs):
+        """flush and resize the underlying dataset"""
+        self.flush()
+        if self.async_writer is not None:
+            self.async_writer.drain()
+        self.dataset.resize(*args, **kwargs)
+        if self.n_outer == 0:
+            self._alloc_block()
+
+
+class H5BufferedWriter(object):
+    """
+    Collection of :class:`H5DatasetBuffer` objects that are flushed together.
+    
+    Measurements register datasets that are filled pixel by pixel, 
+    and call :meth:`flush` at convenient points (e.g. slow moves) 
+    and :meth:`close` before closing the HDF5 file.
+    
+    Set :attr:`async_writer` before registering datasets to write
+    blocks in the background with an :class:`H5AsyncWriter`
+    """
+    
+    def __init__(self, block_ndim=1, async_writer=None):
+        self.block_ndim = block_ndim
+        self.async_writer = async_writer
+        self.buffers = []
+    
+    def register(self, dataset, block_ndim=None, pixel_ndim=None):
+        """
+        returns a :class:`H5DatasetBuffer` that wraps dataset,
+        write pixels to it instead of the dataset
+        """
+        if block_ndim is None:
+            block_ndim = self.block_ndim
+        buf = H5DatasetBuffer(dataset, block_ndim=block_ndim, pixel_ndim=pixel_ndim,
+                              async_writer=self.async_writer)
+        self.buffers.append(buf)
+        return buf
+    
+    def flush(self):
+        for buf in self.buffers:
+            buf.flush()
+    
+    def close(self):
+        self.flush()
+        self.buffers = []
+
+
+class H5LazyArray(object):
+    """
+    Read-only, lazily read array backed by an HDF5 dataset, 
+    or by the sub-array dataset[index] for an integer tuple *index*.
+    For arrays too large to load, e.g. (Ny, Nx, Nspec) hyperspectral cubes.
+    
+    Contiguous, unfiltered datasets are memory mapped, chunked or 
+    compressed datasets are read through h5py. Indexing reads only 
+    the selected part. :meth:`reduce_last_axis` and :meth:`roi_mean` 
+    stream through the data in slabs of at most ~:attr:`slab_bytes` 
+    along the first axis.
+    
+    The HDF5 file must stay open while the array is used.
+    """
+    
+    slab_bytes = 64*1024**2
+    
+    def __init__(self, dataset, index=()):
+        self.dataset = dataset
+        self.index = tuple(index)
+        self.shape = dataset.shape[len(self.index):]
+        self.dtype = dataset.dtype
+        self.ndim = len(self.shape)
+        self.memmap = self._open_memmap()
+        
+    def _open_memmap(self):
+        dset = self.dataset
+        if dset.chunks is not None or dset.dtype.hasobject or dset.size == 0:
+            return None
+        if dset.file.driver not in ('sec2', 'stdio', None) or dset.external:
+            return None
+        offset = dset.id.get_offset()
+        if offset is None:
+            # storage not allocated yet
+            return None
+        mm = np.memmap(dset.file.filename, dtype=dset.dtype, mode='r', 
+                       offset=offset, shape=dset.shape)
+        return mm[self.index] if self.index else mm
+    
+    @property
+    def is_memmap(self):
+        return self.memmap is not None
+    
+    def __len__(self):
+        return self.shape[0]
+    
+    @property
+    def size(self):
+        return int(np.prod(self.shape))
+    
+    def __getitem__(self, key):
+        if not isinstance(key, tuple):
+            key = (key,)
+        if self.memmap is not None:
+            return np.asarray(self.memmap[key])
+        return self.dataset[self.index + key]
+    
+    def __array__(self, dtype=None, copy=None):
+        a = self[...]
+        return a if dtype is None else a.astype(dtype)
+    
+    def _rows_per_slab(self, row_shape):
+        row_bytes = self.dtype.itemsize*max(1, int(np.prod(row_shape)))
+        n = max(1, self.slab_bytes // row_bytes)
+        chunks = self.dataset.chunks
+        if self.memmap is None and chunks is not None:
+            # whole chunks along the first axis
+            c = chunks[len(self.index)]
+            n = max(c, (n//c)*c)
+        return n
+    
+    def iter_slabs(self, key=()):
+        """
+        Yields (start, slab) of self[key] in blocks along the first axis,
+        start is relative to the selection. key[0] must be a slice 
+        with step 1 (or missing)
+        """
+        if not isinstance(key, tuple):
+            key = (key,)
+        s0 = key[0] if key else slice(None)
+        rest = key[1:]
+        start, stop, step = s0.indices(self.shape[0])
+        assert step == 1
+        row_shape = np.empty((0,)+self.shape[1:])[(slice(None),) + rest].shape[1:]
+        n = self._rows_per_slab(row_shape)
+        for a in range(start, stop, n):
+            b = min(a + n, stop)
+            yield a - start, self[(slice(a, b),) + rest]
+    
+    def reduce_last_axis(self, func=np.sum, dtype=float, callback=None):
+        """
+        Returns func(self, axis=-1), computed slab by slab,
+        for example an image of the integrated spectrum at each pixel.
+        *callback* is called after each slab, it may raise to abort
+        """
+        out = np.empty(self.shape[:-1], dtype=dtype)
+        for a, slab in self.iter_slabs():
+            out[a:a+len(slab)] = func(slab, axis=-1)
+            if callback is not None:
+                callback()
+        return out
     
+    def roi_mean(self, key):
+        """
+        Returns self[key].mean(axis=(0,1)), reading only the 
+        selected region slab by slab, e.g. the mean spectrum of 
+        a rectangular region of interest
+        """
+        total = None
+        n = 0
+        for a, slab in self.iter_slabs(key):
+            s = slab.sum(axis=(0,1), dtype=float)
+            total = s if total is None else total + s
+            n += slab.shape[0]*slab.shape[1]
+        if n == 0:
+            # empty selection, like numpy mean
+            sel_shape = np.empty((0,)+self.shape[1:])[(slice(None),)+tuple(key)[1:]].shape
+            return np.full(sel_shape[2:], np.nan)
+        return total/n
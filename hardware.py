@@ -71,6 +71,10 @@ class HardwareComponent(QtCore.QObject):
         
         self.auto_thread_lock = True
         
+        # optional function that reads many settings in one device query,
+        # see read_from_hardware
+        self.bulk_read_func = None
+        
         self.setup()
 
         if self.auto_thread_lock:        
@@ -165,11 +169,39 @@ class HardwareComponent(QtCore.QObject):
     def read_from_hardware(self):
         """
         Read all settings (:class:`LoggedQuantity`) connected to hardware states
+        
+        If :attr:`bulk_read_func` is set, it is called once while holding 
+        self.lock and must return a dict {lq_name: value}. Settings not in 
+        the dict are read with their own hardware_read_func.
+        Signals are sent once for each setting whose value changed.
         """
+        bulk_values = self.bulk_read_from_hardware()
         for name, lq in self.settings.as_dict().items():
-            if lq.has_hardware_read():
+            if name in bulk_values:
+                lq.update_value(bulk_values[name], update_hardware=False)
+            elif lq.has_hardware_read():
                 if self.debug_mode.val: self.log.debug("read_from_hardware {}".format(name) )
                 lq.read_from_hardware()
+    
+    def bulk_read_from_hardware(self):
+        """
+        Returns dict {lq_name: value} from :attr:`bulk_read_func`,
+        or an empty dict if no bulk read function is defined.
+        Does not update settings.
+        
+        To use, set self.bulk_read_func in :meth:`connect`, it is 
+        cleared on disconnect
+        """
+        if self.bulk_read_func is None:
+            return {}
+        with self.lock:
+            values = dict(self.bulk_read_func())
+        if self.debug_mode.val: self.log.debug("bulk_read_from_hardware {}".format(values))
+        for name in list(values.keys()):
+            if name not in self.settings:
+                self.log.warning("bulk_read_from_hardware: unknown setting {}".format(name))
+                del values[name]
+        return values
         
     
     def connect(self):
@@ -201,6 +233,7 @@ class HardwareComponent(QtCore.QObject):
             self.tree_item.setText(1,'X')
             self.tree_item.setForeground(1, QtGui.QColor('red'))
             self.disconnect()
+            self.bulk_read_func = None
             
             
     @property
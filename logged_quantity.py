@@ -5,6 +5,9 @@ import numpy as np
 from collections import OrderedDict
 import json
 import sys
+import time
+import threading
+import logging
 from ScopeFoundry.helper_funcs import get_logger_from_class, str2bool, QLock
 from ScopeFoundry.ndarray_interactive import ArrayLQ_QTableModel
 import pyqtgraph as pg
@@ -59,6 +62,9 @@ class LoggedQuantity(QtCore.QObject):
     # signal sent when read only (ro) status has changed 
     updated_readonly = QtCore.Signal((bool,), (),) 
     
+    # internal: queued to the LQ's thread to schedule a coalesced display update
+    _display_flush_requested = QtCore.Signal()
+    
     def __init__(self, name, dtype=float, 
                  hardware_read_func=None, hardware_set_func=None, 
                  initial=0, fmt="%g", si=False,
@@ -68,7 +74,8 @@ class LoggedQuantity(QtCore.QObject):
                  spinbox_step=0.1,
                  vmin=-1e12, vmax=+1e12, choices=None,
                  reread_from_hardware_after_write = False,
-                 description = None
+                 description = None,
+                 coalesce_interval = None
                  ):
         QtCore.QObject.__init__(self)
         
@@ -110,10 +117,26 @@ class LoggedQuantity(QtCore.QObject):
         self.widget_list = []
         self.listeners = []
         
+        # coalesced display updates, see set_coalesce_interval
+        self.coalesce_interval = coalesce_interval
+        self._display_pending = False
+        self._display_flush_scheduled = False
+        self._last_display_time = 0
+        self._display_flush_requested.connect(self._schedule_display_flush,
+                                              QtCore.Qt.QueuedConnection)
+        
         # threading lock
         #self.lock = threading.Lock()
         #self.lock = DummyLock()
         self.lock = QLock(mode=0) # mode 0 is non-reentrant lock
+        # serializes all calls of hardware_set_func, reentrant in case
+        # hardware_set_func updates the LQ itself
+        self.hw_write_lock = threading.RLock()
+        
+        # bound updated_value overloads, looking up 
+        # self.updated_value[type] on every update is slow
+        self._updated_value_signals = dict(
+            (t, self.updated_value[t]) for t in [(), str, float, int, bool])
         
     def coerce_to_type(self, x):
         """
@@ -168,7 +191,7 @@ class LoggedQuantity(QtCore.QObject):
             reread_hardware = self.reread_from_hardware_after_write
         # Read from Hardware
         if self.has_hardware_write():
-            with self.lock:
+            with self.lock, self.hw_write_lock:
                 self.hardware_set_func(self.val)
             if reread_hardware:
                 self.read_from_hardware(send_signal=False)
@@ -216,14 +239,22 @@ class LoggedQuantity(QtCore.QObject):
             if new_val is None:
                 new_val = self.sender().text()
     
-            self.oldval = self.coerce_to_type(self.val)
+            if self.is_array:
+                # copy, arrays may be modified in place
+                self.oldval = self.coerce_to_type(self.val)
+            else:
+                # self.val is always stored coerced
+                self.oldval = self.val
             new_val = self.coerce_to_type(new_val)
             
-            self.log.debug("{}: update_value {} --> {}    sender={}".format(self.name, self.oldval, new_val, self.sender()))
+            debug = self.log.isEnabledFor(logging.DEBUG)
+            if debug:
+                self.log.debug("{}: update_value {} --> {}    sender={}".format(self.name, self.oldval, new_val, self.sender()))
     
             # check for equality of new vs old, do not proceed if they are same
             if self.same_values(self.oldval, new_val):
-                self.log.debug("{}: same_value so returning {} {}".format(self.name, self.oldval, new_val))
+                if debug:
+                    self.log.debug("{}: same_value so returning {} {}".format(self.name, self.oldval, new_val))
                 return
             else:
                 pass
@@ -234,13 +265,46 @@ class LoggedQuantity(QtCore.QObject):
         
         # Read from Hardware
         if update_hardware and self.hardware_set_func:
-            self.hardware_set_func(self.val)
+            with self.hw_write_lock:
+                self.hardware_set_func(self.val)
             if reread_hardware:
                 self.read_from_hardware(send_signal=False)
         # Send Qt Signals
         if send_signal:
             self.send_display_updates()
             
+    def update_value_fast(self, new_val, update_hardware=True, send_signal=True):
+        """
+        High-rate version of :meth:`update_value` for use from acquisition
+        threads, for example per-pixel stage moves.
+        
+        Does not take self.lock, does not log and only coerces new_val if 
+        it is not already of the LQ's dtype. The stored value is replaced 
+        with a single reference assignment, which is atomic in Python.
+        Hardware writes are serialized by self.hw_write_lock (like those
+        of update_value and write_to_hardware) and always send the 
+        latest stored value, so the hardware ends up in the 
+        state of the last update even if several threads race. 
+        LQ's with reread_from_hardware_after_write use :meth:`update_value`.
+        
+        Not for use as a Qt slot, new_val is required.
+        """
+        if self.reread_from_hardware_after_write:
+            return self.update_value(new_val, update_hardware=update_hardware, 
+                                     send_signal=send_signal)
+        if type(new_val) is not self.dtype:
+            new_val = self.coerce_to_type(new_val)
+        oldval = self.val
+        if self.same_values(oldval, new_val):
+            return
+        self.val = new_val
+        self.oldval = oldval
+        if update_hardware and self.hardware_set_func:
+            with self.hw_write_lock:
+                self.hardware_set_func(self.val)
+        if send_signal:
+            self.send_display_updates()
+            
     def send_display_updates(self, force=False):
         """
         Emit updated_value signals if value has changed.
@@ -254,17 +318,22 @@ class LoggedQuantity(QtCore.QObject):
         
         """
         #self.log.debug("send_display_updates: {} force={}".format(self.name, force))
+        if self._coalesce_display_updates(force):
+            return
         if (not self.same_values(self.oldval, self.val)) or (force):
-            self.updated_value[()].emit()
+            signals = self._updated_value_signals
+            signals[()].emit()
             
-            str_val = self.string_value()
-            self.updated_value[str].emit(str_val)
-            self.updated_text_value.emit(str_val)
+            # skip string formatting if nobody is listening
+            if self._has_text_listeners():
+                str_val = self.string_value()
+                signals[str].emit(str_val)
+                self.updated_text_value.emit(str_val)
                 
             if self.dtype in [float, int]:
-                self.updated_value[float].emit(self.val)
-                self.updated_value[int].emit(int(self.val))
-            self.updated_value[bool].emit(bool(self.val))
+                signals[float].emit(self.val)
+                signals[int].emit(int(self.val))
+            signals[bool].emit(bool(self.val))
             
             if self.choices is not None:
                 choice_vals = [c[1] for c in self.choices]
@@ -275,6 +344,63 @@ class LoggedQuantity(QtCore.QObject):
             # no updates sent
             pass
     
+    def _has_text_listeners(self):
+        return (self.receivers(self._updated_value_signals[str]) > 0 
+                or self.receivers(self.updated_text_value) > 0)
+    
+    def set_coalesce_interval(self, interval):
+        """
+        Enable coalesced display updates: updated_value signals are emitted
+        at most once per *interval* seconds, carrying only the latest value.
+        Intermediate values are never emitted. Useful for LQ's updated at
+        high rates from a measurement thread.
+        
+        Pending updates are emitted by a timer in the LQ's (GUI) thread,
+        or immediately by :meth:`flush_display_updates`.
+        
+        *interval* None or 0 disables coalescing
+        """
+        self.coalesce_interval = interval
+        if not interval:
+            self.flush_display_updates()
+    
+    def _coalesce_display_updates(self, force):
+        """
+        Called by send_display_updates. Returns True if the update is
+        handled (sent now or deferred) by coalescing.
+        """
+        if not self.coalesce_interval or force:
+            return False
+        if self.oldval is not None and self.same_values(self.oldval, self.val):
+            return True
+        self._display_pending = True
+        if time.time() - self._last_display_time >= self.coalesce_interval:
+            self.flush_display_updates()
+        elif not self._display_flush_scheduled:
+            self._display_flush_scheduled = True
+            self._display_flush_requested.emit()
+        return True
+    
+    def _schedule_display_flush(self):
+        delay = self.coalesce_interval - (time.time() - self._last_display_time)
+        QtCore.QTimer.singleShot(int(max(0, delay or 0)*1000), self._on_display_flush_timer)
+    
+    def _on_display_flush_timer(self):
+        self._display_flush_scheduled = False
+        self.flush_display_updates()
+    
+    def flush_display_updates(self):
+        """
+        Emit a pending coalesced display update now, with the latest value.
+        Does nothing if no update is pending.
+        """
+        if self._display_pending:
+            # clear before emitting, so an update arriving during 
+            # the emit is not lost
+            self._display_pending = False
+            self._last_display_time = time.time()
+            self.send_display_updates(force=True)
+    
     def same_values(self, v1, v2):
         """ 
         Compares two values of the LQ type, used in update_value
@@ -554,11 +680,17 @@ class LoggedQuantity(QtCore.QObject):
                 if type(widget) == QtWidgets.QComboBox:
                     # need to have a choice list to connect to a QComboBox
                     assert self.choices is not None 
+                    # repopulating emits currentIndexChanged, which would
+                    # call update_value while holding self.lock
+                    widget.blockSignals(True)
                     widget.clear() # removes all old choices
                     for choice_name, choice_value in self.choices:
                         widget.addItem(choice_name, choice_value)
+                    widget.blockSignals(False)
                 else:
                     raise RuntimeError("Invalid widget type.")
+        # show current value in the new choice lists
+        self.send_display_updates(force=True)
     
     def change_min_max(self, vmin=-1e12, vmax=+1e12):
         # TODO  setRange should be a slot for the updated_min_max signal
@@ -666,7 +798,8 @@ class ArrayLQ(LoggedQuantity):
                  initial=[], fmt="%g", si=True,
                  ro = False,
                  unit = None,
-                 vmin=-1e12, vmax=+1e12, choices=None):
+                 vmin=-1e12, vmax=+1e12, choices=None,
+                 coalesce_interval = None):
         QtCore.QObject.__init__(self)
         
         self.name = name
@@ -700,8 +833,17 @@ class ArrayLQ(LoggedQuantity):
         self.widget_list = []
         self.listeners = []
 
+        # coalesced display updates, see set_coalesce_interval
+        self.coalesce_interval = coalesce_interval
+        self._display_pending = False
+        self._display_flush_scheduled = False
+        self._last_display_time = 0
+        self._display_flush_requested.connect(self._schedule_display_flush,
+                                              QtCore.Qt.QueuedConnection)
+
         # threading lock
         self.lock = QLock(mode=0) # mode 0 is non-reentrant lock
+        self.hw_write_lock = threading.RLock()
         
         self.is_array = True
         
@@ -738,6 +880,8 @@ class ArrayLQ(LoggedQuantity):
         return np.array(x, dtype=self.dtype)
     
     def send_display_updates(self, force=False):
+        if self._coalesce_display_updates(force):
+            return
         with self.lock:            
             self.log.debug(self.name + ' send_display_updates')
             #print "send_display_updates: {} force={}".format(self.name, force)
@@ -917,6 +1061,9 @@ class LQCollection(object):
         self._logged_quantities = OrderedDict()
         self.ranges = OrderedDict()
         
+        # default coalesce_interval for LQ's created with New()
+        self.coalesce_interval = None
+        
         self.log = get_logger_from_class(self)
         
     def New(self, name, dtype=float, **kwargs):
@@ -925,6 +1072,8 @@ class LQCollection(object):
         """
         
         is_array = kwargs.pop('array', False)
+        if self.coalesce_interval:
+            kwargs.setdefault('coalesce_interval', self.coalesce_interval)
         #self.log.debug("{} is_array? {}".format(name, is_array))
         if is_array:
             lq = ArrayLQ(name=name, dtype=dtype, **kwargs)
@@ -950,6 +1099,24 @@ class LQCollection(object):
     def get_lq(self, key):
         return self._logged_quantities[key]
     
+    def set_coalesce_interval(self, interval, include=None):
+        """
+        Enable coalesced display updates (see 
+        :meth:`LoggedQuantity.set_coalesce_interval`) for the LQ's
+        named in *include*, or for all LQ's in the collection,
+        including those created later with :meth:`New`, if include is None
+        """
+        if include is None:
+            self.coalesce_interval = interval
+            include = self.keys()
+        for name in include:
+            self._logged_quantities[name].set_coalesce_interval(interval)
+    
+    def flush_display_updates(self):
+        "Emit all pending coalesced display updates"
+        for lq in self.as_list():
+            lq.flush_display_updates()
+    
     def get_val(self, key):
         return self._logged_quantities[key].val
     
@@ -8,11 +8,15 @@ from __future__ import absolute_import, print_function
 from qtpy import QtCore, QtWidgets
 import threading
 import time
+import os
+import pstats
+from datetime import datetime
 from .logged_quantity import LQCollection
 from .helper_funcs import load_qt_ui_file
 from collections import OrderedDict
 import pyqtgraph as pg
 from ScopeFoundry.helper_funcs import get_logger_from_class
+from ScopeFoundry import profiling
 
 class MeasurementQThread(QtCore.QThread):
     def __init__(self, measurement, parent=None):
@@ -73,7 +77,15 @@ class Measurement(QtCore.QObject):
         self.activation = self.settings.New('activation', dtype=bool, ro=False) # does the user want to the thread to be running
         self.running    = self.settings.New('running', dtype=bool, ro=True) # is the thread actually running?
         self.progress   = self.settings.New('progress', dtype=float, unit="%", si=False, ro=True)
+        # throttled progress reporting, see start_progress
+        self.settings.New('progress_update_rate', dtype=float, initial=10., vmin=0.01, unit='Hz')
+        self.settings.New('progress_rate', dtype=float, ro=True, unit='/s', si=True)
+        self.settings.New('progress_eta', dtype=float, ro=True, unit='s', si=True)
+        self.start_progress(0)
         self.settings.New('profile', dtype=bool, initial=False) # Run a profile on the run to find performance problems
+        # low overhead statistical profile of run, see profiling.SamplingProfiler
+        self.settings.New('profile_sampling', dtype=bool, initial=False)
+        self.settings.New('profile_sample_interval', dtype=float, initial=0.01, vmin=0.001, unit='s', si=True)
 
         self.activation.updated_value[bool].connect(self.start_stop)
 
@@ -169,16 +181,25 @@ class Measurement(QtCore.QObject):
         This function governs the behavior of the measurement thread. 
         """
         self.set_progress(50.) # set progress bars to default run position at 50%
+        profile = sampler = None
+        prev_h5_filename = getattr(self, 'h5_filename', None)
         try:
             if self.settings['profile']:
                 import cProfile
                 profile = cProfile.Profile()
                 profile.enable()
+            if self.settings['profile_sampling']:
+                sampler = profiling.SamplingProfiler(interval=self.settings['profile_sample_interval'])
+                sampler.start()
             self.run()
         #except Exception as err:
         #    self.interrupt_measurement_called = True
         #    raise err
         finally:
+            # make sure coalesced display updates show final values
+            self.settings.flush_display_updates()
+            for hw in getattr(self.app, 'hardware', {}).values():
+                hw.settings.flush_display_updates()
             self.running.update_value(False)
             self.activation.update_value(False)
             self.set_progress(0.) # set progress bars back to zero
@@ -188,9 +209,45 @@ class Measurement(QtCore.QObject):
                 self.interrupt_measurement_called = False
             else:
                 self.measurement_sucessfully_completed.emit()
-            if self.settings['profile']:
+            if profile is not None:
                 profile.disable()
-                profile.print_stats(sort='time')   
+            if sampler is not None:
+                sampler.stop()
+            if profile is not None or sampler is not None:
+                try:
+                    self.save_profiles(self.profile_fname_base(prev_h5_filename), 
+                                       profile, sampler)
+                except Exception as err:
+                    self.log.error("failed to save profiles: {}".format(err))
+    
+    def profile_fname_base(self, prev_h5_filename=None):
+        """
+        Path without extension for profile files of a run: the h5 file
+        of the run (self.h5_filename, if different from *prev_h5_filename*),
+        or the name its h5 file would have in save_dir
+        """
+        fname = getattr(self, 'h5_filename', None)
+        if not fname or fname == prev_h5_filename:
+            t0 = getattr(self, 't_start', time.time())
+            fname = os.path.join(self.app.settings['save_dir'], 
+                                 self.app.settings['data_fname_format'].format(
+                                     app=self.app, measurement=self,
+                                     timestamp=datetime.fromtimestamp(t0), ext='h5'))
+        return os.path.splitext(fname)[0]
+    
+    def save_profiles(self, fname_base, profile=None, sampler=None):
+        """
+        Save cProfile *profile* to <fname_base>_profile.pstats and
+        <fname_base>_profile.collapsed, and the stacks of 
+        profiling.SamplingProfiler *sampler* to <fname_base>_sampling.collapsed
+        """
+        if profile is not None:
+            profile.dump_stats(fname_base + "_profile.pstats")
+            stacks = profiling.pstats_to_collapsed(pstats.Stats(profile))
+            profiling.save_collapsed(stacks, fname_base + "_profile.collapsed")
+            self.log.info("profile saved to {}_profile.pstats".format(fname_base))
+        if sampler is not None:
+            sampler.save(fname_base + "_sampling.collapsed")
     
             
 
@@ -210,6 +267,52 @@ class Measurement(QtCore.QObject):
         ==============  ==============================================================================================
         """
         self.progress.update_value(pct)
+    
+    def start_progress(self, total, count=0):
+        """
+        Start reporting progress of *total* steps (e.g. pixels) from the
+        run thread with :meth:`advance_progress` or :meth:`set_progress_count`.
+        These are cheap to call every step, progress, progress_rate 
+        (steps/s) and progress_eta (s) are updated at most 
+        progress_update_rate times per second.
+        """
+        self._progress_total = total
+        self._progress_count = count
+        self._progress_t0 = time.time()
+        self._progress_count0 = count
+        self._progress_next_t = 0
+        if total:
+            self._push_progress()
+    
+    def advance_progress(self, n=1):
+        "add *n* completed steps"
+        self._progress_count += n
+        if time.time() >= self._progress_next_t:
+            self._push_progress()
+    
+    def set_progress_count(self, count):
+        "set number of completed steps"
+        self._progress_count = count
+        if time.time() >= self._progress_next_t:
+            self._push_progress()
+    
+    def finish_progress(self):
+        "report current progress now"
+        self._push_progress()
+    
+    def _push_progress(self):
+        t = time.time()
+        self._progress_next_t = t + 1.0/self.settings['progress_update_rate']
+        count, total = self._progress_count, self._progress_total
+        if not total:
+            return
+        S = self.settings
+        S.progress.update_value_fast(100.0*count/total)
+        dt = t - self._progress_t0
+        if dt > 0:
+            rate = (count - self._progress_count0)/dt
+            S.progress_rate.update_value_fast(rate)
+            S.progress_eta.update_value_fast((total - count)/rate if rate > 0 else 0.0)
                 
     @QtCore.Slot()
     def interrupt(self):
@@ -378,7 +481,7 @@ class Measurement(QtCore.QObject):
         #self.tree_item.setFirstColumnSpanned(True)
         self.tree_progressBar = QtWidgets.QProgressBar()
         tree.setItemWidget(self.tree_item, 1, self.tree_progressBar)
-        self.progress.updated_value.connect(self.tree_progressBar.setValue)
+        self.progress.updated_value[int].connect(self.tree_progressBar.setValue)
 
         # Add logged quantities to tree
         self.settings.add_widgets_to_subtree(self.tree_item)
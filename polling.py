@@ -0,0 +1,192 @@
+from __future__ import absolute_import, print_function, division
+from ScopeFoundry.helper_funcs import get_logger_from_class
+from collections import OrderedDict
+import threading
+import time
+
+try:
+    import queue
+except ImportError: # python 2
+    import Queue as queue
+
+
+class PollEntry(object):
+    """
+    A LoggedQuantity of a HardwareComponent polled every *interval* seconds,
+    with its polling statistics
+    """
+
+    def __init__(self, hw, lq, interval):
+        self.hw = hw
+        self.lq = lq
+        self.interval = interval
+        self.next_time = time.time()
+        self.polls = 0
+        self.skipped = 0   # hardware not connected
+        self.overruns = 0  # poll still running, or missed periods
+        self.errors = 0
+        self.jitter_sum = 0.0
+        self.jitter_max = 0.0
+
+    def stats(self):
+        return dict(interval=self.interval,
+                    polls=self.polls,
+                    skipped=self.skipped,
+                    overruns=self.overruns,
+                    errors=self.errors,
+                    jitter_mean=self.jitter_sum/self.polls if self.polls else 0.0,
+                    jitter_max=self.jitter_max)
+
+
+class PollingScheduler(object):
+    """
+    Periodically reads LoggedQuantities of HardwareComponents from hardware.
+
+    Each registered LQ has its own polling interval. A scheduler thread
+    dispatches due reads to a pool of *n_workers* worker threads.
+    Reads of the same HardwareComponent due within *merge_window*
+    seconds of each other are merged into one task, which holds the
+    hardware's lock once and uses the hardware's bulk_read_func, if it
+    provides the values. Each HardwareComponent has at most one task
+    running at a time, disconnected hardware is skipped.
+
+    Statistics per LQ (see :meth:`stats`): number of polls, skipped polls,
+    overruns (the previous poll of the hardware was still running, or
+    whole periods were missed), errors, and jitter (delay between
+    scheduled and actual read time).
+
+    The scheduler thread starts with the first :meth:`register`.
+    """
+
+    def __init__(self, n_workers=2, merge_window=0.005):
+        self.n_workers = n_workers
+        self.merge_window = merge_window
+        self.log = get_logger_from_class(self)
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self._busy_hw = set()
+        self._wakeup = threading.Event()
+        self._tasks = queue.Queue()
+        self._running = False
+        self.thread = None
+        self.workers = []
+
+    def register(self, hw, lq_name, interval):
+        """
+        Poll setting *lq_name* of HardwareComponent *hw* every *interval*
+        seconds. Registering an already polled LQ changes its interval.
+        """
+        assert interval > 0
+        lq = hw.settings.get_lq(lq_name)
+        with self.lock:
+            self.entries[(hw.name, lq_name)] = PollEntry(hw, lq, interval)
+        if not self._running:
+            self.start()
+        self._wakeup.set()
+
+    def unregister(self, hw, lq_name):
+        with self.lock:
+            self.entries.pop((hw.name, lq_name), None)
+
+    def start(self):
+        if self._running:
+            return
+        self._running = True
+        self.thread = threading.Thread(target=self._run_scheduler, name='PollingScheduler')
+        self.thread.daemon = True
+        self.thread.start()
+        self.workers = []
+        for i in range(self.n_workers):
+            worker = threading.Thread(target=self._run_worker, name='PollingWorker{}'.format(i))
+            worker.daemon = True
+            worker.start()
+            self.workers.append(worker)
+
+    def stop(self, timeout=1.0):
+        """
+        Stop polling and wait up to *timeout* seconds for
+        running reads to finish
+        """
+        if not self._running:
+            return
+        self._running = False
+        self._wakeup.set()
+        for worker in self.workers:
+            self._tasks.put(None)
+        for thread in [self.thread] + self.workers:
+            thread.join(timeout)
+        self.log_stats()
+
+    def stats(self):
+        "Returns dict {(hw_name, lq_name): stats_dict}"
+        with self.lock:
+            return OrderedDict((key, e.stats()) for key, e in self.entries.items())
+
+    def log_stats(self):
+        for (hw_name, lq_name), s in self.stats().items():
+            self.log.info("{}.{} every {interval}s: {polls} polls, {skipped} skipped, "
+                          "{overruns} overruns, {errors} errors, jitter mean {jitter_mean:.2e}s "
+                          "max {jitter_max:.2e}s".format(hw_name, lq_name, **s))
+
+    def _run_scheduler(self):
+        while self._running:
+            now = time.time()
+            due = OrderedDict()
+            with self.lock:
+                next_time = now + 1.0
+                for e in self.entries.values():
+                    if e.next_time <= now + self.merge_window:
+                        if not e.hw.settings['connected']:
+                            e.skipped += 1
+                        elif e.hw.name in self._busy_hw:
+                            e.overruns += 1
+                        else:
+                            due.setdefault(e.hw.name, []).append((e, e.next_time))
+                        # schedule next poll, dropping whole missed periods
+                        missed = int((now - e.next_time)//e.interval)
+                        if missed > 0:
+                            e.overruns += missed
+                        e.next_time += (max(missed, 0) + 1)*e.interval
+                    next_time = min(next_time, e.next_time)
+                for hw_name, hw_entries in due.items():
+                    self._busy_hw.add(hw_name)
+                    self._tasks.put(hw_entries)
+            self._wakeup.wait(max(0, next_time - time.time()))
+            self._wakeup.clear()
+
+    def _run_worker(self):
+        while True:
+            task = self._tasks.get()
+            if task is None:
+                break
+            hw = task[0][0].hw
+            try:
+                self._poll(hw, task)
+            except Exception as err:
+                self.log.error("polling {} failed: {}".format(hw.name, err))
+                with self.lock:
+                    for e, t_sched in task:
+                        e.errors += 1
+            finally:
+                with self.lock:
+                    self._busy_hw.discard(hw.name)
+
+    def _poll(self, hw, task):
+        values = {}
+        t_read = time.time()
+        # single lock acquisition and device query for all due reads
+        with hw.lock:
+            if hw.bulk_read_func is not None:
+                values.update(hw.bulk_read_func())
+            for e, t_sched in task:
+                if e.lq.name not in values and e.lq.has_hardware_read():
+                    values[e.lq.name] = e.lq.hardware_read_func()
+        with self.lock:
+            for e, t_sched in task:
+                jitter = abs(t_read - t_sched)
+                e.polls += 1
+                e.jitter_sum += jitter
+                e.jitter_max = max(e.jitter_max, jitter)
+        for e, t_sched in task:
+            if e.lq.name in values:
+                e.lq.update_value(values[e.lq.name], update_hardware=False)
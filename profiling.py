@@ -0,0 +1,213 @@
+"""
+Profiles of Measurement runs (see the profile and profile_sampling
+settings of Measurement), saved next to the measurement's h5 file as
+
+* <name>_profile.pstats: cProfile stats, e.g. for pstats or snakeviz
+* <name>_profile.collapsed: the same as collapsed stacks
+* <name>_sampling.collapsed: collapsed stacks of the SamplingProfiler
+
+Collapsed stack files have one line per call stack, "root;...;leaf weight"
+with the weight in microseconds, as used by flamegraph.pl and speedscope.
+They can be viewed and compared in the DataBrowser's profile_view.
+"""
+from __future__ import absolute_import, print_function, division
+from ScopeFoundry.helper_funcs import get_logger_from_class
+from collections import OrderedDict, defaultdict
+import os
+import pstats
+import sys
+import threading
+import time
+
+try:
+    from threading import get_ident
+except ImportError: # python 2
+    from thread import get_ident
+
+
+def code_label(filename, lineno, funcname):
+    "label of a function in collapsed stacks: 'funcname (file.py:lineno)'"
+    if filename == '~': # builtins in pstats
+        return funcname
+    return "{} ({}:{})".format(funcname, os.path.basename(filename), lineno).replace(';', ':')
+
+
+def pstats_to_collapsed(stats, max_depth=64, min_time=1e-6):
+    """
+    Approximate collapsed stacks {(root, ..., leaf): microseconds} from
+    pstats.Stats *stats*, which only record caller-callee pairs: the time
+    of a function called from several callers is split between the
+    stacks in proportion to the cumulative time of each call edge.
+    Recursive calls are cut, as are stacks deeper than *max_depth* or
+    with less than *min_time* seconds.
+    """
+    children = defaultdict(dict)
+    for func, (cc, nc, tt, ct, callers) in stats.stats.items():
+        for caller, edge in callers.items():
+            # edge is (cc, nc, tt, ct), or a call count in old profilers
+            edge_ct = edge[3] if isinstance(edge, tuple) else ct
+            children[caller][func] = edge_ct
+    labels = dict((func, code_label(*func)) for func in stats.stats)
+    stacks = defaultdict(float)
+
+    def walk(func, funcs, path, frac):
+        tt, ct = stats.stats[func][2:4]
+        funcs = funcs + (func,)
+        path = path + (labels[func],)
+        if tt*frac > 0:
+            stacks[path] += 1e6*tt*frac
+        if len(path) >= max_depth:
+            return
+        for child, edge_ct in children[func].items():
+            if child in funcs:
+                continue
+            child_ct = stats.stats[child][3]
+            if child_ct <= 0 or edge_ct*frac < min_time:
+                continue
+            walk(child, funcs, path, min(1.0, frac*edge_ct/child_ct))
+
+    for func, (cc, nc, tt, ct, callers) in stats.stats.items():
+        if not callers:
+            walk(func, (), (), 1.0)
+    return dict(stacks)
+
+
+def save_collapsed(stacks, fname):
+    "save collapsed stacks {(root, ..., leaf): weight} to text file *fname*"
+    with open(fname, 'w') as f:
+        for stack, weight in sorted(stacks.items()):
+            f.write("{} {}\n".format(";".join(stack), int(round(weight))))
+
+
+def load_collapsed(fname):
+    "load collapsed stacks file, returns {(root, ..., leaf): weight}"
+    stacks = defaultdict(float)
+    with open(fname, 'r') as f:
+        for line in f:
+            stack, _, weight = line.strip().rpartition(' ')
+            if not stack:
+                continue
+            stacks[tuple(stack.split(';'))] += float(weight)
+    return dict(stacks)
+
+
+def load_profile(fname):
+    "load a .pstats or collapsed stacks file as collapsed stacks"
+    if os.path.splitext(fname)[1] in ('.pstats', '.prof'):
+        return pstats_to_collapsed(pstats.Stats(fname))
+    return load_collapsed(fname)
+
+
+def function_times(stacks):
+    """
+    Returns OrderedDict {label: (self_time, total_time)} of collapsed
+    *stacks*, sorted by decreasing self time. Self time is the weight of
+    stacks ending in a function, total time of stacks containing it.
+    """
+    self_time = defaultdict(float)
+    total_time = defaultdict(float)
+    for stack, weight in stacks.items():
+        self_time[stack[-1]] += weight
+        for label in set(stack):
+            total_time[label] += weight
+    order = sorted(total_time, key=lambda label: (-self_time[label], -total_time[label]))
+    return OrderedDict((label, (self_time[label], total_time[label])) for label in order)
+
+
+def icicle_rects(stacks, min_fraction=0.001):
+    """
+    Layout of an icicle (upside down flame) graph of collapsed *stacks*:
+    list of (x0, depth, width, label), with x0 and width in units of
+    the total weight, nodes with less than *min_fraction* of the total
+    weight are dropped. Children are sorted by label.
+    """
+    tree = {}
+    for stack, weight in stacks.items():
+        node = tree
+        for label in stack:
+            child = node.setdefault(label, [0.0, {}])
+            child[0] += weight
+            node = child[1]
+    total = sum(child[0] for child in tree.values())
+    rects = []
+    if total <= 0:
+        return rects
+
+    def layout(node, x0, depth):
+        for label in sorted(node):
+            weight, children = node[label]
+            if weight >= min_fraction*total:
+                rects.append((x0, depth, weight, label))
+                layout(children, x0, depth + 1)
+            x0 += weight
+
+    layout(tree, 0.0, 0)
+    return rects
+
+
+class SamplingProfiler(object):
+    """
+    Statistical profiler of one thread: a daemon thread samples the call
+    stack of thread *thread_ident* (default: the thread creating the
+    profiler) every *interval* seconds and adds the time since the
+    previous sample to the stack's weight.
+
+    Unlike cProfile, the profiled thread runs without tracing hooks,
+    the overhead is one stack walk per sample, so it can be left
+    running. Time spent in C functions (e.g. time.sleep) is attributed
+    to the calling Python function.
+    """
+
+    def __init__(self, thread_ident=None, interval=0.01):
+        self.log = get_logger_from_class(self)
+        self.thread_ident = get_ident() if thread_ident is None else thread_ident
+        self.interval = interval
+        self.lock = threading.Lock()
+        self.stacks = defaultdict(float)
+        self.n_samples = 0
+        self._labels = {}
+        self._stop = threading.Event()
+        self.thread = None
+
+    def start(self):
+        self._stop.clear()
+        self.thread = threading.Thread(target=self._run, name="SamplingProfiler")
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+
+    def _label(self, code):
+        label = self._labels.get(code)
+        if label is None:
+            label = self._labels[code] = code_label(code.co_filename, code.co_firstlineno,
+                                                    code.co_name)
+        return label
+
+    def _run(self):
+        t_prev = time.time()
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_ident)
+            t = time.time()
+            dt, t_prev = t - t_prev, t
+            stack = []
+            while frame is not None:
+                stack.append(self._label(frame.f_code))
+                frame = frame.f_back
+            del frame
+            if not stack:
+                continue
+            stack.reverse()
+            with self.lock:
+                self.stacks[tuple(stack)] += 1e6*dt
+                self.n_samples += 1
+
+    def save(self, fname):
+        with self.lock:
+            stacks = dict(self.stacks)
+        save_collapsed(stacks, fname)
+        self.log.info("{} samples saved to {}".format(self.n_samples, fname))
@@ -1,3 +1,4 @@
 from .base_raster_scan import BaseRaster2DScan
 from .base_raster_slow_scan import BaseRaster2DSlowScan
-from .base_raster_frame_slow_scan import BaseRaster2DFrameSlowScan
\ No newline at end of file
+from .base_raster_frame_slow_scan import BaseRaster2DFrameSlowScan
+from .base_raster_buffered_scan import BaseRaster2DBufferedScan
\ No newline at end of file
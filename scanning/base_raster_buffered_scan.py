@@ -0,0 +1,172 @@
+from __future__ import division, print_function, absolute_import
+from .base_raster_scan import BaseRaster2DScan
+from ScopeFoundry import h5_io
+import numpy as np
+import time
+
+
+class BaseRaster2DBufferedScan(BaseRaster2DScan):
+    """
+    Hardware-timed raster scan: the scan path positions are written in
+    blocks of block_size pixels to an output device that clocks them out
+    at 1/pixel_time, and the acquired samples are read back in blocks and
+    scattered into display_image_map with vectorized (k, j, i) indexing.
+    There are no per-pixel Python calls.
+
+    While block n is read, blocks up to n + blocks_ahead are already
+    written, so the device's output buffer does not run empty.
+
+    The default device hooks use self.daq, a HardwareComponent with
+    start_buffered(sample_rate) (returns the actual rate),
+    write_block(h, v), read_block(n) (returns array of shape
+    (n, n_channels)) and stop_buffered(), e.g.
+    ScopeFoundry.examples.hardware.dummy_daq.DummyBufferedDAQHW.
+    Set self.daq in :meth:`scan_specific_setup` or :meth:`pre_scan_setup`,
+    or override the hooks for other devices.
+
+    Acquired samples of all channels are stored in self.data_map, of
+    shape scan_shape + (n_channels,), and saved to h5 as 'daq_data'.
+    Override :meth:`process_block` to process samples differently.
+    """
+
+    name = "base_raster_2Dbufferedscan"
+
+    blocks_ahead = 2
+
+    def setup(self):
+        BaseRaster2DScan.setup(self)
+        self.settings.pixel_time.change_readonly(False)
+        self.settings['pixel_time'] = 1e-6
+        self.settings.New('block_size', dtype=int, initial=4096, vmin=1)
+        # actual rate of the device, see start_buffered_scan
+        self.settings.New('sample_rate', dtype=float, ro=True, unit='Hz', si=True)
+        self.run_pixel_time = None
+
+    def compute_times(self):
+        "line_time, frame_time and total_time, at 1/sample_rate during a run"
+        S = self.settings
+        pixel_time = getattr(self, 'run_pixel_time', None) or S['pixel_time']
+        S['line_time']  = pixel_time * S['Nh']
+        S['frame_time'] = pixel_time * self.Npixels
+        S['total_time'] = S['frame_time'] * S['n_frames']
+
+    def run(self):
+        S = self.settings
+
+        self.compute_scan_path()
+
+        self.initial_scan_setup_plotting = True
+
+        self.display_image_map = np.zeros(self.scan_shape, dtype=float)
+        self.reset_dirty_rows()
+
+        while not self.interrupt_measurement_called:
+            try:
+                self.t0 = time.time()
+
+                if S['save_h5']:
+                    self.h5_file = h5_io.h5_base_file(self.app, measurement=self)
+                    self.h5_filename = self.h5_file.filename
+
+                    self.h5_file.attrs['time_id'] = self.t0
+                    H = self.h5_meas_group = h5_io.h5_create_measurement_group(self, self.h5_file)
+
+                    #create h5 data arrays
+                    H['h_array'] = self.h_array
+                    H['v_array'] = self.v_array
+                    H['range_extent'] = self.range_extent
+                    H['corners'] = self.corners
+                    H['imshow_extent'] = self.imshow_extent
+                    self.scan_path.save_to_h5(H)
+
+                self.pixel_i = 0
+                self.current_scan_index = self.scan_path.index(0)
+                self.data_map = None
+
+                self.pre_scan_setup()
+
+                S['sample_rate'] = self.start_buffered_scan(1.0/S['pixel_time'])
+                # the device may not support the requested pixel_time, 
+                # during the run the times follow its actual rate
+                self.run_pixel_time = 1.0/S['sample_rate']
+                self.compute_times()
+                if S['save_h5']:
+                    settings_group = self.h5_meas_group['settings']
+                    for lq_name in ['sample_rate', 'line_time', 'frame_time', 'total_time']:
+                        settings_group.attrs[lq_name] = S[lq_name]
+                try:
+                    self.run_blocks()
+                finally:
+                    self.stop_buffered_scan()
+                    self.run_pixel_time = None
+                    self.compute_times()
+
+                if S['save_h5'] and self.data_map is not None:
+                    self.h5_meas_group['daq_data'] = self.data_map
+            finally:
+                self.post_scan_cleanup()
+                if S['save_h5'] and hasattr(self, 'h5_file'):
+                    try:
+                        self.h5_file.close()
+                    except ValueError as err:
+                        self.log.warning('failed to close h5_file: {}'.format(err))
+            if not S['continuous_scan']:
+                break
+
+    def run_blocks(self):
+        "write positions and read samples block by block for one pass of the scan path"
+        written = []
+        self.start_progress(self.Npixels)
+        blocks = self.scan_path.iter_chunks(self.settings['block_size'])
+        # fill the output buffer
+        for start, block in blocks:
+            self.write_positions(block[0], block[1])
+            written.append((start, block))
+            if len(written) > self.blocks_ahead:
+                break
+        while written:
+            if self.interrupt_measurement_called:
+                break
+            start, (h, v, slow_move, k, j, i) = written.pop(0)
+            samples = self.read_samples(len(h))
+            # keep the output buffer ahead of acquisition
+            for next_start, next_block in blocks:
+                self.write_positions(next_block[0], next_block[1])
+                written.append((next_start, next_block))
+                break
+            self.process_block(start, samples, k, j, i)
+            self.pixel_i = start + len(h) - 1
+            self.current_scan_index = (k[-1], j[-1], i[-1])
+            self.set_progress_count(self.pixel_i+1)
+        self.finish_progress()
+
+    def process_block(self, start, samples, k, j, i):
+        """
+        Store *samples* (shape (n, n_channels)) acquired at scan indices
+        k, j, i (arrays of length n) in data_map, channel 0 is displayed
+        """
+        if self.data_map is None:
+            self.data_map = np.zeros(self.scan_shape + samples.shape[1:], dtype=samples.dtype)
+        self.data_map[k, j, i] = samples
+        self.display_image_map[k, j, i] = samples[:, 0]
+        self.mark_dirty_row(k, j)
+        self.mark_dirty_column(k, i)
+
+    def start_buffered_scan(self, sample_rate):
+        "start hardware-timed output and acquisition, returns actual sample rate"
+        return self.daq.start_buffered(sample_rate)
+
+    def write_positions(self, h, v):
+        self.daq.write_block(h, v)
+
+    def read_samples(self, n):
+        return self.daq.read_block(n)
+
+    def stop_buffered_scan(self):
+        self.daq.stop_buffered()
+
+    def pre_scan_setup(self):
+        pass
+
+    def post_scan_cleanup(self):
+        pass
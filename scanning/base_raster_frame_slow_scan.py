@@ -1,13 +1,34 @@
 from .base_raster_scan import BaseRaster2DScan
+from .slow_scan_mixin import SlowScanMixin
 from ScopeFoundry import h5_io
 import numpy as np
 import time
 import os
 
-class BaseRaster2DFrameSlowScan(BaseRaster2DScan):
+class BaseRaster2DFrameSlowScan(SlowScanMixin, BaseRaster2DScan):
 
     name = "base_raster_2D_frame_slowscan"
 
+    def setup(self):
+        # settings are created before BaseRaster2DScan.setup, 
+        # so they can be used in scan_specific_setup
+        self.setup_slow_scan_settings()
+        # default HDF5 storage policy for framed datasets
+        # see h5_io.h5_storage_kwargs
+        self.settings.New('h5_chunk_policy', dtype=str, initial='frame',
+                          choices=h5_io.H5_CHUNK_POLICIES)
+        self.settings.New('h5_compression', dtype=str, initial='gzip',
+                          choices=h5_io.H5_COMPRESSIONS)
+        self.settings.New('h5_gzip_level', dtype=int, initial=4, vmin=0, vmax=9)
+        self.settings.New('h5_shuffle', dtype=bool, initial=False)
+        # preallocation of framed datasets in continuous scans,
+        # see h5_framed_num_frames
+        self.settings.New('h5_growth', dtype=str, initial='geometric',
+                          choices=('n_frames', 'geometric', 'time'))
+        self.settings.New('h5_growth_factor', dtype=float, initial=2.0, vmin=1.0)
+        self.settings.New('h5_growth_time', dtype=float, initial=60.0, vmin=0, unit='s')
+        BaseRaster2DScan.setup(self)
+
     def run(self):
         S = self.settings
         
@@ -20,83 +41,114 @@ class BaseRaster2DFrameSlowScan(BaseRaster2DScan):
         # Data File
         # H5
 
-        # Compute data arrays
-        self.compute_scan_arrays()
+        # Compute scan path (pixel positions are generated lazily)
+        self.compute_scan_path()
+        # warn once per run if settle_mode on_target is not supported
+        self.settle_fallback_warned = False
         
         self.initial_scan_setup_plotting = True
         
         self.display_image_map = np.zeros(self.scan_shape, dtype=float)
+        self.reset_dirty_rows()
         self.pixel_times = np.zeros(self.scan_shape, dtype=float)
+        # timing of the whole run, saved to the h5 file, 
+        # the timers of each pass are merged in
+        self.reset_phase_timers()
+        self.run_phase_timers = self.phase_timers
+        pass_timed = False
+
 
+        # buffers per-pixel h5 writes, ortho scans also have v as 
+        # fast axis so they buffer whole sub-frames instead of rows
+        self.h5_buffer = h5_io.H5BufferedWriter(
+            block_ndim = 2 if S['scan_type'].startswith('ortho') else 1)
 
         # h5 data file setup
         self.t0 = time.time()
+        self.h5_framed_datasets = []
 
-        if self.settings['save_h5']:
-            self.h5_file = h5_io.h5_base_file(self.app, measurement=self)
-                  
-            self.h5_file.attrs['time_id'] = self.t0
-            H = self.h5_meas_group  =  h5_io.h5_create_measurement_group(self, self.h5_file)
-        
-            #create h5 data arrays
-            H['h_array'] = self.h_array
-            H['v_array'] = self.v_array
-            H['range_extent'] = self.range_extent
-            H['corners'] = self.corners
-            H['imshow_extent'] = self.imshow_extent
-            H['scan_h_positions'] = self.scan_h_positions
-            H['scan_v_positions'] = self.scan_v_positions
-            H['scan_slow_move'] = self.scan_slow_move
-            H['scan_index_array'] = self.scan_index_array
-            self.pixel_times_h5 = self.create_h5_framed_dataset(name='pixel_times', 
-                                                   single_frame_map=self.pixel_times,
-                                                   dtype=float)            
-        
+        self.h5_writer = None
         self.frame_i = 0
         self.pixel_i = 0
-        self.current_scan_index = self.scan_index_array[0]
-        
-        self.pre_scan_setup()
-        
+        self.current_scan_index = self.scan_path.index(0)
 
         try:
+            if self.settings['save_h5']:
+                self.h5_file = h5_io.h5_base_file(self.app, measurement=self)
+                self.h5_filename = self.h5_file.filename
+                  
+                self.h5_file.attrs['time_id'] = self.t0
+                H = self.h5_meas_group  =  h5_io.h5_create_measurement_group(self, self.h5_file)
+        
+                #create h5 data arrays
+                H['h_array'] = self.h_array
+                H['v_array'] = self.v_array
+                H['range_extent'] = self.range_extent
+                H['corners'] = self.corners
+                H['imshow_extent'] = self.imshow_extent
+                self.scan_path.save_to_h5(H)
+            
+                # from here on, buffered pixel data is written in the background
+                self.h5_writer = h5_io.H5AsyncWriter(self.h5_file)
+                self.h5_buffer.async_writer = self.h5_writer
+                self.pixel_times_h5 = self.h5_buffer.register(
+                    self.create_h5_framed_dataset(name='pixel_times', 
+                                                  single_frame_map=self.pixel_times,
+                                                  dtype=float))
+            
+            self.pre_scan_setup()
+            
             while not self.interrupt_measurement_called:        
                 # start scan
+                self.reset_phase_timers()
+                T = self.phase_timers
+                pass_timed = True
+                self.start_progress(self.Npixels*self.settings['n_frames'])
                 for i in range(self.settings['n_frames']):
                     if self.settings['save_h5']:
                         self.extend_h5_framed_dataset(self.pixel_times_h5, self.frame_i)
                     if self.interrupt_measurement_called: break
                     # start frame
                     self.pixel_i = 0
-                    self.current_scan_index = self.scan_index_array[0]
-                    self.move_position_start(self.scan_h_positions[0], self.scan_v_positions[0])
+                    self.current_scan_index = self.scan_path.index(0)
+                    h_prev, v_prev = self.scan_path[0][0:2]
+                    row_k, row_j = None, None
+                    col_k, col_i = None, None
+                    self.move_position_start(h_prev, v_prev)
+                    self.reset_settle_time()
                     self.on_new_frame(self.frame_i)
                     
-                    for self.pixel_i in range(self.Npixels):                
+                    for self.pixel_i, (h, v, slow_move, kk, jj, ii) in enumerate(self.scan_path):
                         if self.interrupt_measurement_called: break
                         
-                        i = self.pixel_i
+                        self.current_scan_index = (kk, jj, ii)
+                        if jj != row_j or kk != row_k:
+                            # new row, for display updates
+                            row_k, row_j = kk, jj
+                            self.mark_dirty_row(kk, jj)
+                        if ii != col_i or kk != col_k:
+                            col_k, col_i = kk, ii
+                            self.mark_dirty_column(kk, ii)
                         
-                        self.current_scan_index = self.scan_index_array[i]
-                        kk, jj, ii = self.current_scan_index
+                        dh = h - h_prev
+                        dv = v - v_prev
+                        h_prev, v_prev = h, v
                         
-                        h,v = self.scan_h_positions[i], self.scan_v_positions[i]
-                        
-                        if self.pixel_i == 0:
-                            dh = 0
-                            dv = 0
-                        else:
-                            dh = self.scan_h_positions[i] - self.scan_h_positions[i-1] 
-                            dv = self.scan_v_positions[i] - self.scan_v_positions[i-1] 
-                        
-                        if self.scan_slow_move[i]:
+                        T.start()
+                        if slow_move:
                             self.move_position_slow(h,v, dh, dv)
-                            if self.settings['save_h5']:    
-                                self.h5_file.flush() # flush data to file every slow move
+                            T.lap('move')
+                            if self.settings['save_h5']:
+                                # flush data to file every slow move
+                                self.h5_buffer.flush()
+                                self.h5_writer.flush()
+                                T.lap('h5_flush')
                             #self.app.qtapp.ProcessEvents()
-                            time.sleep(0.01)
+                            self.settle_slow_move()
+                            T.lap('settle')
                         else:
                             self.move_position_fast(h,v, dh, dv)
+                            T.lap('move')
                         
                         self.pos = (h,v)
                         # each pixel:
@@ -105,16 +157,47 @@ class BaseRaster2DFrameSlowScan(BaseRaster2DScan):
                         self.pixel_times[kk, jj, ii] = pixel_t0
                         if self.settings['save_h5']:
                             self.pixel_times_h5[self.frame_i, kk, jj, ii] = pixel_t0
+                        T.lap('h5_write')
                         self.collect_pixel(self.pixel_i, self.frame_i, kk, jj, ii)
-                        S['progress'] = 100.0*(self.frame_i*self.Npixels + self.pixel_i) / (self.Npixels*self.settings['n_frames'])
+                        T.lap('collect')
+                        self.advance_progress()
+                        self.update_phase_timing()
+                        T.lap('lq_update')
                     self.on_end_frame(self.frame_i)
                     self.frame_i += 1                    
+                self.finish_progress()
+                self.update_phase_timing(force=True)
+                self.run_phase_timers.merge(T)
+                pass_timed = False
                 if not self.settings['continuous_scan']:
                     break
         finally:
-            self.post_scan_cleanup()
-            if self.settings['save_h5'] and hasattr(self, 'h5_file'):
-                self.h5_file.close()
+            try:
+                self.h5_buffer.flush()
+                if self.h5_buffer.async_writer:
+                    self.h5_writer.drain()
+            finally:
+                self.post_scan_cleanup()
+                if self.settings['save_h5'] and hasattr(self, 'h5_file'):
+                    try:
+                        self.h5_buffer.close()
+                        if self.h5_buffer.async_writer:
+                            self.h5_writer.close()
+                            self.update_h5_writer_stats()
+                        self.trim_h5_framed_datasets(self.frame_i)
+                    finally:
+                        try:
+                            if pass_timed:
+                                # interrupted pass
+                                self.run_phase_timers.merge(self.phase_timers)
+                            self.save_phase_timing(self.h5_meas_group, self.run_phase_timers)
+                        except Exception as err:
+                            self.log.error("failed to save phase timing: {}".format(err))
+                        finally:
+                            try:
+                                self.h5_file.close()
+                            except ValueError as err:
+                                self.log.warning('failed to close h5_file: {}'.format(err))
                 
     def move_position_start(self, x,y):
         self.stage.x_position.update_value(x)
@@ -125,8 +208,8 @@ class BaseRaster2DFrameSlowScan(BaseRaster2DScan):
         self.stage.y_position.update_value(y)
         
     def move_position_fast(self, x,y, dx, dy):
-        self.stage.x_position.update_value(x)
-        self.stage.y_position.update_value(y)
+        self.stage.x_position.update_value_fast(x)
+        self.stage.y_position.update_value_fast(y)
         #x = self.stage.settings['x_position']
         #y = self.stage.settings['y_position']        
         #x = self.stage.settings.x_position.read_from_hardware()
@@ -164,15 +247,33 @@ class BaseRaster2DFrameSlowScan(BaseRaster2DScan):
         """
         return (self.settings['n_frames'],) + self.scan_shape
     
-    def create_h5_framed_dataset(self, name, single_frame_map, **kwargs):
+    def h5_storage_policy(self):
+        """
+        Returns the default storage policy for framed datasets
+        from settings, as keyword arguments for h5_io.h5_storage_kwargs
+        """
+        S = self.settings
+        return dict(chunk_policy=S['h5_chunk_policy'], 
+                    compression=S['h5_compression'],
+                    gzip_level=S['h5_gzip_level'],
+                    shuffle=S['h5_shuffle'])
+    
+    def create_h5_framed_dataset(self, name, single_frame_map, policy=None, **kwargs):
         """
         Create and return an empty HDF5 dataset in self.h5_meas_group that can store
         multiple frames of single_frame_map.
         
         Must fill the dataset as frames roll in.
         
+        Chunking and compression follow :meth:`h5_storage_policy`, 
+        entries of the dict *policy* override the settings for this dataset,
+        for example policy=dict(compression='lzf', shuffle=True).
+        Any axes of single_frame_map after the scan_shape axes are treated 
+        as per-pixel values and kept whole in each chunk.
+        
         creates reasonable defaults for compression and dtype, can be overriden 
-        with**kwargs are sent directly to create_dataset
+        with**kwargs are sent directly to create_dataset. Overriding 
+        compression drops the gzip level of the policy (compression_opts)
         """
         if self.settings['save_h5']:
             shape=(self.settings['n_frames'],) + single_frame_map.shape
@@ -182,33 +283,47 @@ class BaseRaster2DFrameSlowScan(BaseRaster2DScan):
             else:
                 maxshape = shape
             #print('maxshape', maxshape)
+            dtype = kwargs.get('dtype', single_frame_map.dtype)
+            storage_policy = self.h5_storage_policy()
+            if policy is not None:
+                storage_policy.update(policy)
+            value_ndim = max(0, single_frame_map.ndim - len(self.scan_shape))
             default_kwargs = dict(
                 name=name,
                 shape=shape,
-                dtype=single_frame_map.dtype,
-                #chunks=(1,),
+                dtype=dtype,
                 maxshape=maxshape,
-                compression='gzip',
-                #shuffle=True,
                 )
+            storage_kwargs = h5_io.h5_storage_kwargs(
+                shape, dtype, value_ndim=value_ndim, **storage_policy)
+            if 'compression' in kwargs:
+                # options of the policy's compression filter
+                storage_kwargs.pop('compression_opts', None)
+            default_kwargs.update(storage_kwargs)
             default_kwargs.update(kwargs)
             map_h5 =  self.h5_meas_group.create_dataset(
                 **default_kwargs
                 )
+            self.h5_framed_datasets.append(map_h5)
             return map_h5
     
     def extend_h5_framed_dataset(self, map_h5, frame_num):
         """
         Adds additional frames to dataset map_h5, if frame_num 
-        is too large. Adds n_frames worth of extra frames
+        is too large. The number of extra frames is set by 
+        :meth:`h5_framed_num_frames`. 
+        Unused frames are removed at the end of the scan by
+        :meth:`trim_h5_framed_datasets`
+        
+        map_h5 can be an h5py dataset or a buffer from self.h5_buffer
         """
         if self.settings['continuous_scan']:
             current_num_frames = map_h5.shape[0]
             frame_shape = map_h5.shape[1:]
             if frame_num >= current_num_frames:
-                #print ("extend_h5_framed_dataset", map_h5.name, map_h5.shape, frame_num)
-                n_frames_extend = self.settings['n_frames']
-                new_num_frames = n_frames_extend*(1 + frame_num//n_frames_extend)
+                new_num_frames = self.h5_framed_num_frames(current_num_frames, frame_num)
+                self.log.debug("extend_h5_framed_dataset {} {} -> {} frames".format(
+                    map_h5.name, current_num_frames, new_num_frames))
                 map_h5.resize((new_num_frames,) + tuple(frame_shape))
                 return True
             else:
@@ -217,3 +332,43 @@ class BaseRaster2DFrameSlowScan(BaseRaster2DScan):
         else:
             # "non continuous scan, no expansion"
             return False
+
+    def h5_framed_num_frames(self, current_num_frames, frame_num):
+        """
+        Returns the new number of frames for a framed dataset
+        of current_num_frames that must hold frame_num.
+        
+        depends on setting h5_growth:
+            'n_frames':  grow by n_frames
+            'geometric': grow by h5_growth_factor, so the number
+                         of resizes is logarithmic in run length
+            'time':      grow by the number of frames expected in 
+                         the next h5_growth_time seconds, based on the
+                         frame rate so far
+        always grows by at least n_frames
+        """
+        S = self.settings
+        n_frames = S['n_frames']
+        min_num_frames = n_frames*(1 + frame_num//n_frames)
+        growth = S['h5_growth']
+        if growth == 'geometric':
+            new_num_frames = int(np.ceil(current_num_frames*S['h5_growth_factor']))
+        elif growth == 'time' and frame_num > 0:
+            frame_time = (time.time() - self.t0)/frame_num
+            new_num_frames = frame_num + int(np.ceil(S['h5_growth_time']/max(frame_time, 1e-6)))
+        else:
+            new_num_frames = min_num_frames
+        return max(new_num_frames, min_num_frames)
+
+    def trim_h5_framed_datasets(self, num_frames):
+        """
+        Resize all datasets created with create_h5_framed_dataset
+        to num_frames, removing frames preallocated by 
+        extend_h5_framed_dataset but never acquired.
+        Only applies to continuous scans.
+        """
+        if not self.settings['continuous_scan']:
+            return
+        for map_h5 in self.h5_framed_datasets:
+            if map_h5.shape[0] > num_frames:
+                map_h5.resize(num_frames, axis=0)
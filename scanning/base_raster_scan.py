@@ -12,6 +12,11 @@ import time
 from ScopeFoundry import h5_io
 from qtpy import QtCore, QtWidgets
 from ScopeFoundry import LQRange
+from .scan_path import RasterScanPath, ArrayScanPath
+from .image_pyramid import ImagePyramid
+from .streaming_quantiles import HistogramQuantiles
+from .scan_history import ImageItemHistory
+from .image_tiles import ImageTiles
 import os
 
 def ijk_zigzag_generator(dims, axis_order=(0,1,2)):
@@ -33,8 +38,32 @@ def ijk_zigzag_generator(dims, axis_order=(0,1,2)):
                 yield tuple(ijk)
     return
 
+SCAN_ARRAY_NAMES = ('scan_h_positions', 'scan_v_positions',
+                    'scan_slow_move', 'scan_index_array')
+
+def _scan_array_property(name):
+    "attribute access to a scan array, see BaseRaster2DScan.get_scan_arrays"
+    def fget(self):
+        return self.get_scan_arrays()[name]
+    def fset(self, value):
+        if self.__dict__.get('_scan_arrays') is None:
+            self._scan_arrays = dict()
+        self._scan_arrays[name] = value
+    return property(fget, fset, doc="(deprecated, use scan_path) " + name)
+
+
 class BaseRaster2DScan(Measurement):
     name = "base_raster_2Dscan"
+
+    # materialized from scan_path on first access, see get_scan_arrays
+    scan_h_positions = _scan_array_property('scan_h_positions')
+    scan_v_positions = _scan_array_property('scan_v_positions')
+    scan_slow_move = _scan_array_property('scan_slow_move')
+    scan_index_array = _scan_array_property('scan_index_array')
+
+    # fraction of the current LUT range by which new levels 
+    # must differ to be applied, see update_LUT
+    lut_levels_tolerance = 0.01
     
     def __init__(self, app, h_limits=(-1,1), v_limits=(-1,1), h_unit='', v_unit=''):
         self.h_limits = h_limits
@@ -82,6 +111,40 @@ class BaseRaster2DScan(Measurement):
         self.settings.New('save_h5', dtype=bool, initial=True, ro=False)
         
         self.settings.New('show_previous_scans', dtype=bool, initial=True)
+        # previous scans are downsampled to history_max_size pixels and 
+        # the oldest removed to stay within the item (0: no limit) 
+        # and memory budgets
+        self.settings.New('history_max_scans', dtype=int, initial=0, vmin=0)
+        self.settings.New('history_max_MB', dtype=float, initial=256., vmin=0)
+        self.settings.New('history_max_size', dtype=int, initial=512, vmin=1)
+        self.settings.New('history_MB', dtype=float, ro=True)
+        for lq_name in ['history_max_scans', 'history_max_MB', 'history_max_size']:
+            self.settings.get_lq(lq_name).add_listener(self.update_scan_history_budget)
+        
+        # display downsampled copies of large images, matching the zoom
+        self.settings.New('display_pyramid', dtype=bool, initial=True)
+        self.settings.New('display_level', dtype=int, ro=True, initial=0)
+        # ImagePyramid of each sub-frame, see update_display_pyramid
+        self.display_pyramids = {}
+        
+        # rows and columns of display_image_map changed since the last 
+        # display update, see mark_dirty_row and mark_dirty_column, 
+        # None: not tracked (the whole image is updated)
+        self.dirty_rows = None
+        self.dirty_cols = None
+        self.display_dirty_rows = None
+        self.display_dirty_cols = None
+        
+        # show the display image as tiles, re-rendering only the tiles
+        # changed since the last display update, see ImageTiles
+        self.settings.New('display_tiles', dtype=bool, initial=True)
+        self.display_tiles = {}
+        
+        # LUT levels from 1 and 99 percentiles, estimated from the changed
+        # pixels (streaming) or computed over the whole image (exact)
+        self.settings.New('lut_levels', dtype=str, initial='streaming',
+                          choices=('streaming', 'exact'))
+        self.lut_quantiles = None
         
         
         self.settings.New('n_frames', dtype=int, initial=1, vmin=1)
@@ -191,12 +254,69 @@ class BaseRaster2DScan(Measurement):
         # calls correct scan generator function
         getattr(self, gen_func_name)(gen_arrays=True)
     
+    def compute_scan_path(self):
+        """
+        Create self.scan_path, a :class:`ScanPath` for the current scan_type.
+        
+        Built-in scan types use a lazily computed :class:`RasterScanPath` 
+        with constant memory use. Subclasses that override a gen_*_scan 
+        generator (or add new ones) get an :class:`ArrayScanPath` built 
+        from the materialized scan arrays.
+        """
+        self.compute_scan_params()
+        scan_type = self.scan_type.val
+        gen_func_name = "gen_%s_scan" % scan_type
+        if (scan_type in RasterScanPath.scan_types 
+                and getattr(type(self), gen_func_name) is getattr(BaseRaster2DScan, gen_func_name)):
+            self.scan_path = RasterScanPath(scan_type, self.h_array, self.v_array)
+            # scan arrays of a previous scan are stale
+            self._scan_arrays = None
+        else:
+            self.compute_scan_arrays()
+            self.scan_path = ArrayScanPath(self.scan_h_positions, self.scan_v_positions,
+                                           self.scan_slow_move, self.scan_index_array,
+                                           self.scan_shape)
+        assert self.scan_path.Npixels == self.Npixels
+        return self.scan_path
+    
+    def get_scan_arrays(self):
+        """
+        Returns dict of the scan arrays scan_h_positions, scan_v_positions,
+        scan_slow_move and scan_index_array of the current scan, which are
+        also available as attributes for code written before scan_path.
+
+        Deprecated: built-in scan types no longer create these arrays,
+        they are materialized from self.scan_path on first access
+        (computing the scan path if needed), with memory use
+        proportional to Npixels. New code should use scan_path.
+        """
+        arrays = self.__dict__.get('_scan_arrays')
+        if arrays is None or len(arrays) < len(SCAN_ARRAY_NAMES):
+            if getattr(self, 'scan_path', None) is None:
+                self.compute_scan_path()
+            arrays = self._scan_arrays = dict(zip(SCAN_ARRAY_NAMES,
+                                                  self.scan_path.to_arrays()))
+        return arrays
+
     def create_empty_scan_arrays(self):
         self.scan_h_positions = np.zeros(self.Npixels, dtype=float)
         self.scan_v_positions = np.zeros(self.Npixels, dtype=float)
         self.scan_slow_move   = np.zeros(self.Npixels, dtype=bool)
         self.scan_index_array = np.zeros((self.Npixels, 3), dtype=int)
 
+    def fill_scan_arrays_from_indices(self, kk, jj, ii):
+        """
+        Fill scan arrays (created by :meth:`create_empty_scan_arrays`) 
+        from flat per-pixel index arrays *kk*, *jj*, *ii* of length Npixels.
+        Positions are looked up from h_array and v_array.
+        Generators must set scan_slow_move themselves.
+        """
+        self.scan_index_array[:,0] = kk
+        self.scan_index_array[:,1] = jj
+        self.scan_index_array[:,2] = ii
+        self.scan_h_positions[:] = self.h_array[ii]
+        self.scan_v_positions[:] = self.v_array[jj]
+
     def pre_run(self):
         # set all logged quantities read only
         for lqname in "h0 h1 v0 v1 dh dv Nh Nv".split():
@@ -227,11 +347,10 @@ class BaseRaster2DScan(Measurement):
         self.clear_qt_attr('img_plot')
         self.img_plot = self.graph_layout.addPlot()
 
-        self.img_items = []
-        
+        self.scan_history = ImageItemHistory(self.img_plot)
+        self.update_scan_history_budget()
         
         self.img_item = pg.ImageItem()
-        self.img_items.append(self.img_item)
         
         self.img_plot.addItem(self.img_item)
         self.img_plot.showGrid(x=True, y=True)
@@ -239,6 +358,7 @@ class BaseRaster2DScan(Measurement):
 
         self.hist_lut = pg.HistogramLUTItem()
         self.graph_layout.addItem(self.hist_lut)
+        self.link_hist_lut()
 
         
         #self.clear_qt_attr('current_stage_pos_arrow')
@@ -333,10 +453,11 @@ class BaseRaster2DScan(Measurement):
         #self.log.debug('update_display')
         if self.initial_scan_setup_plotting:
             if self.settings['show_previous_scans']:
+                self.scan_history.add(self.img_item, getattr(self, 'img_item_rect', None))
+                self.settings['history_MB'] = self.scan_history.nbytes/1e6
                 self.img_item = pg.ImageItem()
-                self.img_items.append(self.img_item)
                 self.img_plot.addItem(self.img_item)
-                self.hist_lut.setImageItem(self.img_item)
+                self.link_hist_lut()
     
             self.img_item.setImage(self.display_image_map[0,:,:])
             x0, x1, y0, y1 = self.imshow_extent
@@ -346,27 +467,249 @@ class BaseRaster2DScan(Measurement):
             self.log.debug('update_display set bounds {}'.format(self.img_item_rect))
             
             self.initial_scan_setup_plotting = False
+            self.display_pyramids = {}
+            self.lut_quantiles = None
+            self.clear_display_tiles()
+            self.img_item.setVisible(True)
         else:
             #if self.settings.scan_type.val in ['raster']
             kk, jj, ii = self.current_scan_index
-            self.disp_img = self.display_image_map[kk,:,:].T
+            self.display_dirty_rows = self.pop_dirty_rows(kk, jj)
+            self.display_dirty_cols = self.pop_dirty_columns(kk, ii)
+            level = 0
+            if self.settings['display_pyramid']:
+                self.disp_img = self.update_display_pyramid(kk, jj).T
+                level = self.settings['display_level']
+            else:
+                # pyramids are not updated while not displayed
+                self.display_pyramids = {}
+                self.disp_img = self.display_image_map[kk,:,:].T
+            # with display_tiles, img_item holds the image for the 
+            # histogram and show_previous_scans, but is not rendered
+            tiles = self.settings['display_tiles']
+            self.img_item.setVisible(not tiles)
             self.img_item.setImage(self.disp_img, autoRange=False, autoLevels=False)
             self.img_item.setRect(self.img_item_rect) # Important to set rectangle after setImage for non-square pixels
             self.update_LUT()
+            if tiles:
+                self.update_display_tiles(kk, level)
+            else:
+                self.clear_display_tiles()
+    
+    def update_display_tiles(self, kk, level):
+        """
+        Show disp_img, sub-frame *kk* at pyramid *level*, with the 
+        ImageTiles of sub-frame kk, re-rendering the tiles overlapping 
+        the changed rows and columns (display_dirty_rows/cols)
+        """
+        for k, tiles in self.display_tiles.items():
+            if k != kk:
+                tiles.set_visible(False)
+        tiles = self.display_tiles.get(kk)
+        if tiles is None:
+            tiles = self.display_tiles[kk] = ImageTiles(self.img_plot)
+        tiles.set_visible(True)
+        rows, cols = self.display_dirty_rows, self.display_dirty_cols
+        region = None
+        if rows is not None and cols is not None:
+            if len(rows) and len(cols):
+                # disp_img is indexed [column, row]
+                region = (cols[0] >> level, (cols[-1] >> level) + 1,
+                          rows[0] >> level, (rows[-1] >> level) + 1)
+            else:
+                region = (0, 0, 0, 0)
+        tiles.set_image(self.disp_img, self.img_item_rect, region,
+                        levels=self.img_item.levels, lut=self.img_item.lut)
+    
+    def clear_display_tiles(self):
+        for tiles in self.display_tiles.values():
+            tiles.clear()
+        self.display_tiles = {}
             
+    def reset_dirty_rows(self):
+        """
+        Start tracking changed rows and columns of display_image_map, 
+        all are marked. Call after allocating display_image_map, then 
+        call :meth:`mark_dirty_row` and :meth:`mark_dirty_column` for 
+        the rows and columns written to. The changed pixels are within
+        the marked rows x marked columns.
+        """
+        n_sub, n_rows, n_cols = self.display_image_map.shape
+        self.dirty_rows = np.ones((n_sub, n_rows), dtype=bool)
+        self.dirty_cols = np.ones((n_sub, n_cols), dtype=bool)
+    
+    def mark_dirty_row(self, kk, jj):
+        "mark row jj of display_image_map[kk] as changed"
+        self.dirty_rows[kk, jj] = True
+    
+    def mark_dirty_column(self, kk, ii):
+        "mark column ii of display_image_map[kk] as changed"
+        self.dirty_cols[kk, ii] = True
+    
+    def _pop_dirty(self, d, kk, current, n):
+        if d is None or d.shape != (self.display_image_map.shape[0], n):
+            return np.arange(n)
+        idx = np.flatnonzero(d[kk])
+        # clear only the indices returned, marks set meanwhile are kept
+        d[kk, idx] = False
+        d[kk, current] = True
+        if current not in idx:
+            idx = np.union1d(idx, [current])
+        return idx
+    
+    def pop_dirty_rows(self, kk, current_row):
+        """
+        Returns sorted indices of rows of display_image_map[kk] changed 
+        since the last call, including *current_row*, and clears their 
+        marks. current_row stays marked, as it is still being acquired.
+        Returns all rows if changes are not tracked.
+        """
+        return self._pop_dirty(self.dirty_rows, kk, current_row, 
+                               self.display_image_map.shape[1])
+    
+    def pop_dirty_columns(self, kk, current_col):
+        "like :meth:`pop_dirty_rows`, for columns"
+        return self._pop_dirty(self.dirty_cols, kk, current_col, 
+                               self.display_image_map.shape[2])
+    
+    def display_dirty_blocks(self):
+        """
+        Returns list of blocks (j0, j1, i0, i1) of display_image_map[kk]
+        covering the rows and columns changed since the last display 
+        update (display_dirty_rows and display_dirty_cols): runs of
+        consecutive dirty rows, each over the range of dirty columns.
+        None if changes are not tracked.
+        """
+        rows, cols = self.display_dirty_rows, self.display_dirty_cols
+        if rows is None or cols is None:
+            return None
+        if len(rows) == 0 or len(cols) == 0:
+            return []
+        breaks = np.flatnonzero(np.diff(rows) > 1) + 1
+        return [(run[0], run[-1]+1, cols[0], cols[-1]+1) 
+                for run in np.split(rows, breaks)]
+    
+    def update_display_pyramid(self, kk, jj):
+        """
+        Update the ImagePyramid of sub-frame display_image_map[kk] in 
+        the blocks changed since the last display update (see
+        display_dirty_blocks), returns the level matching the current
+        zoom of img_plot. Each sub-frame has its own pyramid, which 
+        is updated when the sub-frame is displayed.
+        """
+        img = self.display_image_map[kk,:,:]
+        key = (id(self.display_image_map), kk)
+        pyr = self.display_pyramids.get(key)
+        blocks = self.display_dirty_blocks()
+        if pyr is None or blocks is None:
+            if any(k[0] != key[0] for k in self.display_pyramids):
+                # new display_image_map
+                self.display_pyramids = {}
+            pyr = self.display_pyramids[key] = ImagePyramid(img)
+        else:
+            for j0, j1, i0, i1 in blocks:
+                pyr.update_region(j0, j1, i0, i1)
+        
+        # image pixels per screen pixel
+        px_w, px_h = self.img_plot.vb.viewPixelSize()
+        x0, x1, y0, y1 = self.imshow_extent
+        scale = min(px_w*img.shape[1]/abs(x1-x0), px_h*img.shape[0]/abs(y1-y0))
+        level = pyr.level_for_scale(scale)
+        self.settings['display_level'] = level
+        return pyr[level]
+    
+    def link_hist_lut(self):
+        """
+        Let hist_lut control the levels and LUT of img_item. Its 
+        histogram is updated by update_LUT, not on every setImage.
+        """
+        self.hist_lut.setImageItem(self.img_item)
+        self.img_item.sigImageChanged.disconnect(self.hist_lut.imageChanged)
+    
     def update_LUT(self):
         ''' override this function to control display LUT scaling'''
-        self.hist_lut.imageChanged(autoLevel=False)
-        self.hist_lut.setLevels(*np.percentile(self.disp_img,(1,99)))
+        if self.settings['lut_levels'] == 'exact':
+            self.hist_lut.imageChanged(autoLevel=False)
+            levels = np.percentile(self.disp_img,(1,99))
+            # streaming estimates are not updated while not used
+            self.lut_quantiles = None
+        else:
+            levels = self.streaming_lut_levels()
+            self.plot_lut_histogram()
+        if np.all(np.isfinite(levels)):
+            # small changes are not applied, new levels re-render the whole image
+            lo, hi = self.hist_lut.getLevels()
+            tol = self.lut_levels_tolerance*(hi - lo)
+            if not (abs(levels[0] - lo) <= tol and abs(levels[1] - hi) <= tol):
+                self.hist_lut.setLevels(*levels)
+    
+    def streaming_lut_levels(self, q=(1,99)):
+        """
+        Estimate percentiles *q* of the current sub-frame of 
+        display_image_map (the percentiles lut_levels 'exact' computes)
+        with a HistogramQuantiles per sub-frame. The values of the blocks 
+        changed since the last display of the sub-frame (see 
+        display_dirty_blocks) replace their previous values, which are 
+        kept in a copy of the sub-frame.
+        """
+        kk = self.current_scan_index[0]
+        img = self.display_image_map[kk,:,:]
+        key = (id(self.display_image_map), kk)
+        if self.lut_quantiles is None or any(k[0] != key[0] for k in self.lut_quantiles):
+            # new display_image_map
+            self.lut_quantiles = {}
+        blocks = self.display_dirty_blocks()
+        if key not in self.lut_quantiles or blocks is None:
+            hq = HistogramQuantiles()
+            values = img.copy()
+            hq.add(values)
+            self.lut_quantiles[key] = (hq, values)
+        else:
+            hq, values = self.lut_quantiles[key]
+            for j0, j1, i0, i1 in blocks:
+                new = img[j0:j1, i0:i1].copy()
+                hq.remove(values[j0:j1, i0:i1])
+                hq.add(new)
+                values[j0:j1, i0:i1] = new
+        return hq.quantiles(q)
+    
+    def plot_lut_histogram(self, n_bins=256):
+        """
+        Show the histogram of the streaming LUT estimate of the current
+        sub-frame (see streaming_lut_levels) in hist_lut, merged to 
+        *n_bins* bins
+        """
+        key = (id(self.display_image_map), self.current_scan_index[0])
+        hq, values = self.lut_quantiles[key]
+        if hq.lo is None:
+            return
+        counts = hq.counts.reshape(n_bins, -1).sum(axis=1)
+        x = np.linspace(hq.lo, hq.hi, n_bins, endpoint=False)
+        self.hist_lut.plot.setData(x, counts)
                
+    @property
+    def img_items(self):
+        """
+        ImageItems of the previous scans kept in the plot (oldest first, 
+        see scan_history) followed by the current img_item
+        """
+        if not hasattr(self, 'scan_history'):
+            return []
+        return self.scan_history.items + [self.img_item]
+    
     def clear_previous_scans(self):
-        #current_img = img_items.pop()
-        for img_item in self.img_items[:-1]:
-            print('removing', img_item)
-            self.img_plot.removeItem(img_item)  
-            img_item.deleteLater()
+        self.scan_history.clear()
+        self.settings['history_MB'] = 0
     
-        self.img_items = [self.img_item,]
+    def update_scan_history_budget(self):
+        if not hasattr(self, 'scan_history'):
+            return
+        S = self.settings
+        self.scan_history.max_items = S['history_max_scans']
+        self.scan_history.max_bytes = S['history_max_MB']*1e6
+        self.scan_history.max_size = S['history_max_size']
+        self.scan_history.enforce_budget()
+        S['history_MB'] = self.scan_history.nbytes/1e6
     
     def mouseMoved(self,evt):
         mousePoint = self.img_plot.vb.mapSceneToView(evt)
@@ -475,20 +818,11 @@ class BaseRaster2DScan(Measurement):
 
         if gen_arrays:
             self.create_empty_scan_arrays()
-            pixel_i = 0
-            for jj in range(self.Nv.val):
-                self.scan_slow_move[pixel_i] = True
-                
-                if jj % 2: #odd lines
-                    h_line_indicies = range(self.Nh.val)[::-1]
-                else:       #even lines -- traverse in opposite direction
-                    h_line_indicies = range(self.Nh.val)            
-        
-                for ii in h_line_indicies:            
-                    self.scan_v_positions[pixel_i] = self.v_array[jj]
-                    self.scan_h_positions[pixel_i] = self.h_array[ii]
-                    self.scan_index_array[pixel_i,:] = [0, jj, ii]                 
-                    pixel_i += 1
+            Nh, Nv = self.Nh.val, self.Nv.val
+            JJ, II = np.mgrid[0:Nv, 0:Nh]
+            II[1::2] = II[1::2, ::-1] # odd lines traverse in opposite direction
+            self.fill_scan_arrays_from_indices(0, JJ.ravel(), II.ravel())
+            self.scan_slow_move[::Nh] = True
                 
     def gen_trace_retrace_scan(self, gen_arrays=True):
         self.Npixels = 2*self.Nh.val*self.Nv.val
@@ -496,16 +830,12 @@ class BaseRaster2DScan(Measurement):
 
         if gen_arrays:
             self.create_empty_scan_arrays()
-            pixel_i = 0
-            for jj in range(self.Nv.val):
-                self.scan_slow_move[pixel_i] = True     
-                for kk, step in [(0,1),(1,-1)]: # trace kk =0, retrace kk=1
-                    h_line_indicies = range(self.Nh.val)[::step]
-                    for ii in h_line_indicies:            
-                        self.scan_v_positions[pixel_i] = self.v_array[jj]
-                        self.scan_h_positions[pixel_i] = self.h_array[ii]
-                        self.scan_index_array[pixel_i,:] = [kk, jj, ii]                 
-                        pixel_i += 1
+            Nh, Nv = self.Nh.val, self.Nv.val
+            # trace kk =0, retrace kk=1
+            JJ, KK, II = np.mgrid[0:Nv, 0:2, 0:Nh]
+            II[:,1,:] = II[:,1,::-1]
+            self.fill_scan_arrays_from_indices(KK.ravel(), JJ.ravel(), II.ravel())
+            self.scan_slow_move[::2*Nh] = True
     
     def gen_ortho_raster_scan(self, gen_arrays=True):
         self.Npixels = 2*self.Nh.val*self.Nv.val
@@ -513,21 +843,17 @@ class BaseRaster2DScan(Measurement):
 
         if gen_arrays:
             self.create_empty_scan_arrays()
-            pixel_i = 0
-            for jj in range(self.Nv.val):
-                self.scan_slow_move[pixel_i] = True
-                for ii in range(self.Nh.val):
-                    self.scan_v_positions[pixel_i] = self.v_array[jj]
-                    self.scan_h_positions[pixel_i] = self.h_array[ii]
-                    self.scan_index_array[pixel_i,:] = [0, jj, ii] 
-                    pixel_i += 1
-            for ii in range(self.Nh.val):
-                self.scan_slow_move[pixel_i] = True
-                for jj in range(self.Nv.val):
-                    self.scan_v_positions[pixel_i] = self.v_array[jj]
-                    self.scan_h_positions[pixel_i] = self.h_array[ii]
-                    self.scan_index_array[pixel_i,:] = [1, jj, ii] 
-                    pixel_i += 1
+            Nh, Nv = self.Nh.val, self.Nv.val
+            N_half = Nh*Nv
+            # kk=0: h fast axis, kk=1: v fast axis
+            JJ0, II0 = np.mgrid[0:Nv, 0:Nh]
+            II1, JJ1 = np.mgrid[0:Nh, 0:Nv]
+            self.fill_scan_arrays_from_indices(
+                np.repeat((0,1), N_half),
+                np.concatenate((JJ0.ravel(), JJ1.ravel())),
+                np.concatenate((II0.ravel(), II1.ravel())))
+            self.scan_slow_move[:N_half:Nh] = True
+            self.scan_slow_move[N_half::Nv] = True
     
     def gen_ortho_trace_retrace_scan(self, gen_arrays=True):
         print("gen_ortho_trace_retrace_scan")
@@ -536,26 +862,17 @@ class BaseRaster2DScan(Measurement):
         
         if gen_arrays:
             self.create_empty_scan_arrays()
-            pixel_i = 0
-            for jj in range(self.Nv.val):
-                self.scan_slow_move[pixel_i] = True     
-                for kk, step in [(0,1),(1,-1)]: # trace kk =0, retrace kk=1
-                    h_line_indicies = range(self.Nh.val)[::step]
-                    for ii in h_line_indicies:            
-                        self.scan_v_positions[pixel_i] = self.v_array[jj]
-                        self.scan_h_positions[pixel_i] = self.h_array[ii]
-                        self.scan_index_array[pixel_i,:] = [kk, jj, ii]                 
-                        pixel_i += 1
-            for ii in range(self.Nh.val):
-                self.scan_slow_move[pixel_i] = True     
-                for kk, step in [(2,1),(3,-1)]: # trace kk =2, retrace kk=3
-                    v_line_indicies = range(self.Nv.val)[::step]
-                    for jj in v_line_indicies:            
-                        self.scan_v_positions[pixel_i] = self.v_array[jj]
-                        self.scan_h_positions[pixel_i] = self.h_array[ii]
-                        self.scan_index_array[pixel_i,:] = [kk, jj, ii]                 
-                        pixel_i += 1
-                    
-
-
-
+            Nh, Nv = self.Nh.val, self.Nv.val
+            N_half = 2*Nh*Nv
+            # trace kk =0, retrace kk=1 along h
+            JJ0, KK0, II0 = np.mgrid[0:Nv, 0:2, 0:Nh]
+            II0[:,1,:] = II0[:,1,::-1]
+            # trace kk =2, retrace kk=3 along v
+            II1, KK1, JJ1 = np.mgrid[0:Nh, 2:4, 0:Nv]
+            JJ1[:,1,:] = JJ1[:,1,::-1]
+            self.fill_scan_arrays_from_indices(
+                np.concatenate((KK0.ravel(), KK1.ravel())),
+                np.concatenate((JJ0.ravel(), JJ1.ravel())),
+                np.concatenate((II0.ravel(), II1.ravel())))
+            self.scan_slow_move[:N_half:2*Nh] = True
+            self.scan_slow_move[N_half::2*Nv] = True
@@ -28,7 +28,8 @@ class TestRaster2DSlowScan(BaseRaster2DSlowScan):
         
         self.stage = self.app.hardware['dummy_xy_stage']
         if self.settings['save_h5']:
-            self.test_data = self.h5_meas_group.create_dataset('test_data', self.scan_shape, dtype=float)
+            self.test_data = self.h5_buffer.register(
+                self.h5_meas_group.create_dataset('test_data', self.scan_shape, dtype=float))
         
         self.prev_px = time.time()
          
@@ -83,7 +84,8 @@ class TestRaster2DFrameSlowScan(BaseRaster2DFrameSlowScan):
         self.stage = self.app.hardware['dummy_xy_stage']
         if self.settings['save_h5']:
             #self.test_data = self.h5_meas_group.create_dataset('test_data', self.frames_scan_shape, dtype=float)
-            self.test_data = self.create_h5_framed_dataset("test_data",self.display_image_map)
+            self.test_data = self.h5_buffer.register(
+                self.create_h5_framed_dataset("test_data",self.display_image_map))
         
         self.prev_px = time.time()
          
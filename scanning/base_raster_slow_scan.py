@@ -1,13 +1,18 @@
 from .base_raster_scan import BaseRaster2DScan
+from .slow_scan_mixin import SlowScanMixin
 from ScopeFoundry import h5_io
 import numpy as np
 import time
 import os
 
-class BaseRaster2DSlowScan(BaseRaster2DScan):
+class BaseRaster2DSlowScan(SlowScanMixin, BaseRaster2DScan):
 
     name = "base_raster_2Dslowscan"
 
+    def setup(self):
+        self.setup_slow_scan_settings()
+        BaseRaster2DScan.setup(self)
+
     def run(self):
         S = self.settings
         
@@ -20,19 +25,29 @@ class BaseRaster2DSlowScan(BaseRaster2DScan):
         # Data File
         # H5
 
-        # Compute data arrays
-        self.compute_scan_arrays()
+        # Compute scan path (pixel positions are generated lazily)
+        self.compute_scan_path()
+        # warn once per run if settle_mode on_target is not supported
+        self.settle_fallback_warned = False
         
         self.initial_scan_setup_plotting = True
         
         self.display_image_map = np.zeros(self.scan_shape, dtype=float)
+        self.reset_dirty_rows()
 
 
         while not self.interrupt_measurement_called:        
+            # buffers per-pixel h5 writes, ortho scans also have v as 
+            # fast axis so they buffer whole sub-frames instead of rows
+            self.h5_buffer = h5_io.H5BufferedWriter(
+                block_ndim = 2 if S['scan_type'].startswith('ortho') else 1)
+            self.reset_phase_timers()
+            T = self.phase_timers
             try:
                 # h5 data file setup
                 self.t0 = time.time()
 
+                self.h5_writer = None
                 if self.settings['save_h5']:
                     self.h5_file = h5_io.h5_base_file(self.app, measurement=self)
                     self.h5_filename = self.h5_file.filename
@@ -46,49 +61,63 @@ class BaseRaster2DSlowScan(BaseRaster2DScan):
                     H['range_extent'] = self.range_extent
                     H['corners'] = self.corners
                     H['imshow_extent'] = self.imshow_extent
-                    H['scan_h_positions'] = self.scan_h_positions
-                    H['scan_v_positions'] = self.scan_v_positions
-                    H['scan_slow_move'] = self.scan_slow_move
-                    H['scan_index_array'] = self.scan_index_array
+                    self.scan_path.save_to_h5(H)
+                    
+                    # from here on, buffered pixel data is written in the background
+                    self.h5_writer = h5_io.H5AsyncWriter(self.h5_file)
+                    self.h5_buffer.async_writer = self.h5_writer
                 
                 
                 # start scan
                 self.pixel_i = 0
-                self.current_scan_index = self.scan_index_array[0]
+                self.current_scan_index = self.scan_path.index(0)
 
                 self.pixel_time = np.zeros(self.scan_shape, dtype=float)
                 if self.settings['save_h5']:
-                    self.pixel_time_h5 = H.create_dataset(name='pixel_time', shape=self.scan_shape, dtype=float)            
+                    self.pixel_time_h5 = self.h5_buffer.register(
+                        H.create_dataset(name='pixel_time', shape=self.scan_shape, dtype=float))
 
                 self.pre_scan_setup()
                 
-                self.move_position_start(self.scan_h_positions[0], self.scan_v_positions[0])
+                self.reset_settle_time()
+                self.start_progress(self.Npixels)
                 
-                for self.pixel_i in range(self.Npixels):                
+                h_prev, v_prev = self.scan_path[0][0:2]
+                row_k, row_j = None, None
+                col_k, col_i = None, None
+                self.move_position_start(h_prev, v_prev)
+                
+                for self.pixel_i, (h, v, slow_move, kk, jj, ii) in enumerate(self.scan_path):
                     if self.interrupt_measurement_called: break
                     
-                    i = self.pixel_i
-                    
-                    self.current_scan_index = self.scan_index_array[i]
-                    kk, jj, ii = self.current_scan_index
+                    self.current_scan_index = (kk, jj, ii)
+                    if jj != row_j or kk != row_k:
+                        # new row, for display updates
+                        row_k, row_j = kk, jj
+                        self.mark_dirty_row(kk, jj)
+                    if ii != col_i or kk != col_k:
+                        col_k, col_i = kk, ii
+                        self.mark_dirty_column(kk, ii)
                     
-                    h,v = self.scan_h_positions[i], self.scan_v_positions[i]
+                    dh = h - h_prev
+                    dv = v - v_prev
+                    h_prev, v_prev = h, v
                     
-                    if self.pixel_i == 0:
-                        dh = 0
-                        dv = 0
-                    else:
-                        dh = self.scan_h_positions[i] - self.scan_h_positions[i-1] 
-                        dv = self.scan_v_positions[i] - self.scan_v_positions[i-1] 
-                    
-                    if self.scan_slow_move[i]:
+                    T.start()
+                    if slow_move:
                         self.move_position_slow(h,v, dh, dv)
-                        if self.settings['save_h5']:    
-                            self.h5_file.flush() # flush data to file every slow move
+                        T.lap('move')
+                        if self.settings['save_h5']:
+                            # flush data to file every slow move
+                            self.h5_buffer.flush()
+                            self.h5_writer.flush()
+                            T.lap('h5_flush')
                         #self.app.qtapp.ProcessEvents()
-                        time.sleep(0.01)
+                        self.settle_slow_move()
+                        T.lap('settle')
                     else:
                         self.move_position_fast(h,v, dh, dv)
+                        T.lap('move')
                     
                     self.pos = (h,v)
                     # each pixel:
@@ -97,16 +126,38 @@ class BaseRaster2DSlowScan(BaseRaster2DScan):
                     self.pixel_time[kk, jj, ii] = pixel_t0
                     if self.settings['save_h5']:
                         self.pixel_time_h5[kk, jj, ii] = pixel_t0
+                    T.lap('h5_write')
                     self.collect_pixel(self.pixel_i, kk, jj, ii)
-                    S['progress'] = 100.0*self.pixel_i / (self.Npixels)
+                    T.lap('collect')
+                    self.advance_progress()
+                    self.update_phase_timing()
+                    T.lap('lq_update')
+                self.finish_progress()
+                self.update_phase_timing(force=True)
             finally:
-                self.post_scan_cleanup()
-                if hasattr(self, 'h5_file'):
-                    print('h5_file', self.h5_file)
-                    try:
-                        self.h5_file.close()
-                    except ValueError as err:
-                        self.log.warning('failed to close h5_file: {}'.format(err))
+                try:
+                    self.h5_buffer.flush()
+                    if self.h5_buffer.async_writer:
+                        self.h5_writer.drain()
+                finally:
+                    self.post_scan_cleanup()
+                    if hasattr(self, 'h5_file'):
+                        print('h5_file', self.h5_file)
+                        try:
+                            self.h5_buffer.close()
+                            if self.h5_buffer.async_writer:
+                                self.h5_writer.close()
+                                self.update_h5_writer_stats()
+                        finally:
+                            try:
+                                if self.settings['save_h5']:
+                                    self.save_phase_timing(self.h5_meas_group)
+                            except Exception as err:
+                                self.log.error("failed to save phase timing: {}".format(err))
+                            try:
+                                self.h5_file.close()
+                            except ValueError as err:
+                                self.log.warning('failed to close h5_file: {}'.format(err))
                 if not self.settings['continuous_scan']:
                     break
         print(self.name, 'done')
@@ -120,8 +171,8 @@ class BaseRaster2DSlowScan(BaseRaster2DScan):
         self.stage.settings.y_position.update_value(v)
         
     def move_position_fast(self, h,v, dh, dv):
-        self.stage.settings.x_position.update_value(h)
-        self.stage.settings.y_position.update_value(v)
+        self.stage.settings.x_position.update_value_fast(h)
+        self.stage.settings.y_position.update_value_fast(v)
         #x = self.stage.settings['x_position']
         #y = self.stage.settings['y_position']        
         #x = self.stage.settings.x_position.read_from_hardware()
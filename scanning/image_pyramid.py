@@ -0,0 +1,88 @@
+from __future__ import division, print_function, absolute_import
+import numpy as np
+
+
+def downsample2(img):
+    """
+    2x2 block mean over the first two axes of array img, which may have
+    trailing axes (e.g. color channels (ny, nx, c)), odd edges are 
+    averaged over the available pixels. Returns float array of shape
+    ceil(shape/2) in the first two axes
+    """
+    ny, nx = img.shape[:2]
+    rest = img.shape[2:]
+    if ny % 2 or nx % 2:
+        img = np.pad(img, ((0, ny % 2), (0, nx % 2)) + ((0, 0),)*len(rest), mode='edge')
+    ny, nx = img.shape[:2]
+    return img.reshape((ny//2, 2, nx//2, 2) + rest).mean(axis=(1, 3))
+
+
+class ImagePyramid(object):
+    """
+    Downsampled copies of a 2D image for display: level n is the
+    image averaged over 2**n x 2**n blocks. Level 0 is the source
+    image itself (not copied), levels are added until the image fits
+    in *min_size* pixels.
+
+    :meth:`update_region` recomputes only the parts of all levels
+    depending on a block of the source image, so the cost of keeping the
+    pyramid up to date is proportional to the newly acquired data.
+    """
+
+    def __init__(self, image, min_size=256):
+        self.image = image
+        self.levels = [image]
+        shape = image.shape
+        while max(shape) > min_size:
+            shape = ((shape[0]+1)//2, (shape[1]+1)//2)
+            self.levels.append(np.zeros(shape, dtype=float))
+        self.update_rows(0, image.shape[0])
+
+    @property
+    def n_levels(self):
+        return len(self.levels)
+
+    def update_rows(self, j0, j1):
+        "update all levels from source rows j0 to j1-1"
+        self.update_region(j0, j1)
+
+    def update_region(self, j0, j1, i0=0, i1=None):
+        "update all levels from the source block [j0:j1, i0:i1]"
+        ny, nx = self.image.shape[:2]
+        if i1 is None:
+            i1 = nx
+        j0, i0 = max(0, j0), max(0, i0)
+        j1, i1 = min(j1, ny), min(i1, nx)
+        for n in range(1, len(self.levels)):
+            if j1 <= j0 or i1 <= i0:
+                break
+            src = self.levels[n-1]
+            # whole 2x2 blocks covering the source block
+            j0 = j0 - j0 % 2
+            i0 = i0 - i0 % 2
+            j1 = min(j1 + j1 % 2, src.shape[0])
+            i1 = min(i1 + i1 % 2, src.shape[1])
+            self.levels[n][j0//2:(j1+1)//2, i0//2:(i1+1)//2] = downsample2(src[j0:j1, i0:i1])
+            j0, j1, i0, i1 = j0//2, (j1+1)//2, i0//2, (i1+1)//2
+
+    def update_row_indices(self, rows):
+        "update all levels from sorted source row indices *rows*"
+        rows = np.asarray(rows)
+        if len(rows) == 0:
+            return
+        # runs of consecutive rows
+        breaks = np.flatnonzero(np.diff(rows) > 1) + 1
+        for run in np.split(rows, breaks):
+            self.update_rows(run[0], run[-1]+1)
+
+    def level_for_scale(self, scale):
+        """
+        index of the coarsest level with at least one pixel per screen
+        pixel, for *scale* image pixels per screen pixel
+        """
+        if not scale > 1:
+            return 0
+        return int(min(np.floor(np.log2(scale)), len(self.levels)-1))
+
+    def __getitem__(self, n):
+        return self.levels[n]
@@ -0,0 +1,99 @@
+from __future__ import division, print_function, absolute_import
+from qtpy import QtCore
+import pyqtgraph as pg
+import numpy as np
+
+
+def image_buffer_key(image):
+    "identifies the memory, shape and strides of an array view"
+    return (image.__array_interface__['data'][0], image.shape, image.strides)
+
+
+class ImageTiles(object):
+    """
+    Shows a 2D image (indexed [x, y], like pg.ImageItem) in *plot* as
+    a grid of pg.ImageItem tiles of at most tile_size x tile_size
+    pixels, each showing a view of the image.
+
+    :meth:`set_image` re-renders only the tiles overlapping the part of
+    the image changed since the last call, and Qt repaints only their
+    area, so the cost of a display update is proportional to the changed
+    sub-rectangle. All tiles are re-rendered when the image buffer,
+    its rectangle, the levels or the lookup table change.
+    """
+
+    def __init__(self, plot, tile_size=256):
+        self.plot = plot
+        self.tile_size = tile_size
+        self.tiles = [] # (x0, x1, y0, y1, ImageItem)
+        self.image_key = None
+        self.rect = None
+        self.levels = None
+        self.lut = None
+        self.visible = True
+        self.n_updated = 0 # tiles re-rendered by the last set_image
+
+    def set_image(self, image, rect, region=None, levels=None, lut=None):
+        """
+        Show *image* in QRectF *rect*. *region* (x0, x1, y0, y1) is the
+        part of image changed since the last call, None if unknown.
+        *levels* and *lut* are passed on to the tiles' ImageItems.
+        """
+        if levels is None:
+            levels = (np.nanmin(image), np.nanmax(image))
+        levels = tuple(levels)
+        if image_buffer_key(image) != self.image_key or rect != self.rect:
+            self._build(image, QtCore.QRectF(rect), levels, lut)
+            return
+        if levels != self.levels or lut is not self.lut:
+            self.levels = levels
+            self.lut = lut
+            for x0, x1, y0, y1, item in self.tiles:
+                item.setLookupTable(lut)
+                item.setLevels(levels)
+            self.n_updated = len(self.tiles)
+            return
+        self.n_updated = 0
+        for x0, x1, y0, y1, item in self.tiles:
+            if region is not None:
+                rx0, rx1, ry0, ry1 = region
+                if rx1 <= x0 or rx0 >= x1 or ry1 <= y0 or ry0 >= y1:
+                    continue
+            item.setImage(image[x0:x1, y0:y1], autoLevels=False)
+            self.n_updated += 1
+
+    def _build(self, image, rect, levels, lut):
+        self.clear()
+        self.image_key = image_buffer_key(image)
+        self.rect = rect
+        self.levels = levels
+        self.lut = lut
+        nx, ny = image.shape[:2]
+        sx = rect.width()/nx
+        sy = rect.height()/ny
+        for x0 in range(0, nx, self.tile_size):
+            x1 = min(x0 + self.tile_size, nx)
+            for y0 in range(0, ny, self.tile_size):
+                y1 = min(y0 + self.tile_size, ny)
+                item = pg.ImageItem()
+                item.setLookupTable(lut)
+                item.setImage(image[x0:x1, y0:y1], autoLevels=False, levels=levels)
+                item.setRect(QtCore.QRectF(rect.x() + x0*sx, rect.y() + y0*sy,
+                                           (x1 - x0)*sx, (y1 - y0)*sy))
+                item.setVisible(self.visible)
+                self.plot.addItem(item)
+                self.tiles.append((x0, x1, y0, y1, item))
+        self.n_updated = len(self.tiles)
+
+    def set_visible(self, visible):
+        if visible != self.visible:
+            self.visible = visible
+            for tile in self.tiles:
+                tile[4].setVisible(visible)
+
+    def clear(self):
+        for tile in self.tiles:
+            self.plot.removeItem(tile[4])
+            tile[4].deleteLater()
+        self.tiles = []
+        self.image_key = None
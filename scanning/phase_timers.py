@@ -0,0 +1,163 @@
+from __future__ import division, print_function, absolute_import
+from collections import OrderedDict
+import numpy as np
+import time
+
+try:
+    timer = time.perf_counter
+except AttributeError: # python 2
+    timer = time.time
+
+
+class LogHistogram(object):
+    """
+    Histogram of positive values (e.g. durations in seconds) with
+    HdrHistogram-style log-linear buckets: each power of two above
+    *min_value* is split into *n_sub* linear buckets, so quantiles have
+    a relative error below 1/n_sub over the whole range of *n_powers*
+    powers of two. Values below min_value are counted in the first
+    bucket, values above the range in the last one. count, total and
+    max are exact.
+    """
+
+    def __init__(self, min_value=1e-8, n_powers=40, n_sub=16):
+        self.min_value = min_value
+        self.n_powers = n_powers
+        self.n_sub = n_sub
+        self.counts = np.zeros(n_powers*n_sub, dtype=np.int64)
+        self.total = 0.0
+        self.max = 0.0
+
+    @property
+    def count(self):
+        return int(self.counts.sum())
+
+    @property
+    def mean(self):
+        count = self.count
+        return self.total/count if count else 0.0
+
+    def bucket_edges(self):
+        "lower edges of the buckets, array of len(counts)"
+        e = np.arange(self.n_powers).repeat(self.n_sub)
+        sub = np.tile(np.arange(self.n_sub), self.n_powers)
+        return self.min_value*2.0**e*(1 + sub/self.n_sub)
+
+    def add(self, values):
+        values = np.asarray(values, dtype=float).ravel()
+        if len(values) == 0:
+            return
+        # u = m*2**e with 0.5 <= m < 1
+        m, e = np.frexp(np.maximum(values/self.min_value, 1.0))
+        sub = ((2*m - 1)*self.n_sub).astype(int)
+        idx = np.minimum((e - 1)*self.n_sub + sub, len(self.counts) - 1)
+        self.counts += np.bincount(idx, minlength=len(self.counts))
+        self.total += values.sum()
+        self.max = max(self.max, values.max())
+
+    def merge(self, other):
+        "add the values counted in LogHistogram *other* of the same buckets"
+        assert len(other.counts) == len(self.counts)
+        self.counts += other.counts
+        self.total += other.total
+        self.max = max(self.max, other.max)
+
+    def quantiles(self, q):
+        """
+        Returns values at percentiles *q* (0-100), the middle of the
+        bucket containing each quantile
+        """
+        q = np.asarray(q, dtype=float)
+        cum = np.cumsum(self.counts)
+        if cum[-1] == 0:
+            return np.zeros(q.shape)
+        target = np.maximum(q/100.0*cum[-1], 1e-9)
+        idx = np.minimum(np.searchsorted(cum, target), len(cum) - 1)
+        lower = self.bucket_edges()[idx]
+        width = lower/(self.n_sub + idx % self.n_sub)
+        return np.minimum(lower + 0.5*width, self.max)
+
+
+class PhaseTimers(object):
+    """
+    Low overhead timers of the phases of a loop, e.g. the stage move,
+    data collection and h5 writes of each pixel of a scan::
+
+        T = PhaseTimers(['move', 'collect'])
+        for pixel in ...:
+            T.start()
+            move()
+            T.lap('move')
+            collect()
+            T.lap('collect')
+
+    :meth:`lap` records the time since the previous lap (or start) in a
+    list, which is added to the phase's LogHistogram every *batch_size*
+    laps and by :meth:`aggregate`. Not thread safe, aggregate from the
+    thread calling lap. With *enabled* = False, start and lap do nothing.
+    """
+
+    def __init__(self, phases, enabled=True, batch_size=4096, **hist_kwargs):
+        self.phases = list(phases)
+        self.enabled = enabled
+        self.batch_size = batch_size
+        self.histograms = OrderedDict((p, LogHistogram(**hist_kwargs)) for p in self.phases)
+        self.pending = dict((p, []) for p in self.phases)
+        self.t = timer()
+
+    def start(self):
+        self.t = timer()
+
+    def lap(self, phase):
+        if not self.enabled:
+            return
+        t = timer()
+        pending = self.pending[phase]
+        pending.append(t - self.t)
+        self.t = t
+        if len(pending) >= self.batch_size:
+            self.aggregate(phase)
+
+    def aggregate(self, phase=None):
+        "add pending laps of *phase* (default all phases) to the histograms"
+        for p in ([phase] if phase else self.phases):
+            if self.pending[p]:
+                self.histograms[p].add(self.pending[p])
+                self.pending[p] = []
+
+    def merge(self, other):
+        "add the laps of PhaseTimers *other* (e.g. of a previous pass)"
+        other.aggregate()
+        self.aggregate()
+        for p, hist in other.histograms.items():
+            self.histograms[p].merge(hist)
+
+    def summary(self, q=(50, 90, 99)):
+        """
+        Returns OrderedDict {phase: dict(count, total, mean, max, p50, ...)}
+        with total, mean, max and percentiles *q* in seconds
+        """
+        self.aggregate()
+        out = OrderedDict()
+        for p, hist in self.histograms.items():
+            s = dict(count=hist.count, total=hist.total, mean=hist.mean, max=hist.max)
+            for qi, val in zip(q, hist.quantiles(q)):
+                s['p{:g}'.format(qi)] = float(val)
+            out[p] = s
+        return out
+
+    def save_to_h5(self, h5group, name='phase_timing'):
+        """
+        Save summary as attributes and bucket counts of each phase
+        to a new group *name* of h5group
+        """
+        summary = self.summary()
+        G = h5group.create_group(name)
+        for p, s in summary.items():
+            hist = self.histograms[p]
+            P = G.create_group(p)
+            for key, val in s.items():
+                P.attrs[key] = val
+            P['bucket_edges'] = hist.bucket_edges()
+            P['counts'] = hist.counts
+        return G
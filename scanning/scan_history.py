@@ -0,0 +1,75 @@
+from __future__ import division, print_function, absolute_import
+from .image_pyramid import downsample2
+import numpy as np
+
+
+def image_item_nbytes(img_item):
+    "memory of a pg.ImageItem's image and its rendered 32 bit QImage"
+    img = img_item.image
+    if img is None:
+        return 0
+    return img.nbytes + img.shape[0]*img.shape[1]*4
+
+
+class ImageItemHistory(object):
+    """
+    Images of previous scans kept in a plot (see show_previous_scans in
+    BaseRaster2DScan) within a budget.
+
+    :meth:`add` downsamples an ImageItem's image (a copy, which also
+    releases the full resolution scan data) by factors of 2 until it fits
+    in *max_size* pixels, keeping its dtype, then evicts the least 
+    recently added items until at most *max_items* items (0: no limit) 
+    using *max_bytes* remain.
+    """
+
+    def __init__(self, plot, max_items=0, max_bytes=256e6, max_size=512):
+        self.plot = plot
+        self.max_items = max_items
+        self.max_bytes = max_bytes
+        self.max_size = max_size
+        self.items = [] # oldest first
+
+    @property
+    def nbytes(self):
+        return sum(image_item_nbytes(item) for item in self.items)
+
+    def add(self, img_item, rect):
+        """
+        add img_item (already in plot) showing an image in QRectF *rect*
+        """
+        img = img_item.image
+        if img is None:
+            # never shown
+            self.remove(img_item)
+            return
+        small = np.array(img)
+        while max(small.shape[:2]) > self.max_size:
+            small = downsample2(small)
+        if small.dtype != img.dtype:
+            if img.dtype.kind in 'iu':
+                small = np.rint(small)
+            small = small.astype(img.dtype)
+        img_item.setImage(small, autoLevels=False)
+        img_item.setRect(rect)
+        # the current scan's img_item may be hidden (display_tiles)
+        img_item.setVisible(True)
+        self.items.append(img_item)
+        self.enforce_budget()
+
+    def enforce_budget(self):
+        nbytes = self.nbytes
+        while self.items and ((self.max_items and len(self.items) > self.max_items) 
+                              or nbytes > self.max_bytes):
+            item = self.items.pop(0)
+            nbytes -= image_item_nbytes(item)
+            self.remove(item)
+
+    def remove(self, img_item):
+        self.plot.removeItem(img_item)
+        img_item.deleteLater()
+
+    def clear(self):
+        for item in self.items:
+            self.remove(item)
+        self.items = []
@@ -0,0 +1,198 @@
+from __future__ import division, print_function, absolute_import
+import numpy as np
+
+
+class ScanPath(object):
+    """
+    Abstract sequence of scan pixels.
+
+    Each pixel is described by a tuple (h, v, slow_move, k, j, i) where
+    (h, v) is the stage position, slow_move flags the start of a line and
+    (k, j, i) is the pixel's index into an array of shape scan_shape.
+
+    Pixels can be accessed randomly by pixel index (path[pixel_i]),
+    as arrays for a range of pixels (:meth:`chunk`), in fixed-size
+    chunks (:meth:`iter_chunks`) or one pixel at a time (iteration).
+
+    to subclass, implement :meth:`chunk`
+    """
+
+    chunk_size = 4096
+
+    def __init__(self, Npixels, scan_shape):
+        self.Npixels = Npixels
+        self.scan_shape = scan_shape
+
+    def __len__(self):
+        return self.Npixels
+
+    def chunk(self, start, stop):
+        """
+        returns arrays (h, v, slow_move, k, j, i) for pixels start to stop-1
+        """
+        raise NotImplementedError()
+
+    def __getitem__(self, pixel_i):
+        if pixel_i < 0:
+            pixel_i += self.Npixels
+        if not (0 <= pixel_i < self.Npixels):
+            raise IndexError("pixel index {} out of range".format(pixel_i))
+        return tuple(x[0].item() for x in self.chunk(pixel_i, pixel_i+1))
+
+    def index(self, pixel_i):
+        "returns (k, j, i) scan index of pixel_i"
+        return self[pixel_i][3:]
+
+    def iter_chunks(self, chunk_size=None):
+        """
+        Yields (start, (h, v, slow_move, k, j, i)) for consecutive chunks
+        of at most chunk_size pixels
+        """
+        if chunk_size is None:
+            chunk_size = self.chunk_size
+        for start in range(0, self.Npixels, chunk_size):
+            stop = min(start + chunk_size, self.Npixels)
+            yield start, self.chunk(start, stop)
+
+    def __iter__(self):
+        for start, arrays in self.iter_chunks():
+            # python scalars are much faster to index and compare
+            # than numpy scalars in per-pixel loops
+            for pixel in zip(*[x.tolist() for x in arrays]):
+                yield pixel
+
+    def to_arrays(self):
+        """
+        Returns the materialized scan arrays (scan_h_positions,
+        scan_v_positions, scan_slow_move, scan_index_array), using
+        memory proportional to Npixels
+        """
+        N = self.Npixels
+        h_pos = np.zeros(N, dtype=float)
+        v_pos = np.zeros(N, dtype=float)
+        slow_move = np.zeros(N, dtype=bool)
+        index = np.zeros((N, 3), dtype=int)
+        for start, (h, v, slow, k, j, i) in self.iter_chunks():
+            stop = start + len(h)
+            h_pos[start:stop] = h
+            v_pos[start:stop] = v
+            slow_move[start:stop] = slow
+            index[start:stop] = np.column_stack((k, j, i))
+        return h_pos, v_pos, slow_move, index
+
+    def save_to_h5(self, h5group, chunk_size=None):
+        """
+        Save scan_h_positions, scan_v_positions, scan_slow_move and
+        scan_index_array datasets into h5group, writing one chunk at a time
+        """
+        N = self.Npixels
+        h_h5 = h5group.create_dataset('scan_h_positions', shape=(N,), dtype=float)
+        v_h5 = h5group.create_dataset('scan_v_positions', shape=(N,), dtype=float)
+        slow_h5 = h5group.create_dataset('scan_slow_move', shape=(N,), dtype=bool)
+        index_h5 = h5group.create_dataset('scan_index_array', shape=(N,3), dtype=int)
+        for start, (h, v, slow, k, j, i) in self.iter_chunks(chunk_size):
+            stop = start + len(h)
+            h_h5[start:stop] = h
+            v_h5[start:stop] = v
+            slow_h5[start:stop] = slow
+            index_h5[start:stop] = np.column_stack((k, j, i))
+
+
+class RasterScanPath(ScanPath):
+    """
+    Lazily computed scan path for the BaseRaster2DScan scan types.
+
+    Positions and indices are computed on the fly from h_array and v_array
+    using index arithmetic on the pixel number, so memory use is independent
+    of the number of pixels. Produces the same pixels as the matching
+    BaseRaster2DScan.gen_*_scan generators.
+    """
+
+    scan_types = ('raster', 'serpentine', 'trace_retrace',
+                  'ortho_raster', 'ortho_trace_retrace')
+
+    def __init__(self, scan_type, h_array, v_array):
+        assert scan_type in self.scan_types
+        self.scan_type = scan_type
+        self.h_array = np.asarray(h_array)
+        self.v_array = np.asarray(v_array)
+        Nh = self.Nh = len(h_array)
+        Nv = self.Nv = len(v_array)
+        n_sub = dict(raster=1, serpentine=1, trace_retrace=2,
+                     ortho_raster=2, ortho_trace_retrace=4)[scan_type]
+        ScanPath.__init__(self, Npixels=n_sub*Nh*Nv, scan_shape=(n_sub, Nv, Nh))
+
+    def chunk(self, start, stop):
+        p = np.arange(start, stop)
+        k, j, i, slow = getattr(self, "_%s_indices" % self.scan_type)(p)
+        return (self.h_array[i], self.v_array[j], slow, k, j, i)
+
+    def _raster_indices(self, p):
+        j, i = np.divmod(p, self.Nh)
+        # gen_raster_scan does not flag slow moves
+        return np.zeros_like(p), j, i, np.zeros(len(p), dtype=bool)
+
+    def _serpentine_indices(self, p):
+        j, r = np.divmod(p, self.Nh)
+        i = np.where(j % 2, self.Nh - 1 - r, r)
+        return np.zeros_like(p), j, i, r == 0
+
+    def _trace_retrace_indices(self, p):
+        Nh = self.Nh
+        j, r = np.divmod(p, 2*Nh)
+        k, q = np.divmod(r, Nh)
+        i = np.where(k, Nh - 1 - q, q)
+        return k, j, i, r == 0
+
+    def _ortho_raster_indices(self, p):
+        Nh, Nv = self.Nh, self.Nv
+        N_half = Nh*Nv
+        second = p >= N_half
+        # first half: h fast axis, kk=0
+        j, i = np.divmod(p, Nh)
+        slow = i == 0
+        # second half: v fast axis, kk=1
+        i2, j2 = np.divmod(p - N_half, Nv)
+        j = np.where(second, j2, j)
+        i = np.where(second, i2, i)
+        slow = np.where(second, j2 == 0, slow)
+        return second.astype(p.dtype), j, i, slow
+
+    def _ortho_trace_retrace_indices(self, p):
+        Nh, Nv = self.Nh, self.Nv
+        N_half = 2*Nh*Nv
+        second = p >= N_half
+        # first half: trace kk=0, retrace kk=1 along h
+        k, j, i, slow = self._trace_retrace_indices(p)
+        # second half: trace kk=2, retrace kk=3 along v
+        i2, r = np.divmod(p - N_half, 2*Nv)
+        k2, q = np.divmod(r, Nv)
+        j2 = np.where(k2, Nv - 1 - q, q)
+        k = np.where(second, k2 + 2, k)
+        j = np.where(second, j2, j)
+        i = np.where(second, i2, i)
+        slow = np.where(second, r == 0, slow)
+        return k, j, i, slow
+
+
+class ArrayScanPath(ScanPath):
+    """
+    Scan path backed by fully materialized scan arrays, as created by
+    BaseRaster2DScan.create_empty_scan_arrays and a gen_*_scan generator.
+    Used for custom scan generators that have no lazy equivalent.
+    """
+
+    def __init__(self, scan_h_positions, scan_v_positions, scan_slow_move,
+                 scan_index_array, scan_shape):
+        self.scan_h_positions = scan_h_positions
+        self.scan_v_positions = scan_v_positions
+        self.scan_slow_move = scan_slow_move
+        self.scan_index_array = scan_index_array
+        ScanPath.__init__(self, Npixels=len(scan_h_positions), scan_shape=scan_shape)
+
+    def chunk(self, start, stop):
+        index = self.scan_index_array[start:stop]
+        return (self.scan_h_positions[start:stop],
+                self.scan_v_positions[start:stop],
+                self.scan_slow_move[start:stop],
+                index[:,0], index[:,1], index[:,2])
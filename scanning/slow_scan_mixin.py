@@ -0,0 +1,127 @@
+from __future__ import division, print_function, absolute_import
+from .phase_timers import PhaseTimers
+import time
+
+
+class SlowScanMixin(object):
+    """
+    Settings and helpers shared by the pixel-by-pixel slow scans
+    (BaseRaster2DSlowScan, BaseRaster2DFrameSlowScan), which move the
+    stage to each pixel in the measurement thread.
+
+    Subclasses call :meth:`setup_slow_scan_settings` in setup, before
+    BaseRaster2DScan.setup so the settings exist in scan_specific_setup.
+    """
+
+    # phases of each pixel timed by slow scans, see reset_phase_timers
+    timing_phases = ('move', 'h5_flush', 'settle', 'h5_write', 'collect', 'lq_update')
+    phase_timing_update_period = 1.0
+
+    def setup_slow_scan_settings(self):
+        # settling after slow moves (line starts):
+        # 'time' waits settle_time, 'on_target' calls the stage's
+        # wait_on_target(timeout) hook (up to settle_timeout), 'none'
+        # does not wait. frame_settle_time is the time spent in the
+        # current frame.
+        self.settings.New('settle_mode', dtype=str, initial='time',
+                          choices=('time', 'on_target', 'none'))
+        self.settings.New('settle_time', dtype=float, initial=0.01, vmin=0, unit='s', si=True)
+        self.settings.New('settle_timeout', dtype=float, initial=1.0, vmin=0, unit='s', si=True)
+        self.settings.New('frame_settle_time', dtype=float, ro=True, unit='s', si=True)
+
+        # per pixel time spent in each phase (see reset_phase_timers),
+        # mean and 99th percentile
+        self.settings.New('phase_timing', dtype=bool, initial=True)
+        for phase in self.timing_phases:
+            self.settings.New('t_{}_mean'.format(phase), dtype=float, ro=True, unit='s', si=True)
+            self.settings.New('t_{}_p99'.format(phase), dtype=float, ro=True, unit='s', si=True)
+
+        # backpressure of the background h5 writer (see h5_io.H5AsyncWriter
+        # stats): data written, deepest queue, writes that waited for
+        # a full queue and the time waited, time spent writing
+        self.settings.New('h5_writer_MB', dtype=float, ro=True)
+        self.settings.New('h5_writer_max_queue_depth', dtype=int, ro=True)
+        self.settings.New('h5_writer_blocked_puts', dtype=int, ro=True)
+        self.settings.New('h5_writer_blocked_time', dtype=float, ro=True, unit='s', si=True)
+        self.settings.New('h5_writer_write_time', dtype=float, ro=True, unit='s', si=True)
+
+    def reset_settle_time(self):
+        "start counting settle time of a new frame"
+        self.settings['frame_settle_time'] = 0
+        self._frame_settle_time = 0.0
+
+    def settle_slow_move(self):
+        """
+        Wait for the stage to settle after a slow move, according to
+        settle_mode, and add the time spent to frame_settle_time
+        """
+        S = self.settings
+        t0 = time.time()
+        mode = S['settle_mode']
+        if mode == 'on_target':
+            wait_on_target = getattr(getattr(self, 'stage', None), 'wait_on_target', None)
+            if wait_on_target is None:
+                # fall back for this run, without changing the setting
+                if not getattr(self, 'settle_fallback_warned', False):
+                    self.log.warning("settle_mode on_target: stage has no wait_on_target, "
+                                     "using settle_time")
+                    self.settle_fallback_warned = True
+                mode = 'time'
+            elif not wait_on_target(timeout=S['settle_timeout']):
+                self.log.debug("stage not on target after {} s".format(S['settle_timeout']))
+        if mode == 'time' and S['settle_time'] > 0:
+            time.sleep(S['settle_time'])
+        self._frame_settle_time = getattr(self, '_frame_settle_time', 0.0) + time.time() - t0
+        S.frame_settle_time.update_value_fast(self._frame_settle_time)
+
+    def reset_phase_timers(self):
+        """
+        start new phase timers for a pass of a scan (each frame loop of 
+        a continuous scan), if phase_timing is enabled. The t_<phase> 
+        settings show the timing of the current pass.
+        """
+        self.phase_timers = PhaseTimers(self.timing_phases,
+                                        enabled=self.settings['phase_timing'])
+        self._phase_timing_next_t = 0
+
+    def update_phase_timing(self, force=False):
+        """
+        Update t_<phase>_mean and t_<phase>_p99 from the phase timers,
+        and the h5_writer settings, at most every 
+        phase_timing_update_period seconds unless *force*.
+        Call from the thread running the timers.
+        """
+        t = time.time()
+        if not (force or t >= self._phase_timing_next_t):
+            return
+        self._phase_timing_next_t = t + self.phase_timing_update_period
+        self.update_h5_writer_stats()
+        if not self.phase_timers.enabled:
+            return
+        S = self.settings
+        for phase, s in self.phase_timers.summary(q=(99,)).items():
+            S.get_lq('t_{}_mean'.format(phase)).update_value_fast(s['mean'])
+            S.get_lq('t_{}_p99'.format(phase)).update_value_fast(s['p99'])
+
+    def update_h5_writer_stats(self):
+        "update the h5_writer settings from the stats of self.h5_writer"
+        writer = getattr(self, 'h5_writer', None)
+        if writer is None:
+            return
+        stats = writer.stats
+        S = self.settings
+        S.h5_writer_MB.update_value_fast(stats['bytes']/1e6)
+        S.h5_writer_max_queue_depth.update_value_fast(stats['max_queue_depth'])
+        S.h5_writer_blocked_puts.update_value_fast(stats['blocked_puts'])
+        S.h5_writer_blocked_time.update_value_fast(stats['blocked_time'])
+        S.h5_writer_write_time.update_value_fast(stats['write_time'])
+
+    def save_phase_timing(self, h5_meas_group, phase_timers=None):
+        """
+        save summary and histograms of *phase_timers* (default: those 
+        of the current pass) to h5 group 'phase_timing'
+        """
+        if phase_timers is None:
+            phase_timers = self.phase_timers
+        if phase_timers.enabled:
+            phase_timers.save_to_h5(h5_meas_group)
@@ -0,0 +1,103 @@
+from __future__ import division, print_function, absolute_import
+import numpy as np
+
+
+class HistogramQuantiles(object):
+    """
+    Streaming quantile estimator based on a histogram with *n_bins*
+    equal bins. The histogram range starts at the range of the first
+    values added and is doubled (merging pairs of bins) whenever new
+    values fall outside, so :meth:`add` costs O(len(values)) and
+    quantiles are accurate to about one bin width, range/n_bins.
+    Values can be replaced with :meth:`remove` and :meth:`add`.
+    Non-finite values are ignored.
+    """
+
+    def __init__(self, n_bins=4096):
+        assert n_bins % 2 == 0
+        self.n_bins = n_bins
+        self.counts = np.zeros(n_bins, dtype=np.int64)
+        self.lo = None
+        self.hi = None
+
+    @property
+    def n(self):
+        return int(self.counts.sum())
+
+    def _finite(self, values):
+        values = np.asarray(values, dtype=float).ravel()
+        return values[np.isfinite(values)]
+
+    def _grow(self, vmin, vmax):
+        "extend range to include [vmin, vmax]"
+        if self.lo is None:
+            self.lo, self.hi = vmin, vmax
+            if self.hi <= self.lo:
+                self.hi = self.lo + max(abs(self.lo)*1e-6, 1e-12)
+            return
+        while vmin < self.lo or vmax > self.hi:
+            width = self.hi - self.lo
+            merged = self.counts.reshape(-1, 2).sum(axis=1)
+            self.counts[:] = 0
+            if vmax > self.hi:
+                self.counts[:self.n_bins//2] = merged
+                self.hi += width
+            else:
+                self.counts[self.n_bins//2:] = merged
+                self.lo -= width
+
+    def _bin_counts(self, values):
+        idx = ((values - self.lo)*(self.n_bins/(self.hi - self.lo))).astype(np.int64)
+        return np.bincount(np.clip(idx, 0, self.n_bins-1), minlength=self.n_bins)
+
+    def add(self, values):
+        values = self._finite(values)
+        if len(values) == 0:
+            return
+        self._grow(values.min(), values.max())
+        self.counts += self._bin_counts(values)
+
+    def remove(self, values):
+        """
+        remove previously added *values* (e.g. the old values of 
+        pixels that changed), non-finite values are ignored
+        """
+        values = self._finite(values)
+        if len(values) == 0 or self.lo is None:
+            return
+        counts = self.counts
+        counts -= self._bin_counts(values)
+        # values at bin edges may have been counted in a neighbouring
+        # bin before the range grew (rounding), take them from there
+        for b in np.flatnonzero(counts < 0):
+            for nb in (b-1, b+1):
+                if 0 <= nb < self.n_bins and counts[b] < 0:
+                    take = min(-counts[b], max(counts[nb], 0))
+                    counts[nb] -= take
+                    counts[b] += take
+        np.maximum(counts, 0, out=counts)
+
+    def quantiles(self, q, extra=None):
+        """
+        estimate quantiles *q* (in percent, like np.percentile) of the
+        added values, plus *extra* values that are not added
+        (e.g. a partially acquired row). Returns array of len(q),
+        NaN if there are no values.
+        """
+        counts = self.counts
+        if extra is not None:
+            extra = self._finite(extra)
+            if len(extra):
+                self._grow(extra.min(), extra.max())
+                counts = self.counts + self._bin_counts(extra)
+        q = np.atleast_1d(np.asarray(q, dtype=float))
+        total = counts.sum()
+        if total == 0:
+            return np.full(len(q), np.nan)
+        cum = np.cumsum(counts)
+        # (q=0 falls in the first non-empty bin)
+        target = np.maximum(q/100.*total, 1e-9)
+        i = np.clip(np.searchsorted(cum, target), 0, self.n_bins-1)
+        prev = np.where(i > 0, cum[i-1], 0)
+        frac = np.clip((target - prev)/np.maximum(counts[i], 1), 0, 1)
+        return self.lo + (i + frac)*(self.hi - self.lo)/self.n_bins
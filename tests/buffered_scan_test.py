@@ -0,0 +1,91 @@
+from ScopeFoundry import BaseMicroscopeApp
+from ScopeFoundry.examples.hardware.dummy_daq import DummyBufferedDAQHW
+from ScopeFoundry.scanning import BaseRaster2DBufferedScan
+import numpy as np
+import time
+import unittest
+
+
+class DAQScan(BaseRaster2DBufferedScan):
+
+    name = 'daq_scan'
+
+    def pre_scan_setup(self):
+        self.daq = self.app.hardware['dummy_daq']
+
+    def run_blocks(self):
+        self.run_frame_time = self.settings['frame_time']
+        BaseRaster2DBufferedScan.run_blocks(self)
+
+
+class BufferedScanTest(unittest.TestCase):
+
+    def setUp(self):
+        self.app = BaseMicroscopeApp([])
+        self.daq = self.app.add_hardware(DummyBufferedDAQHW(self.app))
+        self.daq.settings['n_channels'] = 2
+        self.daq.settings['noise'] = 0
+        self.daq.settings['realtime'] = False
+        self.daq.settings['connected'] = True
+        self.scan = self.app.add_measurement(DAQScan(self.app, h_limits=(0, 10), v_limits=(0, 10)))
+
+    def tearDown(self):
+        self.daq.settings['connected'] = False
+
+    def check_scan(self, scan_type):
+        S = self.scan.settings
+        S['scan_type'] = scan_type
+        S['dh'] = 0.1
+        S['dv'] = 0.2
+        S['save_h5'] = False
+        S['block_size'] = 1000
+        self.scan.interrupt_measurement_called = False
+        self.scan.run()
+        h, v, slow, k, j, i = self.scan.scan_path.chunk(0, self.scan.Npixels)
+        expected = self.daq.daq_device.signal(h, v)
+        np.testing.assert_allclose(self.scan.data_map[k, j, i], expected)
+        np.testing.assert_allclose(self.scan.display_image_map[k, j, i], expected[:, 0])
+        self.assertEqual(self.daq.settings['samples_acquired'], self.scan.Npixels)
+        self.assertEqual(S['progress'], 100)
+
+    def test_raster(self):
+        self.check_scan('raster')
+
+    def test_ortho_trace_retrace(self):
+        self.check_scan('ortho_trace_retrace')
+
+    def test_realtime(self):
+        self.daq.settings['connected'] = False
+        self.daq.settings['realtime'] = True
+        self.daq.settings['connected'] = True
+        S = self.scan.settings
+        S['Nh'] = 100
+        S['Nv'] = 100
+        S['pixel_time'] = 1e-5
+        S['save_h5'] = False
+        t0 = time.time()
+        self.scan.interrupt_measurement_called = False
+        self.scan.run()
+        # 10^4 pixels at 100 kHz
+        self.assertGreater(time.time() - t0, 0.09)
+        self.assertAlmostEqual(S['sample_rate'], 1e5)
+
+    def test_clamped_sample_rate(self):
+        self.daq.settings['max_sample_rate'] = 1e5
+        S = self.scan.settings
+        S['Nh'] = 10
+        S['Nv'] = 10
+        S['pixel_time'] = 1e-6
+        S['save_h5'] = False
+        self.scan.interrupt_measurement_called = False
+        self.scan.run()
+        self.assertAlmostEqual(S['sample_rate'], 1e5)
+        # times follow the actual rate during the run, the requested
+        # pixel_time is kept
+        self.assertAlmostEqual(self.scan.run_frame_time, 1e-5*100)
+        self.assertEqual(S['pixel_time'], 1e-6)
+        self.assertAlmostEqual(S['frame_time'], 1e-6*100)
+
+
+if __name__ == '__main__':
+    unittest.main()
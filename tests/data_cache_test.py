@@ -0,0 +1,66 @@
+from ScopeFoundry.data_browser import DataCache
+import numpy as np
+import threading
+import unittest
+
+
+class Closeable(object):
+    closed = False
+    def close(self):
+        self.closed = True
+
+
+class DataCacheTest(unittest.TestCase):
+
+    def test_lru_eviction(self):
+        in_use = []
+        cache = DataCache(max_bytes=2000, in_use=lambda obj: obj in in_use)
+        files = [Closeable() for i in range(3)]
+        for i in range(3):
+            cache.put(('f%i' % i, 0, 'view'), dict(data=np.zeros(100), h5_file=files[i]))
+        # 800 bytes each, f0 evicted
+        self.assertEqual(cache.total_bytes, 1600)
+        self.assertIsNone(cache.get(('f0', 0, 'view')))
+        self.assertTrue(files[0].closed)
+        # use f1, then f3 evicts f2 (least recently used)
+        self.assertIsNotNone(cache.get(('f1', 0, 'view')))
+        in_use.append(files[2])
+        cache.put(('f3', 0, 'view'), dict(data=np.zeros(100)))
+        self.assertIsNone(cache.get(('f2', 0, 'view')))
+        self.assertFalse(files[2].closed) # still in use by a view
+        self.assertTrue(cache.holds(files[1]))
+        self.assertEqual((cache.hits, cache.misses), (1, 2))
+
+    def test_budget(self):
+        cache = DataCache(max_bytes=1000)
+        cache.put('big', dict(data=np.zeros(1000)))
+        self.assertEqual(len(cache.entries), 0)
+        cache.put('a', dict(data=np.zeros(100)))
+        cache.resize(0)
+        self.assertEqual(len(cache.entries), 0)
+        self.assertEqual(cache.total_bytes, 0)
+
+    def test_threads(self):
+        cache = DataCache(max_bytes=8000)
+        def run(n):
+            for i in range(300):
+                key = (n, i % 20)
+                if cache.get(key) is None:
+                    cache.put(key, dict(data=np.zeros(100)))
+                cache.holds(None)
+                if i % 50 == 0:
+                    cache.resize(8000)
+        threads = [threading.Thread(target=run, args=(n,)) for n in range(4)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(cache.total_bytes, 800*len(cache.entries))
+        self.assertLessEqual(cache.total_bytes, 8000)
+        self.assertEqual(cache.hits + cache.misses, 4*300)
+        cache.clear()
+        self.assertEqual(cache.total_bytes, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
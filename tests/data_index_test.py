@@ -0,0 +1,111 @@
+from ScopeFoundry import BaseApp
+from ScopeFoundry.data_index import sniff_file_metadata, DirectoryMetadataIndex
+from ScopeFoundry.data_browser import DataBrowser, HyperSpectralBaseView
+import numpy as np
+import h5py
+import tempfile
+import shutil
+import time
+import os
+import unittest
+
+
+class DataIndexTest(unittest.TestCase):
+
+    def setUp(self):
+        self.app = BaseApp([])
+        self.dir = tempfile.mkdtemp()
+        self.h5_fname = os.path.join(self.dir, 'scan.h5')
+        with h5py.File(self.h5_fname, 'w') as h5:
+            h5.create_dataset('measurement/my_scan/data', shape=(3, 4), dtype='f4')
+        self.npz_fname = os.path.join(self.dir, 'data.npz')
+        np.savez(self.npz_fname, a=np.zeros(3))
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def wait_indexed(self, index, fname, timeout=5.0):
+        t0 = time.time()
+        while fname not in index and time.time() - t0 < timeout:
+            self.app.qtapp.processEvents()
+            time.sleep(0.01)
+
+    def test_sniff(self):
+        meta = sniff_file_metadata(self.h5_fname)
+        self.assertEqual(meta['type'], 'h5')
+        self.assertEqual(meta['measurements'], ['my_scan'])
+        self.assertEqual(meta['datasets']['measurement/my_scan/data'], (3, 4))
+        meta = sniff_file_metadata(self.npz_fname)
+        self.assertEqual(meta['type'], 'npz')
+        self.assertEqual(list(meta['datasets'].keys()), ['a'])
+
+    def test_index_directory(self):
+        index = DirectoryMetadataIndex()
+        index.index_directory(self.dir)
+        self.wait_indexed(index, self.h5_fname)
+        self.assertIn(self.npz_fname, index)
+        meta = index.get(self.h5_fname)
+        meta['view_name'] = 'my_view'
+        self.assertEqual(index.get(self.h5_fname)['view_name'], 'my_view')
+        # changed file is sniffed again
+        with h5py.File(self.h5_fname, 'a') as h5:
+            h5.create_dataset('measurement/other/data', shape=(2,), dtype='f4')
+        os.utime(self.h5_fname, (0, 0))
+        meta = index.get(self.h5_fname)
+        self.assertNotIn('view_name', meta)
+        self.assertEqual(meta['measurements'], ['my_scan', 'other'])
+        # new files are picked up by the watcher
+        new_fname = os.path.join(self.dir, 'new.txt')
+        open(new_fname, 'w').close()
+        self.wait_indexed(index, new_fname)
+        self.assertEqual(index.get(new_fname)['type'], 'other')
+
+
+class CountingHyperSpecView(HyperSpectralBaseView):
+
+    name = 'counting_hyperspec_view'
+    supported_measurements = ('my_scan',)
+
+    def scan_specific_setup(self):
+        self.n_file_checks = 0
+
+    def is_file_supported(self, fname):
+        self.n_file_checks += 1
+        return HyperSpectralBaseView.is_file_supported(self, fname)
+
+
+class AutoSelectViewTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.h5_fname = os.path.join(self.dir, 'scan.h5')
+        with h5py.File(self.h5_fname, 'w') as h5:
+            h5.create_dataset('measurement/my_scan/data', shape=(3, 4, 5), dtype='f4')
+        self.other_fname = os.path.join(self.dir, 'other.h5')
+        with h5py.File(self.other_fname, 'w') as h5:
+            h5.create_dataset('measurement/other_scan/data', shape=(3,), dtype='f4')
+        self.app = DataBrowser([])
+        self.view = self.app.load_view(CountingHyperSpecView(self.app))
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_auto_select_from_index(self):
+        app = self.app
+        # without the index, the file is opened
+        app.settings['use_file_index'] = False
+        self.assertEqual(app.auto_select_view(self.h5_fname), self.view.name)
+        self.assertEqual(app.auto_select_view(self.other_fname), 'file_info')
+        self.assertEqual(self.view.n_file_checks, 2)
+        # once indexed, the view decides from the measurement names
+        app.settings['use_file_index'] = True
+        app.file_index.get(self.h5_fname)
+        app.file_index.get(self.other_fname)
+        self.view.n_file_checks = 0
+        self.assertEqual(app.auto_select_view(self.h5_fname), self.view.name)
+        self.assertEqual(app.auto_select_view(self.other_fname), 'file_info')
+        self.assertEqual(self.view.n_file_checks, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,113 @@
+from ScopeFoundry import BaseApp
+from ScopeFoundry.data_browser import DataBrowser, DataLoader, NPZView
+import numpy as np
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+
+
+class SlowView(object):
+    "stand-in for a DataBrowserView with a long, cancellable load_file"
+
+    def __init__(self, loader):
+        self.loader = loader
+        self.started = []
+        self.loaded = []
+        self.first_started = threading.Event()
+
+    def load_file(self, fname):
+        self.started.append(fname)
+        self.first_started.set()
+        if fname == 'fail':
+            raise ValueError(fname)
+        for i in range(50):
+            time.sleep(0.002)
+            self.loader.check_cancelled()
+        self.loaded.append(fname)
+
+
+class DataLoaderTest(unittest.TestCase):
+
+    def setUp(self):
+        self.app = BaseApp([])
+        self.loader = DataLoader()
+        self.finished = []
+        self.loader.load_finished.connect(
+            lambda gen, view, fname, err: self.finished.append((gen, fname, err)))
+
+    def wait_finished(self, n, timeout=5.0):
+        t0 = time.time()
+        while len(self.finished) < n and time.time() - t0 < timeout:
+            self.app.qtapp.processEvents()
+            time.sleep(0.005)
+
+    def test_newer_request_cancels_load(self):
+        view = SlowView(self.loader)
+        self.loader.request(view, 'a')
+        view.first_started.wait(1.0)
+        gen_b = self.loader.request(view, 'b')
+        self.wait_finished(1)
+        self.assertEqual(view.started, ['a', 'b'])
+        self.assertEqual(view.loaded, ['b'])
+        self.assertEqual(self.finished, [(gen_b, 'b', None)])
+        self.assertTrue(self.loader.is_current(gen_b))
+
+    def test_load_error(self):
+        view = SlowView(self.loader)
+        self.loader.request(view, 'fail')
+        self.wait_finished(1)
+        gen, fname, err = self.finished[0]
+        self.assertIsInstance(err, ValueError)
+
+
+class GatedNPZView(NPZView):
+    "NPZView whose load_file waits for *gate* to be set"
+
+    name = 'gated_npz_view'
+
+    def setup(self):
+        NPZView.setup(self)
+        self.gate = threading.Event()
+
+    def load_file(self, fname):
+        self.gate.wait(5.0)
+        NPZView.load_file(self, fname)
+
+
+class BackgroundLoadTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.fname = os.path.join(self.dir, 'a.npz')
+        np.savez(self.fname, x=np.arange(10))
+        self.app = DataBrowser([])
+        self.app.settings['browse_dir'] = self.dir
+        self.app.settings['prefetch_neighbors'] = False
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_background_load_does_not_block(self):
+        self.assertTrue(NPZView.background_load)
+        view = self.app.load_view(GatedNPZView(self.app))
+        self.app.settings['auto_select_view'] = False
+        self.app.settings['view_name'] = view.name
+        t0 = time.time()
+        self.app.settings['data_filename'] = self.fname
+        # on_change_data_filename returns while load_file waits
+        self.assertLess(time.time() - t0, 1.0)
+        self.assertTrue(view.is_loading)
+        self.assertEqual(view.display_textEdit.toPlainText(), '')
+        view.gate.set()
+        while view.is_loading and time.time() - t0 < 5.0:
+            self.app.qtapp.processEvents()
+            time.sleep(0.005)
+        self.assertFalse(view.is_loading)
+        self.assertIn('x: Array of', view.display_textEdit.toPlainText())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,46 @@
+from ScopeFoundry import BaseApp
+from ScopeFoundry.scanning import BaseRaster2DScan
+import numpy as np
+import unittest
+
+
+class DirtyRowsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.app = BaseApp([])
+        self.scan = BaseRaster2DScan(self.app)
+
+    def test_pop_dirty_rows(self):
+        scan = self.scan
+        scan.display_image_map = np.zeros((1, 10, 8))
+        # not tracked: all rows
+        np.testing.assert_array_equal(scan.pop_dirty_rows(0, 3), np.arange(10))
+        scan.reset_dirty_rows()
+        np.testing.assert_array_equal(scan.pop_dirty_rows(0, 0), np.arange(10))
+        # row 0 still being acquired
+        scan.mark_dirty_row(0, 1)
+        scan.mark_dirty_row(0, 2)
+        np.testing.assert_array_equal(scan.pop_dirty_rows(0, 2), [0, 1, 2])
+        np.testing.assert_array_equal(scan.pop_dirty_rows(0, 2), [2])
+        scan.mark_dirty_row(0, 5)
+        np.testing.assert_array_equal(scan.pop_dirty_rows(0, 5), [2, 5])
+
+    def test_pop_dirty_columns(self):
+        scan = self.scan
+        scan.display_image_map = np.zeros((2, 10, 8))
+        scan.reset_dirty_rows()
+        for kk in range(2):
+            scan.pop_dirty_rows(kk, 0)
+            np.testing.assert_array_equal(scan.pop_dirty_columns(kk, 0), np.arange(8))
+        # column scan of sub-frame 1
+        for jj in range(10):
+            scan.mark_dirty_row(1, jj)
+        scan.mark_dirty_column(1, 3)
+        np.testing.assert_array_equal(scan.pop_dirty_columns(1, 3), [0, 3])
+        np.testing.assert_array_equal(scan.pop_dirty_rows(1, 9), np.arange(10))
+        # sub-frame 0 unchanged
+        np.testing.assert_array_equal(scan.pop_dirty_columns(0, 0), [0])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,89 @@
+from ScopeFoundry import BaseApp
+from ScopeFoundry.scanning import BaseRaster2DFrameSlowScan
+import numpy as np
+import h5py
+import tempfile
+import shutil
+import os
+import unittest
+
+
+class FramedDatasetGrowthTest(unittest.TestCase):
+
+    def setUp(self):
+        self.app = BaseApp([])
+        self.scan = BaseRaster2DFrameSlowScan(self.app, h_limits=(-10,10), v_limits=(-5,5))
+        S = self.scan.settings
+        S['Nh'] = 4
+        S['Nv'] = 3
+        S['n_frames'] = 1
+        S['continuous_scan'] = True
+        S['save_h5'] = True
+        self.scan.compute_scan_params()
+        self.tmp_dir = tempfile.mkdtemp()
+        self.h5_file = h5py.File(os.path.join(self.tmp_dir, 'growth_test.h5'), 'w')
+        self.scan.h5_meas_group = self.h5_file.create_group('measurement')
+        self.scan.h5_framed_datasets = []
+
+    def tearDown(self):
+        self.h5_file.close()
+        shutil.rmtree(self.tmp_dir)
+
+    def count_resizes(self, num_frames):
+        scan = self.scan
+        dset = scan.create_h5_framed_dataset('data', np.zeros(scan.scan_shape))
+        n_resize = 0
+        for frame_i in range(num_frames):
+            if scan.extend_h5_framed_dataset(dset, frame_i):
+                n_resize += 1
+            self.assertGreater(dset.shape[0], frame_i)
+            dset[frame_i] = frame_i
+        scan.trim_h5_framed_datasets(num_frames)
+        self.assertEqual(dset.shape, (num_frames,) + scan.scan_shape)
+        np.testing.assert_array_equal(dset[:,0,0,0], np.arange(num_frames))
+        return n_resize
+
+    def test_n_frames_growth(self):
+        self.scan.settings['h5_growth'] = 'n_frames'
+        self.assertEqual(self.count_resizes(100), 99)
+
+    def test_geometric_growth(self):
+        self.scan.settings['h5_growth'] = 'geometric'
+        # 1, 2, 4, ... 128
+        self.assertEqual(self.count_resizes(100), 7)
+
+    def test_compression_override(self):
+        scan = self.scan
+        scan.settings['h5_compression'] = 'gzip'
+        dset = scan.create_h5_framed_dataset('none', np.zeros(scan.scan_shape),
+                                             compression=None)
+        self.assertIsNone(dset.compression)
+        dset = scan.create_h5_framed_dataset('lzf', np.zeros(scan.scan_shape),
+                                             compression='lzf')
+        self.assertEqual(dset.compression, 'lzf')
+        dset = scan.create_h5_framed_dataset('gzip', np.zeros(scan.scan_shape),
+                                             compression='gzip', compression_opts=9)
+        self.assertEqual(dset.compression_opts, 9)
+
+
+class ScanSpecificSetupScan(BaseRaster2DFrameSlowScan):
+
+    name = 'scan_specific_setup_scan'
+
+    def scan_specific_setup(self):
+        # storage and slow scan settings exist here
+        self.settings['h5_compression'] = 'lzf'
+        self.settings['settle_mode'] = 'none'
+
+
+class ScanSpecificSetupTest(unittest.TestCase):
+
+    def test_settings_in_scan_specific_setup(self):
+        app = BaseApp([])
+        scan = ScanSpecificSetupScan(app)
+        self.assertEqual(scan.h5_storage_policy()['compression'], 'lzf')
+        self.assertEqual(scan.settings['settle_mode'], 'none')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,82 @@
+from ScopeFoundry import h5_io
+import numpy as np
+import h5py
+import tempfile
+import shutil
+import os
+import unittest
+
+
+class H5BufferedWriterTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.h5_file = h5py.File(os.path.join(self.tmp_dir, 'buffer_test.h5'), 'w')
+        self.writer = h5_io.H5BufferedWriter()
+
+    def tearDown(self):
+        self.h5_file.close()
+        shutil.rmtree(self.tmp_dir)
+
+    def test_serpentine_rows(self):
+        shape = (2, 5, 7)
+        ds = self.writer.register(self.h5_file.create_dataset('a', shape, dtype=float))
+        expected = np.zeros(shape)
+        for k in range(2):
+            for j in range(5):
+                for i in range(7)[::(1,-1)[j % 2]]:
+                    expected[k,j,i] = ds[k,j,i] = np.random.rand()
+        self.writer.close()
+        np.testing.assert_array_equal(self.h5_file['a'][()], expected)
+
+    def test_sparse_block(self):
+        # pixels that do not fill their bounding box must not
+        # overwrite existing data
+        shape = (6, 6)
+        dset = self.h5_file.create_dataset('b', data=np.arange(36.).reshape(shape))
+        ds = self.writer.register(dset, block_ndim=2)
+        expected = dset[()]
+        for n in range(6):
+            expected[n,n] = ds[n,n] = -n
+        self.writer.flush()
+        np.testing.assert_array_equal(dset[()], expected)
+
+    def test_spectrum_per_pixel(self):
+        shape = (3, 4, 10)
+        ds = self.writer.register(self.h5_file.create_dataset('c', shape, dtype=float),
+                                  pixel_ndim=2)
+        expected = np.random.rand(*shape)
+        for j in range(3):
+            for i in range(4):
+                ds[j,i,:] = expected[j,i]
+        self.writer.close()
+        np.testing.assert_array_equal(self.h5_file['c'][()], expected)
+
+    def test_async_writer(self):
+        shape = (2, 5, 7)
+        self.writer.async_writer = h5_io.H5AsyncWriter(self.h5_file, maxsize=2)
+        ds = self.writer.register(self.h5_file.create_dataset('d', shape, dtype=float))
+        expected = np.random.rand(*shape)
+        for k in range(2):
+            for j in range(5):
+                for i in range(7):
+                    ds[k,j,i] = expected[k,j,i]
+                self.writer.async_writer.flush()
+        self.writer.close()
+        self.writer.async_writer.close()
+        np.testing.assert_array_equal(self.h5_file['d'][()], expected)
+        self.assertEqual(self.writer.async_writer.stats['records'], 2*5)
+
+    def test_async_writer_error(self):
+        async_writer = h5_io.H5AsyncWriter(self.h5_file)
+        dset = self.h5_file.create_dataset('e', (3,3), dtype=float)
+        async_writer.write(dset, (slice(0,5), 0), np.zeros(5))
+        with self.assertRaises(RuntimeError):
+            async_writer.drain()
+        with self.assertRaises(RuntimeError):
+            async_writer.close()
+        self.assertFalse(async_writer.thread.is_alive())
+
+
+if __name__ == '__main__':
+    unittest.main()
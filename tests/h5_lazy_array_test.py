@@ -0,0 +1,47 @@
+from ScopeFoundry import h5_io
+import numpy as np
+import h5py
+import tempfile
+import shutil
+import os
+import unittest
+
+
+class H5LazyArrayTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.fname = os.path.join(self.tmp_dir, 'lazy_test.h5')
+        self.data = np.random.rand(2, 13, 11, 7)
+        with h5py.File(self.fname, 'w') as f:
+            f.create_dataset('contiguous', data=self.data)
+            f.create_dataset('chunked', data=self.data, chunks=(1, 4, 4, 7), compression='gzip')
+        self.h5_file = h5py.File(self.fname, 'r')
+
+    def tearDown(self):
+        self.h5_file.close()
+        shutil.rmtree(self.tmp_dir)
+
+    def check_array(self, name, is_memmap):
+        a = h5_io.H5LazyArray(self.h5_file[name], index=(1,))
+        # small slabs, several per reduction
+        a.slab_bytes = 3*11*7*8
+        expected = self.data[1]
+        self.assertEqual(a.is_memmap, is_memmap)
+        self.assertEqual(a.shape, expected.shape)
+        np.testing.assert_array_equal(a[3, 4, :], expected[3, 4, :])
+        np.testing.assert_array_equal(a[2:5], expected[2:5])
+        np.testing.assert_allclose(a.reduce_last_axis(), expected.sum(axis=-1))
+        roi = (slice(2, 12), slice(3, 6), slice(None))
+        np.testing.assert_allclose(a.roi_mean(roi), expected[roi].mean(axis=(0,1)))
+        self.assertTrue(np.all(np.isnan(a.roi_mean((slice(5, 5), slice(None), slice(None))))))
+
+    def test_memmap(self):
+        self.check_array('contiguous', True)
+
+    def test_chunked(self):
+        self.check_array('chunked', False)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,84 @@
+"""
+Benchmark HDF5 chunk / compression policies for framed scan datasets.
+
+Writes simulated trace/retrace frames one row at a time, like the row
+blocks flushed by H5BufferedWriter in BaseRaster2DFrameSlowScan, for
+each combination of chunk policy, compression and shuffle, and reports
+write speed (MB/s), time to read back a single frame and compression
+ratio.
+
+usage: python -m ScopeFoundry.tests.h5_storage_benchmark [n_frames Nv Nh]
+"""
+from __future__ import division, print_function
+from ScopeFoundry import h5_io
+import numpy as np
+import h5py
+import tempfile
+import shutil
+import time
+import os
+import sys
+
+
+def simulated_frame(Nv, Nh, frame_i):
+    # smooth image with shot noise, stored as counts
+    y, x = np.mgrid[0:Nv, 0:Nh]
+    image = 1000*(1 + np.sin(0.05*x + 0.1*frame_i)*np.cos(0.07*y))
+    return np.random.poisson(image).astype(np.uint16)
+
+
+def run_policy(h5_file, name, frames, **policy):
+    shape = (2,) + frames[0].shape # trace / retrace
+    dtype = frames[0].dtype
+    n_frames = len(frames)
+    dset = h5_file.create_dataset(name, shape=(n_frames,)+shape, dtype=dtype,
+                                  **h5_io.h5_storage_kwargs((n_frames,)+shape, dtype, **policy))
+    Nv, Nh = shape[1:]
+    t0 = time.time()
+    for frame_i, frame in enumerate(frames):
+        for jj in range(Nv):
+            # interleaved trace / retrace rows
+            dset[frame_i, 0, jj, :] = frame[jj]
+            dset[frame_i, 1, jj, :] = frame[jj, ::-1]
+    h5_file.flush()
+    t_write = time.time() - t0
+
+    t0 = time.time()
+    dset[n_frames//2, 0]
+    t_read = time.time() - t0
+
+    raw_bytes = dset.size*dset.dtype.itemsize
+    stored_bytes = dset.id.get_storage_size()
+    return raw_bytes/t_write/1e6, t_read*1e3, raw_bytes/max(stored_bytes, 1), dset.chunks
+
+
+def main(n_frames=4, Nv=512, Nh=512):
+    frames = [simulated_frame(Nv, Nh, i) for i in range(n_frames)]
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        h5_file = h5py.File(os.path.join(tmp_dir, 'h5_storage_benchmark.h5'), 'w')
+        print("{} frames of 2x{}x{} uint16".format(n_frames, Nv, Nh))
+        print("{:>6} {:>7} {:>7} | {:>8} {:>10} {:>6} | chunks".format(
+            'chunks', 'codec', 'shuffle', 'MB/s', 'frame ms', 'ratio'))
+        n = 0
+        for chunk_policy in h5_io.H5_CHUNK_POLICIES:
+            for compression, gzip_level in [('none', 0), ('lzf', 0),
+                                            ('gzip', 1), ('gzip', 4), ('gzip', 9)]:
+                for shuffle in (False, True):
+                    if compression == 'none' and shuffle:
+                        continue
+                    mb_s, read_ms, ratio, chunks = run_policy(
+                        h5_file, 'd%i' % n, frames,
+                        chunk_policy=chunk_policy, compression=compression,
+                        gzip_level=gzip_level, shuffle=shuffle)
+                    n += 1
+                    codec = compression + (str(gzip_level) if compression == 'gzip' else '')
+                    print("{:>6} {:>7} {:>7} | {:8.1f} {:10.2f} {:6.2f} | {}".format(
+                        chunk_policy, codec, str(shuffle), mb_s, read_ms, ratio, chunks))
+        h5_file.close()
+    finally:
+        shutil.rmtree(tmp_dir)
+
+
+if __name__ == '__main__':
+    main(*[int(x) for x in sys.argv[1:]])
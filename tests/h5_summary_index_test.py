@@ -0,0 +1,108 @@
+from ScopeFoundry.data_index import H5SummaryIndex
+from ScopeFoundry.data_browser import DataBrowser
+import numpy as np
+import h5py
+import tempfile
+import time
+import shutil
+import os
+import unittest
+
+
+class H5SummaryIndexTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def write_file(self, name, sample, time_id, exposure):
+        fname = os.path.join(self.dir, name)
+        with h5py.File(fname, 'w') as h5:
+            h5.attrs['time_id'] = time_id
+            h5.create_group('app/settings').attrs['sample'] = sample
+            m = h5.create_group('measurement/hyperspec_scan')
+            m.create_group('settings').attrs['exposure'] = exposure
+            m['spec_map'] = np.random.rand(1, 100, 120, 16)
+        return fname
+
+    def test_index_and_search(self):
+        f0 = self.write_file('0_hyperspec_scan.h5', 'ZnO_1', 100.0, 0.5)
+        f1 = self.write_file('1_hyperspec_scan.h5', 'GaN', 200.0, 2.0)
+        index = H5SummaryIndex(self.dir)
+        self.assertEqual(index.update(), 2)
+        self.assertEqual(index.update(), 0) # unchanged
+        self.assertEqual(index.search(sample='ZnO%'), [f0])
+        self.assertEqual(index.search(t_start=150.), [f1])
+        self.assertEqual(index.search(exposure=2.0), [f1])
+        self.assertEqual(index.search(**{'hyperspec_scan/exposure': (0, 1)}), [f0])
+        self.assertEqual(index.search(measurement='hyperspec_scan'), [f0, f1])
+        self.assertEqual(index.info(f1)['sample'], 'GaN')
+        preview = index.preview(f0)
+        self.assertEqual(preview.dtype, np.uint8)
+        self.assertEqual(preview.shape, (50, 60))
+        # removed files are dropped from a new index on the same database
+        os.remove(f1)
+        index = H5SummaryIndex(self.dir)
+        index.update_in_background()
+        index.thread.join()
+        self.assertEqual(index.search(), [f0])
+
+    def test_data_browser_search(self):
+        f0 = self.write_file('0_hyperspec_scan.h5', 'ZnO_1', 100.0, 0.5)
+        app = DataBrowser([])
+        app.settings['browse_dir'] = self.dir
+        db_fname = os.path.join(self.dir, H5SummaryIndex.default_db_name)
+        # no sidecar database unless summary_index is enabled
+        with self.assertRaises(RuntimeError):
+            app.search_files(sample='ZnO%')
+        self.assertFalse(os.path.exists(db_fname))
+        app.settings['summary_index'] = True
+        results = []
+        finished = []
+        app.search_finished.connect(lambda paths, err: finished.append(err))
+        app.search_files(results.append, sample='ZnO%')
+        t0 = time.time()
+        while not finished and time.time() - t0 < 5.0:
+            app.qtapp.processEvents()
+            time.sleep(0.005)
+        self.assertEqual(finished, [None])
+        self.assertEqual(results, [[f0]])
+        # no reindexing after the directory is removed
+        app.settings['summary_index'] = False
+        app.summary_index.thread.join()
+
+    def test_summary_search_view(self):
+        f0 = self.write_file('0_hyperspec_scan.h5', 'ZnO_1', 100.0, 0.5)
+        self.write_file('1_hyperspec_scan.h5', 'ZnO_2', 200.0, 2.0)
+        self.write_file('2_hyperspec_scan.h5', 'GaN', 300.0, 0.5)
+        app = DataBrowser([])
+        app.settings['browse_dir'] = self.dir
+        app.settings['auto_select_view'] = False
+        view = app.views['summary_search']
+        app.settings['view_name'] = view.name
+        view.settings['sample'] = 'ZnO%'
+        view.settings['setting_filter'] = 'hyperspec_scan/exposure=0:1'
+        finished = []
+        app.search_finished.connect(lambda paths, err: finished.append(err))
+        # searching enables the summary index
+        view.search()
+        self.assertTrue(app.settings['summary_index'])
+        t0 = time.time()
+        while not finished and time.time() - t0 < 5.0:
+            app.qtapp.processEvents()
+            time.sleep(0.005)
+        self.assertEqual(finished, [None])
+        results = view.results_listWidget
+        self.assertEqual(results.count(), 1)
+        item = results.item(0)
+        self.assertFalse(item.icon().isNull())
+        results.itemActivated.emit(item)
+        self.assertEqual(app.settings['data_filename'], f0)
+        app.settings['summary_index'] = False
+        app.summary_index.thread.join()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,56 @@
+from ScopeFoundry import BaseApp, HardwareComponent
+import unittest
+
+
+class BulkReadHW(HardwareComponent):
+
+    name = 'bulk_read_hw'
+
+    def setup(self):
+        self.settings.New('x', dtype=float)
+        self.settings.New('y', dtype=float)
+        self.settings.New('z', dtype=int)
+        self.device = dict(x=1.0, y=2.0, z=3)
+        self.n_bulk_reads = 0
+        self.n_single_reads = 0
+
+    def connect(self):
+        def read_z():
+            self.n_single_reads += 1
+            return self.device['z']
+        self.settings.z.connect_to_hardware(read_func=read_z)
+        self.bulk_read_func = self.read_xy
+
+    def read_xy(self):
+        self.n_bulk_reads += 1
+        return dict(x=self.device['x'], y=self.device['y'])
+
+
+class HardwareBulkReadTest(unittest.TestCase):
+
+    def setUp(self):
+        self.app = BaseApp([])
+        self.hw = BulkReadHW(self.app)
+        self.hw.connect()
+
+    def test_bulk_read(self):
+        received = []
+        for name in ['x', 'y', 'z']:
+            self.hw.settings.get_lq(name).add_listener(
+                lambda name=name: received.append(name))
+        self.hw.read_from_hardware()
+        self.assertEqual(self.hw.n_bulk_reads, 1)
+        self.assertEqual(self.hw.n_single_reads, 1)
+        self.assertEqual([self.hw.settings[n] for n in 'xyz'], [1.0, 2.0, 3])
+        self.assertEqual(sorted(received), ['x', 'y', 'z'])
+
+        # only changed settings send signals
+        received[:] = []
+        self.hw.device['y'] = 5.0
+        self.hw.read_from_hardware()
+        self.assertEqual(self.hw.settings['y'], 5.0)
+        self.assertEqual(received, ['y'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,67 @@
+from ScopeFoundry.scanning.image_pyramid import ImagePyramid, downsample2
+import numpy as np
+import unittest
+
+
+class ImagePyramidTest(unittest.TestCase):
+
+    def test_downsample2(self):
+        img = np.arange(15, dtype=float).reshape(3, 5)
+        small = downsample2(img)
+        self.assertEqual(small.shape, (2, 3))
+        self.assertEqual(small[0, 0], np.mean([0, 1, 5, 6]))
+        self.assertEqual(small[1, 2], 14)
+        # trailing channel axis
+        rgb = np.stack([img, 2*img, 3*img], axis=-1)
+        small_rgb = downsample2(rgb)
+        self.assertEqual(small_rgb.shape, (2, 3, 3))
+        for c in range(3):
+            np.testing.assert_array_equal(small_rgb[:, :, c], (c+1)*small)
+
+    def test_incremental_rows(self):
+        img = np.zeros((301, 517))
+        pyr = ImagePyramid(img, min_size=32)
+        self.assertEqual(pyr.n_levels, 6)
+        self.assertEqual(pyr[5].shape, (10, 17))
+        data = np.random.rand(*img.shape)
+        # acquire a few rows at a time, as during a scan
+        for j0, j1 in [(0, 3), (3, 40), (40, 41), (41, 200), (200, 301)]:
+            img[j0:j1] = data[j0:j1]
+            pyr.update_rows(j0, j1)
+        full = ImagePyramid(data, min_size=32)
+        for n in range(1, pyr.n_levels):
+            np.testing.assert_allclose(pyr[n], full[n])
+        self.assertAlmostEqual(pyr[5].mean(), data.mean(), places=1)
+
+    def test_row_indices(self):
+        data = np.random.rand(100, 60)
+        img = np.zeros_like(data)
+        pyr = ImagePyramid(img, min_size=16)
+        rows = [0, 1, 2, 7, 40, 41, 99]
+        img[rows] = data[rows]
+        pyr.update_row_indices(rows)
+        full = ImagePyramid(img.copy(), min_size=16)
+        for n in range(1, pyr.n_levels):
+            np.testing.assert_allclose(pyr[n], full[n])
+
+    def test_region(self):
+        data = np.random.rand(100, 60)
+        img = np.zeros_like(data)
+        pyr = ImagePyramid(img, min_size=16)
+        # a few columns, as in column-wise (ortho) scans
+        for j0, j1, i0, i1 in [(0, 100, 0, 3), (0, 100, 3, 4), (0, 50, 4, 5), (50, 100, 4, 60)]:
+            img[j0:j1, i0:i1] = data[j0:j1, i0:i1]
+            pyr.update_region(j0, j1, i0, i1)
+        full = ImagePyramid(img.copy(), min_size=16)
+        for n in range(1, pyr.n_levels):
+            np.testing.assert_allclose(pyr[n], full[n])
+
+    def test_level_for_scale(self):
+        pyr = ImagePyramid(np.zeros((1024, 1024)), min_size=128)
+        self.assertEqual(pyr.level_for_scale(0.5), 0)
+        self.assertEqual(pyr.level_for_scale(2.5), 1)
+        self.assertEqual(pyr.level_for_scale(100), 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,45 @@
+from ScopeFoundry import BaseApp
+from ScopeFoundry.scanning.image_tiles import ImageTiles
+from qtpy import QtCore
+import pyqtgraph as pg
+import numpy as np
+import unittest
+
+
+class ImageTilesTest(unittest.TestCase):
+
+    def setUp(self):
+        self.app = BaseApp([])
+        self.plot = pg.PlotItem()
+
+    def test_dirty_region(self):
+        img = np.random.rand(600, 500)
+        rect = QtCore.QRectF(-1, -1, 2, 2)
+        tiles = ImageTiles(self.plot, tile_size=256)
+        tiles.set_image(img, rect, levels=(0, 1))
+        self.assertEqual(len(tiles.tiles), 6)
+        self.assertEqual(tiles.n_updated, 6)
+        for x0, x1, y0, y1, item in tiles.tiles:
+            np.testing.assert_array_equal(item.image, img[x0:x1, y0:y1])
+        last = tiles.tiles[-1][4].mapRectToParent(tiles.tiles[-1][4].boundingRect())
+        self.assertAlmostEqual(last.right(), 1)
+        self.assertAlmostEqual(last.bottom(), 1)
+
+        # a few changed rows of one tile
+        tiles.set_image(img, rect, region=(300, 310, 0, 500), levels=(0, 1))
+        self.assertEqual(tiles.n_updated, 2)
+        tiles.set_image(img, rect, region=(0, 0, 0, 0), levels=(0, 1))
+        self.assertEqual(tiles.n_updated, 0)
+        # new levels re-render all tiles
+        tiles.set_image(img, rect, region=(0, 0, 0, 0), levels=(0, 2))
+        self.assertEqual(tiles.n_updated, 6)
+        # new image buffer
+        tiles.set_image(img[::2], rect, region=(0, 0, 0, 0), levels=(0, 2))
+        self.assertEqual(len(tiles.tiles), 4)
+
+        tiles.clear()
+        self.assertEqual(tiles.tiles, [])
+
+
+if __name__ == '__main__':
+    unittest.main()
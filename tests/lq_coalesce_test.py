@@ -0,0 +1,55 @@
+from ScopeFoundry import BaseApp
+from ScopeFoundry.logged_quantity import LQCollection
+import time
+import unittest
+
+
+class LQCoalesceTest(unittest.TestCase):
+
+    def setUp(self):
+        self.app = BaseApp([])
+        self.settings = LQCollection()
+        self.received = []
+
+    def process_events(self, duration):
+        t0 = time.time()
+        while time.time() - t0 < duration:
+            self.app.qtapp.processEvents()
+            time.sleep(0.005)
+
+    def test_coalesced_updates(self):
+        lq = self.settings.New('x', dtype=int, coalesce_interval=0.05)
+        lq.add_listener(self.received.append, argtype=int)
+        for i in range(1, 1001):
+            lq.update_value(i)
+        # leading update only, rest is pending
+        self.assertEqual(self.received, [1])
+        self.process_events(0.2)
+        self.assertEqual(self.received, [1, 1000])
+
+    def test_flush(self):
+        self.settings.set_coalesce_interval(10.0)
+        lq = self.settings.New('y', dtype=float)
+        self.assertEqual(lq.coalesce_interval, 10.0)
+        lq.add_listener(self.received.append, argtype=float)
+        lq.update_value(1.0)
+        lq.update_value(2.0)
+        lq.update_value(3.0)
+        self.settings.flush_display_updates()
+        self.assertEqual(self.received, [1.0, 3.0])
+        # nothing pending
+        self.settings.flush_display_updates()
+        self.assertEqual(self.received, [1.0, 3.0])
+
+    def test_disable(self):
+        lq = self.settings.New('z', dtype=int, coalesce_interval=10.0)
+        lq.add_listener(self.received.append, argtype=int)
+        lq.update_value(1)
+        lq.update_value(2)
+        self.settings.set_coalesce_interval(None)
+        lq.update_value(3)
+        self.assertEqual(self.received, [1, 2, 3])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,59 @@
+"""
+Micro-benchmark of LoggedQuantity updates from a non-GUI thread,
+comparing update_value with update_value_fast, with and without Qt
+signals, a connected hardware write function, a display listener and
+coalesced display updates.
+
+usage: python -m ScopeFoundry.tests.lq_update_benchmark [n_updates]
+"""
+from __future__ import division, print_function
+from ScopeFoundry import BaseApp
+from ScopeFoundry.logged_quantity import LQCollection
+from functools import partial
+import threading
+import time
+import sys
+
+
+def updates_per_sec(update_func, n_updates):
+    result = []
+    def run():
+        t0 = time.time()
+        for i in range(n_updates):
+            update_func(float(i))
+        result.append(n_updates/(time.time() - t0))
+    # updates come from an acquisition thread, like Measurement.run
+    thread = threading.Thread(target=run)
+    thread.start()
+    thread.join()
+    return result[0]
+
+
+def main(n_updates=100000):
+    app = BaseApp([])
+    settings = LQCollection()
+    hw_values = []
+    print("{} updates per test, updates/s:".format(n_updates))
+    print("{:>24} {:>14} {:>18}".format('', 'update_value', 'update_value_fast'))
+    for desc, signal, hw, listener, coalesce in [
+            ('no signals',              False, False, False, None),
+            ('signals',                 True,  False, False, None),
+            ('hardware write',          True,  True,  False, None),
+            ('hw + listener',           True,  True,  True,  None),
+            ('hw + listener, coalesced', True, True,  True,  0.1)]:
+        rates = []
+        for method in ('update_value', 'update_value_fast'):
+            lq = settings.New("{}_{}".format(method, len(settings.keys())), dtype=float,
+                              coalesce_interval=coalesce)
+            if hw:
+                lq.connect_to_hardware(write_func=hw_values.append)
+            if listener:
+                lq.add_listener(lambda x: None, argtype=float)
+            rates.append(updates_per_sec(partial(getattr(lq, method), send_signal=signal),
+                                         n_updates))
+        print("{:>24} {:14.0f} {:18.0f}".format(desc, *rates))
+    app.qtapp.processEvents()
+
+
+if __name__ == '__main__':
+    main(*[int(x) for x in sys.argv[1:]])
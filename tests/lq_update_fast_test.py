@@ -0,0 +1,71 @@
+from ScopeFoundry import BaseApp
+from ScopeFoundry.logged_quantity import LQCollection
+import threading
+import time
+import unittest
+
+
+class LQUpdateFastTest(unittest.TestCase):
+
+    def setUp(self):
+        self.app = BaseApp([])
+        self.settings = LQCollection()
+
+    def test_update_value_fast(self):
+        hw_values = []
+        received = []
+        lq = self.settings.New('x', dtype=float)
+        lq.connect_to_hardware(write_func=hw_values.append)
+        lq.add_listener(received.append, argtype=float)
+        lq.update_value_fast(1)
+        lq.update_value_fast(1.0) # same value, no write
+        lq.update_value_fast(2.5)
+        self.assertEqual(lq.val, 2.5)
+        self.assertIs(type(lq.val), float)
+        self.assertEqual(hw_values, [1.0, 2.5])
+        self.assertEqual(received, [1.0, 2.5])
+
+    def test_hardware_gets_last_value(self):
+        hw_values = []
+        lq = self.settings.New('y', dtype=int)
+        lq.connect_to_hardware(write_func=hw_values.append)
+        def run(offset):
+            for i in range(2000):
+                lq.update_value_fast(offset + i, send_signal=False)
+        threads = [threading.Thread(target=run, args=(n*10000,)) for n in range(4)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(hw_values[-1], lq.val)
+
+    def test_writes_serialized(self):
+        "update_value, update_value_fast and write_to_hardware never overlap"
+        active = []
+        overlaps = []
+        def write(x):
+            active.append(x)
+            if len(active) > 1:
+                overlaps.append(x)
+            time.sleep(1e-5)
+            active.pop()
+        lq = self.settings.New('z', dtype=int)
+        lq.connect_to_hardware(write_func=write)
+        def run(method, offset):
+            for i in range(300):
+                if method == 'write_to_hardware':
+                    lq.write_to_hardware()
+                else:
+                    getattr(lq, method)(offset + i, send_signal=False)
+        threads = [threading.Thread(target=run, args=(method, n*10000)) 
+                   for n, method in enumerate(['update_value', 'update_value_fast', 
+                                               'write_to_hardware'])]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(overlaps, [])
+
+
+if __name__ == '__main__':
+    unittest.main()
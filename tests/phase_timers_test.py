@@ -0,0 +1,87 @@
+from ScopeFoundry.scanning.phase_timers import LogHistogram, PhaseTimers
+import numpy as np
+import h5py
+import os
+import shutil
+import tempfile
+import unittest
+
+
+class LogHistogramTest(unittest.TestCase):
+
+    def test_quantiles(self):
+        rng = np.random.RandomState(0)
+        values = rng.lognormal(np.log(1e-4), 1.0, 100000)
+        hist = LogHistogram()
+        for block in np.array_split(values, 7):
+            hist.add(block)
+        self.assertEqual(hist.count, len(values))
+        self.assertAlmostEqual(hist.total, values.sum())
+        self.assertEqual(hist.max, values.max())
+        q = [1, 50, 90, 99]
+        est = hist.quantiles(q)
+        exact = np.percentile(values, q)
+        np.testing.assert_allclose(est, exact, rtol=1.0/hist.n_sub)
+
+    def test_range(self):
+        hist = LogHistogram(min_value=1e-6, n_powers=4)
+        hist.add([0, 1e-9, 1e3])
+        self.assertEqual(hist.counts[0], 2)
+        self.assertEqual(hist.counts[-1], 1)
+        self.assertLess(hist.quantiles(50), 1.1e-6)
+        self.assertLessEqual(hist.quantiles(100), 1e3)
+        self.assertEqual(LogHistogram().quantiles([50, 99]).tolist(), [0, 0])
+
+
+class PhaseTimersTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_laps(self):
+        T = PhaseTimers(['a', 'b'], batch_size=10)
+        for i in range(25):
+            T.start()
+            T.lap('a')
+            T.lap('b')
+        self.assertEqual(T.histograms['a'].count, 20)
+        summary = T.summary()
+        self.assertEqual(list(summary), ['a', 'b'])
+        self.assertEqual(summary['b']['count'], 25)
+        self.assertLessEqual(summary['a']['p50'], summary['a']['max'])
+
+        fname = os.path.join(self.tmpdir, 'timing.h5')
+        with h5py.File(fname, 'w') as f:
+            T.save_to_h5(f)
+        with h5py.File(fname, 'r') as f:
+            P = f['phase_timing/a']
+            self.assertEqual(P.attrs['count'], 25)
+            self.assertEqual(P['counts'][:].sum(), 25)
+            self.assertEqual(P['bucket_edges'].shape, P['counts'].shape)
+
+    def test_merge(self):
+        rng = np.random.RandomState(1)
+        a, b = rng.rand(100), rng.rand(50) + 1
+        run, T = PhaseTimers(['a']), PhaseTimers(['a'])
+        T.histograms['a'].add(a)
+        run.merge(T)
+        T = PhaseTimers(['a'])
+        T.pending['a'].extend(b)
+        run.merge(T)
+        hist = run.histograms['a']
+        self.assertEqual(hist.count, 150)
+        self.assertAlmostEqual(hist.total, a.sum() + b.sum())
+        self.assertEqual(hist.max, b.max())
+
+    def test_disabled(self):
+        T = PhaseTimers(['a'], enabled=False)
+        T.start()
+        T.lap('a')
+        self.assertEqual(T.summary()['a']['count'], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,59 @@
+from ScopeFoundry import BaseApp, HardwareComponent
+from ScopeFoundry.polling import PollingScheduler
+import time
+import unittest
+
+
+class PolledHW(HardwareComponent):
+
+    name = 'polled_hw'
+
+    def setup(self):
+        self.settings.New('fast', dtype=int)
+        self.settings.New('slow', dtype=int)
+        self.n_reads = dict(fast=0, slow=0)
+
+    def connect(self):
+        for name in ['fast', 'slow']:
+            def read_func(name=name):
+                self.n_reads[name] += 1
+                return self.n_reads[name]
+            self.settings.get_lq(name).connect_to_hardware(read_func=read_func)
+
+
+class PollingSchedulerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.app = BaseApp([])
+        self.hw = PolledHW(self.app)
+        self.hw.connect()
+        self.scheduler = PollingScheduler(n_workers=2)
+
+    def tearDown(self):
+        self.scheduler.stop()
+
+    def test_per_lq_intervals(self):
+        self.hw.settings['connected'] = True
+        self.scheduler.register(self.hw, 'fast', 0.01)
+        self.scheduler.register(self.hw, 'slow', 0.1)
+        time.sleep(0.5)
+        self.scheduler.stop()
+        stats = self.scheduler.stats()
+        fast = stats[('polled_hw', 'fast')]
+        slow = stats[('polled_hw', 'slow')]
+        self.assertGreater(fast['polls'], 3*slow['polls'])
+        self.assertGreaterEqual(slow['polls'], 3)
+        self.assertEqual(self.hw.settings['fast'], self.hw.n_reads['fast'])
+        self.assertEqual(fast['polls'], self.hw.n_reads['fast'])
+
+    def test_skip_disconnected(self):
+        self.scheduler.register(self.hw, 'fast', 0.01)
+        time.sleep(0.1)
+        self.scheduler.stop()
+        stats = self.scheduler.stats()[('polled_hw', 'fast')]
+        self.assertEqual(self.hw.n_reads['fast'], 0)
+        self.assertGreater(stats['skipped'], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,98 @@
+from ScopeFoundry import BaseApp, Measurement
+from ScopeFoundry import profiling
+import cProfile
+import os
+import pstats
+import shutil
+import tempfile
+import time
+import unittest
+
+
+def busy(t):
+    t_end = time.time() + t
+    while time.time() < t_end:
+        pass
+
+
+def outer():
+    busy(0.05)
+    inner()
+
+
+def inner():
+    busy(0.15)
+
+
+class ProfiledMeasurement(Measurement):
+
+    name = 'profiled'
+
+    def run(self):
+        self.h5_filename = os.path.join(self.save_dir, 'run.h5')
+        outer()
+
+
+class ProfilingTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def check_stacks(self, stacks):
+        labels = dict((stack[-1].split(' ')[0], stack) for stack in stacks)
+        # busy called from outer and from inner within outer
+        outer_stacks = [s for s in stacks if s[-1].startswith('busy') and s[-2].startswith('outer')]
+        inner_stacks = [s for s in stacks if s[-1].startswith('busy') and s[-2].startswith('inner')]
+        self.assertTrue(outer_stacks and inner_stacks)
+        self.assertTrue(inner_stacks[0][-3].startswith('outer'))
+        t_outer = sum(stacks[s] for s in outer_stacks)
+        t_inner = sum(stacks[s] for s in inner_stacks)
+        self.assertAlmostEqual(t_inner/(t_inner + t_outer), 0.75, delta=0.1)
+        times = profiling.function_times(stacks)
+        self.assertGreater(times[labels['busy'][-1]][0], 1e5)
+
+    def test_pstats(self):
+        profile = cProfile.Profile()
+        profile.enable()
+        outer()
+        profile.disable()
+        stacks = profiling.pstats_to_collapsed(pstats.Stats(profile))
+        self.check_stacks(stacks)
+
+        fname = os.path.join(self.tmpdir, 'test.collapsed')
+        profiling.save_collapsed(stacks, fname)
+        loaded = profiling.load_profile(fname)
+        self.assertEqual(set(loaded), set(stacks))
+
+        rects = profiling.icicle_rects(loaded)
+        total = sum(loaded.values())
+        self.assertAlmostEqual(sum(w for x0, d, w, label in rects if d == 0), total, delta=1e-3*total)
+
+    def test_sampling(self):
+        sampler = profiling.SamplingProfiler(interval=0.002)
+        sampler.start()
+        outer()
+        sampler.stop()
+        self.assertGreater(sampler.n_samples, 20)
+        self.check_stacks(sampler.stacks)
+
+    def test_measurement(self):
+        app = BaseApp([])
+        M = ProfiledMeasurement(app)
+        M.save_dir = self.tmpdir
+        M.settings['profile'] = True
+        M.settings['profile_sampling'] = True
+        M.settings['profile_sample_interval'] = 0.002
+        M._thread_run()
+        for suffix in ['_profile.pstats', '_profile.collapsed', '_sampling.collapsed']:
+            fname = os.path.join(self.tmpdir, 'run' + suffix)
+            self.assertTrue(os.path.exists(fname), fname)
+            stacks = profiling.load_profile(fname)
+            self.assertTrue(any(stack[-1].startswith('busy') for stack in stacks))
+
+
+if __name__ == '__main__':
+    unittest.main()
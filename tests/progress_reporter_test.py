@@ -0,0 +1,41 @@
+from ScopeFoundry import BaseApp, Measurement
+import time
+import unittest
+
+
+class ProgressReporterTest(unittest.TestCase):
+
+    def setUp(self):
+        self.app = BaseApp([])
+        self.measure = Measurement(self.app)
+        self.pushed = []
+        self.measure.progress.updated_value.connect(self.pushed.append)
+
+    def test_throttled(self):
+        M = self.measure
+        M.settings['progress_update_rate'] = 1.0
+        M.start_progress(1000)
+        for i in range(999):
+            M.advance_progress()
+        # only the initial push within 1 s
+        self.assertEqual(M.settings['progress'], 0)
+        M.advance_progress()
+        M.finish_progress()
+        self.assertEqual(M.settings['progress'], 100)
+        self.assertLessEqual(len(self.pushed), 2)
+
+    def test_rate_and_eta(self):
+        M = self.measure
+        M.settings['progress_update_rate'] = 100.0
+        M.start_progress(100)
+        time.sleep(0.1)
+        M.set_progress_count(50)
+        S = M.settings
+        self.assertAlmostEqual(S['progress'], 50)
+        self.assertGreater(S['progress_rate'], 0)
+        self.assertLessEqual(S['progress_rate'], 500)
+        self.assertAlmostEqual(S['progress_eta'], 50/S['progress_rate'])
+
+
+if __name__ == '__main__':
+    unittest.main()
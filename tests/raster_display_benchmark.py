@@ -0,0 +1,110 @@
+"""
+Benchmark BaseRaster2DScan.update_display while a simulated acquisition
+thread fills display_image_map along the scan path at a given pixel rate
+(default 1 MHz), marking the rows and columns it writes with
+mark_dirty_row and mark_dirty_column.
+
+Compares the full redraw (no dirty row tracking, full resolution image,
+exact percentile LUT, single ImageItem) with the dirty region display
+path (image pyramid and streaming LUT updated only from changed rows
+and columns, only changed tiles re-rendered), for several scan types,
+and reports the time spent in update_display per display tick.
+
+usage: python -m ScopeFoundry.tests.raster_display_benchmark [N duration pixel_rate scan_types]
+scan_types is a comma separated list, default raster,trace_retrace,ortho_raster
+"""
+from __future__ import division, print_function
+from ScopeFoundry import BaseMicroscopeApp
+from ScopeFoundry.scanning import BaseRaster2DScan
+import numpy as np
+import threading
+import time
+import sys
+
+
+def acquire(scan, pixel_rate, stop_event, block_size=1024):
+    "write display_image_map along the scan path in real time at pixel_rate"
+    t0 = time.time()
+    pixel_i = 0
+    while not stop_event.is_set():
+        for start, (h, v, slow_move, k, j, i) in scan.scan_path.iter_chunks(block_size):
+            if stop_event.is_set():
+                break
+            scan.display_image_map[k, j, i] = np.random.poisson(100, len(k))
+            scan.mark_dirty_row(k, j)
+            scan.mark_dirty_column(k, i)
+            scan.current_scan_index = (k[-1], j[-1], i[-1])
+            pixel_i += len(k)
+            delay = t0 + pixel_i/pixel_rate - time.time()
+            if delay > 0:
+                time.sleep(delay)
+
+
+def run(app, scan, duration, pixel_rate, dirty_region):
+    S = scan.settings
+    S['display_pyramid'] = dirty_region
+    S['display_tiles'] = dirty_region
+    S['lut_levels'] = 'streaming' if dirty_region else 'exact'
+    scan.compute_scan_path()
+    scan.display_image_map = np.zeros(scan.scan_shape, dtype=float)
+    scan.reset_dirty_rows()
+    if not dirty_region:
+        scan.dirty_rows = None
+        scan.dirty_cols = None
+        # marks are ignored
+        scan.mark_dirty_row = lambda kk, jj: None
+        scan.mark_dirty_column = lambda kk, ii: None
+    else:
+        scan.__dict__.pop('mark_dirty_row', None)
+        scan.__dict__.pop('mark_dirty_column', None)
+    scan.current_scan_index = (0, 0, 0)
+    scan.initial_scan_setup_plotting = True
+    scan.update_display()
+
+    stop_event = threading.Event()
+    thread = threading.Thread(target=acquire, args=(scan, pixel_rate, stop_event))
+    thread.start()
+    times = []
+    t_end = time.time() + duration
+    while time.time() < t_end:
+        t0 = time.time()
+        scan.update_display()
+        t1 = time.time()
+        # repaint
+        app.qtapp.processEvents()
+        t2 = time.time()
+        times.append((t1 - t0, t2 - t0))
+        time.sleep(max(0, scan.display_update_period - (t2 - t0)))
+    stop_event.set()
+    thread.join()
+    return np.array(times)
+
+
+def main(N=4096, duration=5.0, pixel_rate=1e6, scan_types='raster,trace_retrace,ortho_raster'):
+    app = BaseMicroscopeApp([])
+    scan = app.add_measurement(BaseRaster2DScan(app))
+    scan.settings['Nh'] = N
+    scan.settings['Nv'] = N
+    scan.settings['show_previous_scans'] = False
+    scan.compute_scan_params()
+    scan.setup_figure()
+    scan.ui.show()
+    scan.ui.resize(800, 800)
+    app.qtapp.processEvents()
+    print("{0}x{0} scan at {1:g} pixels/s, time per display tick in update_display"
+          " and including repaint:".format(N, pixel_rate))
+    print("{:>20} {:>12} {:>8} {:>10} {:>10} {:>12} {:>10}".format(
+        'scan_type', '', 'ticks', 'mean ms', 'max ms', 'repaint ms', 'busy %'))
+    for scan_type in scan_types.split(','):
+        scan.settings['scan_type'] = scan_type
+        for desc, dirty_region in [('full redraw', False), ('dirty region', True)]:
+            times = run(app, scan, duration, pixel_rate, dirty_region)
+            update, total = times[:,0], times[:,1]
+            print("{:>20} {:>12} {:8d} {:10.2f} {:10.2f} {:12.2f} {:10.1f}".format(
+                scan_type, desc, len(times), 1e3*update.mean(), 1e3*update.max(),
+                1e3*total.mean(), 100*total.sum()/duration))
+
+
+if __name__ == '__main__':
+    types = [int, float, float, str]
+    main(*[types[i](x) for i, x in enumerate(sys.argv[1:])])
@@ -0,0 +1,79 @@
+from ScopeFoundry import BaseApp
+from ScopeFoundry.scanning import BaseRaster2DScan
+from ScopeFoundry.scanning.image_pyramid import ImagePyramid
+import numpy as np
+import unittest
+
+
+class RasterDisplayTest(unittest.TestCase):
+
+    def setUp(self):
+        self.app = BaseApp([])
+        self.scan = BaseRaster2DScan(self.app)
+        S = self.scan.settings
+        S['Nh'] = 300
+        S['Nv'] = 280
+        S['show_previous_scans'] = False
+
+    def acquire(self, scan_type, block_size=150):
+        "acquire along the scan path, updating the display every block"
+        scan = self.scan
+        scan.settings['scan_type'] = scan_type
+        scan.setup_figure()
+        scan.compute_scan_path()
+        scan.display_image_map = np.zeros(scan.scan_shape)
+        scan.reset_dirty_rows()
+        scan.current_scan_index = (0, 0, 0)
+        scan.initial_scan_setup_plotting = True
+        scan.update_display()
+        data = np.random.rand(*scan.scan_shape)
+        seen = set()
+        for start, (h, v, slow_move, k, j, i) in scan.scan_path.iter_chunks(block_size):
+            scan.display_image_map[k, j, i] = data[k, j, i]
+            scan.mark_dirty_row(k, j)
+            scan.mark_dirty_column(k, i)
+            scan.current_scan_index = (k[-1], j[-1], i[-1])
+            scan.update_display()
+            seen.update(scan.display_pyramids.values())
+        return data, seen
+
+    def check_pyramids(self, scan_type):
+        data, seen = self.acquire(scan_type)
+        pyramids = self.scan.display_pyramids
+        # one pyramid per sub-frame, kept during the scan
+        self.assertEqual(len(pyramids), self.scan.scan_shape[0])
+        self.assertEqual(seen, set(pyramids.values()))
+        for (map_id, kk), pyr in pyramids.items():
+            full = ImagePyramid(data[kk])
+            self.assertGreater(pyr.n_levels, 1)
+            for n in range(pyr.n_levels):
+                np.testing.assert_allclose(pyr[n], full[n])
+
+    def check_lut_levels(self, scan_type):
+        self.scan.settings['lut_levels'] = 'streaming'
+        data, seen = self.acquire(scan_type)
+        quantiles = self.scan.lut_quantiles
+        self.assertEqual(len(quantiles), self.scan.scan_shape[0])
+        for (map_id, kk), (hq, values) in quantiles.items():
+            self.assertEqual(hq.n, data[kk].size)
+            np.testing.assert_array_equal(values, data[kk])
+            np.testing.assert_allclose(hq.quantiles((1, 99)), np.percentile(data[kk], (1, 99)),
+                                       atol=2*(hq.hi - hq.lo)/hq.n_bins)
+        # hist_lut shows the streaming histogram of the current sub-frame
+        kk = self.scan.current_scan_index[0]
+        x, y = self.scan.hist_lut.plot.getData()
+        self.assertEqual(y.sum(), data[kk].size)
+
+    def test_trace_retrace(self):
+        self.check_pyramids('trace_retrace')
+
+    def test_ortho_raster(self):
+        self.check_pyramids('ortho_raster')
+
+    def test_lut_levels(self):
+        self.check_lut_levels('trace_retrace')
+        self.check_lut_levels('ortho_raster')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,125 @@
+from ScopeFoundry import BaseApp
+from ScopeFoundry.scanning import BaseRaster2DScan
+import numpy as np
+import unittest
+
+
+class LoopScanArrays(object):
+    """
+    Reference pixel-by-pixel implementation of the BaseRaster2DScan
+    scan generators, used to check the vectorized versions.
+    """
+
+    def __init__(self, scan_type, h_array, v_array):
+        self.h_array = h_array
+        self.v_array = v_array
+        self.Nh = len(h_array)
+        self.Nv = len(v_array)
+        getattr(self, "gen_%s_scan" % scan_type)()
+
+    def create_empty_scan_arrays(self, Npixels):
+        self.Npixels = Npixels
+        self.scan_h_positions = np.zeros(Npixels, dtype=float)
+        self.scan_v_positions = np.zeros(Npixels, dtype=float)
+        self.scan_slow_move   = np.zeros(Npixels, dtype=bool)
+        self.scan_index_array = np.zeros((Npixels, 3), dtype=int)
+
+    def gen_serpentine_scan(self):
+        self.create_empty_scan_arrays(self.Nh*self.Nv)
+        pixel_i = 0
+        for jj in range(self.Nv):
+            self.scan_slow_move[pixel_i] = True
+            if jj % 2: #odd lines
+                h_line_indicies = range(self.Nh)[::-1]
+            else:
+                h_line_indicies = range(self.Nh)
+            for ii in h_line_indicies:
+                self.scan_v_positions[pixel_i] = self.v_array[jj]
+                self.scan_h_positions[pixel_i] = self.h_array[ii]
+                self.scan_index_array[pixel_i,:] = [0, jj, ii]
+                pixel_i += 1
+
+    def gen_trace_retrace_scan(self):
+        self.create_empty_scan_arrays(2*self.Nh*self.Nv)
+        pixel_i = 0
+        for jj in range(self.Nv):
+            self.scan_slow_move[pixel_i] = True
+            for kk, step in [(0,1),(1,-1)]:
+                for ii in range(self.Nh)[::step]:
+                    self.scan_v_positions[pixel_i] = self.v_array[jj]
+                    self.scan_h_positions[pixel_i] = self.h_array[ii]
+                    self.scan_index_array[pixel_i,:] = [kk, jj, ii]
+                    pixel_i += 1
+
+    def gen_ortho_raster_scan(self):
+        self.create_empty_scan_arrays(2*self.Nh*self.Nv)
+        pixel_i = 0
+        for jj in range(self.Nv):
+            self.scan_slow_move[pixel_i] = True
+            for ii in range(self.Nh):
+                self.scan_v_positions[pixel_i] = self.v_array[jj]
+                self.scan_h_positions[pixel_i] = self.h_array[ii]
+                self.scan_index_array[pixel_i,:] = [0, jj, ii]
+                pixel_i += 1
+        for ii in range(self.Nh):
+            self.scan_slow_move[pixel_i] = True
+            for jj in range(self.Nv):
+                self.scan_v_positions[pixel_i] = self.v_array[jj]
+                self.scan_h_positions[pixel_i] = self.h_array[ii]
+                self.scan_index_array[pixel_i,:] = [1, jj, ii]
+                pixel_i += 1
+
+    def gen_ortho_trace_retrace_scan(self):
+        self.create_empty_scan_arrays(4*self.Nh*self.Nv)
+        pixel_i = 0
+        for jj in range(self.Nv):
+            self.scan_slow_move[pixel_i] = True
+            for kk, step in [(0,1),(1,-1)]:
+                for ii in range(self.Nh)[::step]:
+                    self.scan_v_positions[pixel_i] = self.v_array[jj]
+                    self.scan_h_positions[pixel_i] = self.h_array[ii]
+                    self.scan_index_array[pixel_i,:] = [kk, jj, ii]
+                    pixel_i += 1
+        for ii in range(self.Nh):
+            self.scan_slow_move[pixel_i] = True
+            for kk, step in [(2,1),(3,-1)]:
+                for jj in range(self.Nv)[::step]:
+                    self.scan_v_positions[pixel_i] = self.v_array[jj]
+                    self.scan_h_positions[pixel_i] = self.h_array[ii]
+                    self.scan_index_array[pixel_i,:] = [kk, jj, ii]
+                    pixel_i += 1
+
+
+class ScanGeneratorTest(unittest.TestCase):
+
+    def setUp(self):
+        self.app = BaseApp([])
+        self.scan = BaseRaster2DScan(self.app, h_limits=(-10,10), v_limits=(-5,5))
+
+    def check_scan_type(self, scan_type, Nh, Nv):
+        S = self.scan.settings
+        S['Nh'] = Nh
+        S['Nv'] = Nv
+        S['scan_type'] = scan_type
+        self.scan.compute_scan_arrays()
+
+        ref = LoopScanArrays(scan_type, self.scan.h_array, self.scan.v_array)
+
+        self.assertEqual(self.scan.Npixels, ref.Npixels)
+        for name in ['scan_h_positions', 'scan_v_positions', 
+                     'scan_slow_move', 'scan_index_array']:
+            a = getattr(self.scan, name)
+            b = getattr(ref, name)
+            self.assertEqual(a.dtype, b.dtype)
+            # bit-identical, not just close
+            self.assertEqual(a.tobytes(), b.tobytes(), msg=name)
+
+    def test_generators_match_loops(self):
+        for scan_type in ['serpentine', 'trace_retrace',
+                          'ortho_raster', 'ortho_trace_retrace']:
+            for Nh, Nv in [(11, 11), (7, 4), (1, 5), (6, 1)]:
+                self.check_scan_type(scan_type, Nh, Nv)
+
+
+if __name__ == '__main__':
+    unittest.main()
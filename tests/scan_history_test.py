@@ -0,0 +1,98 @@
+from ScopeFoundry import BaseApp
+from ScopeFoundry.scanning.scan_history import ImageItemHistory
+from ScopeFoundry.scanning import BaseRaster2DScan
+from qtpy import QtCore
+import pyqtgraph as pg
+import numpy as np
+import unittest
+
+
+class ImageItemHistoryTest(unittest.TestCase):
+
+    def setUp(self):
+        self.app = BaseApp([])
+        self.plot = pg.PlotItem()
+
+    def new_item(self, shape=(1000, 800)):
+        item = pg.ImageItem()
+        self.plot.addItem(item)
+        item.setImage(np.random.rand(*shape))
+        return item
+
+    def test_downsample_and_evict(self):
+        history = ImageItemHistory(self.plot, max_items=3, max_bytes=1e9, max_size=300)
+        rect = QtCore.QRectF(0, 0, 10, 8)
+        items = [self.new_item() for i in range(5)]
+        for item in items:
+            history.add(item, rect)
+        self.assertEqual(history.items, items[2:])
+        self.assertEqual(items[-1].image.shape, (250, 200))
+        self.assertEqual(history.nbytes, 3*250*200*12)
+        self.assertNotIn(items[0], self.plot.items)
+        # byte budget
+        history.max_bytes = 250*200*12
+        history.enforce_budget()
+        self.assertEqual(history.items, items[4:])
+        history.clear()
+        self.assertEqual(history.nbytes, 0)
+        self.assertNotIn(items[4], self.plot.items)
+
+    def test_rgb_and_unlimited_count(self):
+        history = ImageItemHistory(self.plot, max_items=0, max_bytes=1e9, max_size=300)
+        rect = QtCore.QRectF(0, 0, 10, 8)
+        items = []
+        for i in range(12):
+            item = pg.ImageItem()
+            self.plot.addItem(item)
+            item.setImage(np.random.randint(0, 256, (1000, 800, 3)).astype(np.uint8))
+            history.add(item, rect)
+            items.append(item)
+        self.assertEqual(history.items, items)
+        self.assertEqual(items[0].image.shape, (250, 200, 3))
+        self.assertEqual(items[0].image.dtype, np.uint8)
+
+
+class ScanHistoryTest(unittest.TestCase):
+
+    def test_img_items(self):
+        app = BaseApp([])
+        scan = BaseRaster2DScan(app)
+        scan.settings['Nh'] = 20
+        scan.settings['Nv'] = 10
+        self.assertEqual(scan.img_items, [])
+        scan.setup_figure()
+        self.assertEqual(scan.img_items, [scan.img_item])
+        for i in range(3):
+            scan.compute_scan_path()
+            scan.display_image_map = np.random.rand(*scan.scan_shape)
+            scan.initial_scan_setup_plotting = True
+            scan.update_display()
+        # two previous scans, the empty item of setup_figure is dropped
+        self.assertEqual(len(scan.img_items), 3)
+        self.assertIs(scan.img_items[-1], scan.img_item)
+        scan.clear_previous_scans()
+        self.assertEqual(scan.img_items, [scan.img_item])
+
+    def test_history_visible_with_tiles(self):
+        app = BaseApp([])
+        scan = BaseRaster2DScan(app)
+        scan.settings['Nh'] = 20
+        scan.settings['Nv'] = 10
+        scan.settings['display_tiles'] = True
+        scan.setup_figure()
+        for i in range(3):
+            scan.compute_scan_path()
+            scan.display_image_map = np.random.rand(*scan.scan_shape)
+            scan.current_scan_index = (0, 0, 0)
+            scan.initial_scan_setup_plotting = True
+            scan.update_display()
+            # with display_tiles the current img_item is hidden
+            scan.update_display()
+            self.assertFalse(scan.img_item.isVisible())
+        self.assertEqual(len(scan.scan_history.items), 2)
+        for item in scan.scan_history.items:
+            self.assertTrue(item.isVisible())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,52 @@
+from ScopeFoundry import BaseApp
+from ScopeFoundry.scanning import BaseRaster2DScan
+from ScopeFoundry.scanning.base_raster_scan import SCAN_ARRAY_NAMES
+from ScopeFoundry.scanning.scan_path import RasterScanPath, ArrayScanPath
+import numpy as np
+import unittest
+
+
+class RasterScanPathTest(unittest.TestCase):
+
+    def setUp(self):
+        self.app = BaseApp([])
+        self.scan = BaseRaster2DScan(self.app, h_limits=(-10,10), v_limits=(-5,5))
+
+    def check_scan_type(self, scan_type, Nh, Nv):
+        S = self.scan.settings
+        S['Nh'] = Nh
+        S['Nv'] = Nv
+        S['scan_type'] = scan_type
+        self.scan.compute_scan_arrays()
+        arrays = [getattr(self.scan, name) for name in SCAN_ARRAY_NAMES]
+        scan_path = self.scan.compute_scan_path()
+        self.assertIsInstance(scan_path, RasterScanPath)
+        self.assertEqual(scan_path.scan_shape, self.scan.scan_shape)
+
+        ref = ArrayScanPath(*(arrays + [self.scan.scan_shape]))
+
+        # scan array attributes, materialized from scan_path
+        for name, x in zip(SCAN_ARRAY_NAMES, arrays):
+            y = getattr(self.scan, name)
+            self.assertIsNot(x, y)
+            np.testing.assert_array_equal(x, y)
+
+        # chunked access, with chunks that do not divide Npixels
+        for (start, a), (_, b) in zip(scan_path.iter_chunks(7), ref.iter_chunks(7)):
+            for x, y in zip(a, b):
+                np.testing.assert_array_equal(x, y)
+
+        # per pixel iteration and random access
+        ref_pixels = list(ref)
+        self.assertEqual(list(scan_path), ref_pixels)
+        for pixel_i in [0, 1, scan_path.Npixels//2, scan_path.Npixels-1]:
+            self.assertEqual(scan_path[pixel_i], ref_pixels[pixel_i])
+
+    def test_scan_path_matches_scan_arrays(self):
+        for scan_type in RasterScanPath.scan_types:
+            for Nh, Nv in [(11, 11), (7, 4), (1, 5), (6, 1)]:
+                self.check_scan_type(scan_type, Nh, Nv)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,92 @@
+from ScopeFoundry import BaseApp, h5_io
+from ScopeFoundry.scanning import BaseRaster2DSlowScan
+import numpy as np
+import h5py
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+
+class Stage(object):
+
+    def __init__(self):
+        self.waits = []
+
+    def wait_on_target(self, timeout):
+        self.waits.append(timeout)
+        return True
+
+
+class SettleTest(unittest.TestCase):
+
+    def setUp(self):
+        self.app = BaseApp([])
+        self.scan = BaseRaster2DSlowScan(self.app)
+        self.scan.reset_settle_time()
+
+    def test_settle_time(self):
+        S = self.scan.settings
+        S['settle_time'] = 0.02
+        t0 = time.time()
+        for i in range(3):
+            self.scan.settle_slow_move()
+        self.assertGreaterEqual(time.time() - t0, 0.06)
+        self.assertGreaterEqual(S['frame_settle_time'], 0.06)
+        self.scan.reset_settle_time()
+        self.assertEqual(S['frame_settle_time'], 0)
+
+    def test_on_target_and_none(self):
+        S = self.scan.settings
+        S['settle_time'] = 1.0
+        S['settle_mode'] = 'on_target'
+        self.scan.stage = Stage()
+        S['settle_timeout'] = 0.5
+        t0 = time.time()
+        self.scan.settle_slow_move()
+        S['settle_mode'] = 'none'
+        self.scan.settle_slow_move()
+        self.assertLess(time.time() - t0, 0.5)
+        self.assertEqual(self.scan.stage.waits, [0.5])
+
+    def test_on_target_fallback(self):
+        S = self.scan.settings
+        S['settle_time'] = 0.0
+        S['settle_mode'] = 'on_target'
+        with self.assertLogs(self.scan.log, 'WARNING') as logs:
+            self.scan.settle_slow_move()
+            self.scan.settle_slow_move()
+        self.assertEqual(len(logs.output), 1)
+        # the setting is kept, the fallback is for this run only
+        self.assertEqual(S['settle_mode'], 'on_target')
+
+
+class H5WriterStatsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.app = BaseApp([])
+        self.scan = BaseRaster2DSlowScan(self.app)
+        self.tmp_dir = tempfile.mkdtemp()
+        self.h5_file = h5py.File(os.path.join(self.tmp_dir, 'stats_test.h5'), 'w')
+
+    def tearDown(self):
+        self.h5_file.close()
+        shutil.rmtree(self.tmp_dir)
+
+    def test_h5_writer_stats(self):
+        S = self.scan.settings
+        self.scan.h5_writer = h5_io.H5AsyncWriter(self.h5_file)
+        dset = self.h5_file.create_dataset('a', (4, 10), dtype=float)
+        for j in range(4):
+            self.scan.h5_writer.write(dset, j, np.ones(10))
+        self.scan.h5_writer.close()
+        self.scan.update_h5_writer_stats()
+        self.assertEqual(S['h5_writer_MB'], 4*10*8/1e6)
+        self.assertGreaterEqual(S['h5_writer_max_queue_depth'], 1)
+        self.assertEqual(S['h5_writer_blocked_puts'], 0)
+        self.assertGreater(S['h5_writer_write_time'], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
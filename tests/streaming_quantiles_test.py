@@ -0,0 +1,46 @@
+from ScopeFoundry.scanning.streaming_quantiles import HistogramQuantiles
+import numpy as np
+import unittest
+
+
+class HistogramQuantilesTest(unittest.TestCase):
+
+    def test_quantiles(self):
+        data = np.random.lognormal(size=(200, 300))
+        hq = HistogramQuantiles(n_bins=4096)
+        # range grows as rows are added
+        for j in range(0, 200, 7):
+            hq.add(data[j:j+7])
+        self.assertEqual(hq.n, data.size)
+        est = hq.quantiles((1, 50, 99))
+        exact = np.percentile(data, (1, 50, 99))
+        tol = 2*(hq.hi - hq.lo)/hq.n_bins
+        np.testing.assert_allclose(est, exact, atol=tol)
+
+    def test_extra_and_nan(self):
+        hq = HistogramQuantiles()
+        self.assertTrue(np.all(np.isnan(hq.quantiles((1, 99)))))
+        hq.add([np.nan, 5.0, 5.0])
+        hq.add(np.arange(10.))
+        est = hq.quantiles((0, 100), extra=[-10., 20.])
+        np.testing.assert_allclose(est, [-10, 20], atol=0.1)
+        # extra values are not added
+        self.assertEqual(hq.n, 12)
+
+    def test_remove(self):
+        data = np.random.rand(100, 50)
+        hq = HistogramQuantiles()
+        hq.add(data)
+        # replace a block, with values outside the current range
+        new = 10*np.random.rand(20, 50)
+        hq.remove(data[30:50])
+        hq.add(new)
+        data[30:50] = new
+        self.assertEqual(hq.n, data.size)
+        est = hq.quantiles((1, 50, 99))
+        exact = np.percentile(data, (1, 50, 99))
+        np.testing.assert_allclose(est, exact, atol=2*(hq.hi - hq.lo)/hq.n_bins)
+
+
+if __name__ == '__main__':
+    unittest.main()
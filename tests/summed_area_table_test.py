@@ -0,0 +1,51 @@
+from ScopeFoundry import h5_io
+from ScopeFoundry.data_browser import SummedAreaTable
+import numpy as np
+import h5py
+import tempfile
+import shutil
+import os
+import unittest
+
+
+class SmallSlabSummedAreaTable(SummedAreaTable):
+    slab_bytes = 3*11*5*8
+
+
+class SummedAreaTableTest(unittest.TestCase):
+
+    def setUp(self):
+        self.data = np.random.rand(13, 11, 5)
+
+    def check_rects(self, sat, rtol):
+        for j_slice, i_slice in [(slice(0, 13), slice(0, 11)), (slice(2, 7), slice(4, 5)),
+                                 (slice(12, 13), slice(0, 3)), (slice(3, 9), slice(10, 20))]:
+            expected = self.data[j_slice, i_slice].mean(axis=(0,1))
+            np.testing.assert_allclose(sat.mean(j_slice, i_slice), expected, rtol=rtol)
+        self.assertTrue(np.all(np.isnan(sat.mean(slice(4, 4), slice(0, 3)))))
+
+    def test_array(self):
+        self.check_rects(SummedAreaTable(self.data), rtol=1e-12)
+        sat32 = SummedAreaTable(self.data, dtype=np.float32)
+        self.assertEqual(sat32.table.dtype, np.float32)
+        self.check_rects(sat32, rtol=1e-4)
+        # several slabs
+        calls = []
+        sat = SmallSlabSummedAreaTable(self.data, callback=lambda: calls.append(1))
+        self.assertEqual(len(calls), 5)
+        self.check_rects(sat, rtol=1e-12)
+
+    def test_lazy_array(self):
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            with h5py.File(os.path.join(tmp_dir, 'sat_test.h5'), 'w') as f:
+                f['cube'] = self.data
+                lazy = h5_io.H5LazyArray(f['cube'])
+                lazy.slab_bytes = 2*11*5*8
+                self.check_rects(SummedAreaTable(lazy), rtol=1e-12)
+        finally:
+            shutil.rmtree(tmp_dir)
+
+
+if __name__ == '__main__':
+    unittest.main()